@@ -0,0 +1,108 @@
+"""Measure the control period of car_controller's fixed-rate actuator loop and check its watchdog.
+
+For each actuator rate, a publisher streams full throttle into the FakeBroker for a
+while and then goes silent, as if the controller link were lost. The report shows
+the achieved loop rate, the wake-up jitter and busy time of each tick, deadline
+misses, and how long after the last command the throttle reached zero.
+
+    python Benchmarks/bench_actuator_loop.py --rates 50,100,200,500 --drive 3
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Jetracer'))
+
+import fake_racecar
+fake_racecar.install()
+
+import car_controller
+from fake_broker import FakeBroker
+from kuksa_client.grpc import Datapoint
+
+def publish(broker, rate, duration, steering):
+    """Publish full throttle and the given steering every 1/rate seconds; return the time of the last send."""
+    period = 1.0 / rate
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        broker.set_current_values({
+            'Vehicle.OBD.RelativeThrottlePosition': Datapoint(1.0),
+            'Vehicle.Powertrain.Transmission.ClutchEngagement': Datapoint(0.0),
+            'Vehicle.Chassis.Brake.PedalPosition': Datapoint(0.0),
+            'Vehicle.Speed': Datapoint(steering),
+            'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': Datapoint(False),
+            'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': Datapoint(False),
+            'Vehicle.ADAS.CruiseControl.IsActive': Datapoint(False),
+            'Vehicle.ADAS.CruiseControl.IsEnabled': Datapoint(False),
+        })
+        time.sleep(period)
+    return time.monotonic()
+
+def run(rate, publish_rate, drive):
+    car_controller.ACTUATOR_RATE = rate
+    car = fake_racecar.RecordingRacecar()
+    car_controller.car = car
+    broker = FakeBroker()
+    stop_event = threading.Event()
+    result = {}
+
+    def control():
+        result['loop'] = car_controller.fixed_rate_loop(broker, stop_event)
+
+    controller = threading.Thread(target=control)
+    controller.start()
+    started = time.monotonic()
+    last_command = publish(broker, publish_rate, drive, 0.5)
+    # Silent link: wait for the watchdog and the ramp to zero
+    time.sleep(car_controller.WATCHDOG_TIMEOUT + 1.0 / car_controller.WATCHDOG_RAMP + 0.5)
+    stop_event.set()
+    broker.close()
+    controller.join()
+    loop = result['loop']
+    stats = loop.stats()
+
+    # Time for the throttle to reach full after the first command (slew limit), and to reach zero after the last
+    throttle_writes = car.throttleWrites
+    full_at = next((t for t, value in throttle_writes if value >= 1.0), None)
+    zero_at = next((t for t, value in throttle_writes if t > last_command and value == 0.0), None)
+    return {
+        'rate': rate,
+        'achieved': loop.ticks / (time.monotonic() - started),
+        'jitter_p50_ms': stats['jitter_p50_ms'],
+        'jitter_p99_ms': stats['jitter_p99_ms'],
+        'jitter_max_ms': stats['jitter_max_ms'],
+        'busy_p99_ms': stats['busy_p99_ms'],
+        'misses': stats['misses'],
+        'to_full_s': full_at - started if full_at else None,
+        'to_zero_s': zero_at - last_command if zero_at else None,
+        'watchdog_trips': stats['watchdog_trips'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rates', default='50,100,200,500', help='comma-separated actuator rates in Hz')
+    parser.add_argument('--publish-rate', type=float, default=50.0, help='command rate in Hz while driving')
+    parser.add_argument('--drive', type=float, default=3.0, help='seconds of commands before the link goes silent')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    print(f"Commands at {args.publish_rate:g} Hz for {args.drive:g} s, then none. THROTTLE_SLEW="
+          f"{car_controller.THROTTLE_SLEW:g}/s, WATCHDOG_TIMEOUT={car_controller.WATCHDOG_TIMEOUT:g} s, "
+          f"WATCHDOG_RAMP={car_controller.WATCHDOG_RAMP:g}/s")
+    print(f"{'rate':>6}{'achieved':>10}{'jitter p50':>12}{'p99 ms':>8}{'max ms':>8}{'busy p99':>10}"
+          f"{'misses':>8}{'to full s':>11}{'to zero s':>11}{'trips':>7}")
+    for rate in args.rates.split(','):
+        r = run(float(rate), args.publish_rate, args.drive)
+
+        def seconds(value):
+            return f"{value:11.2f}" if value is not None else f"{'-':>11}"
+
+        print(f"{r['rate']:>6g}{r['achieved']:>10.1f}{r['jitter_p50_ms']:>12.3f}{r['jitter_p99_ms']:>8.3f}"
+              f"{r['jitter_max_ms']:>8.3f}{r['busy_p99_ms']:>10.3f}{r['misses']:>8}"
+              f"{seconds(r['to_full_s'])}{seconds(r['to_zero_s'])}{r['watchdog_trips']:>7}")
+
+if __name__ == '__main__':
+    main()
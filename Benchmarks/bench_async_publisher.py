@@ -0,0 +1,103 @@
+"""Compare the blocking publish loop with the asyncio AsyncPublisher on a slow, spiky broker.
+
+A writer thread fills a FrameBuffer at --sample-rate with frames whose throttle slot
+holds their capture time; the broker records how old each frame is when it is stored.
+
+    python Benchmarks/bench_async_publisher.py --interval 0.02 --rtt 0.03 --spike 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'G29'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+
+from async_publisher import AsyncPublisher
+from control_frame import ControlFrame, FrameBuffer
+from fake_broker import AsyncFakeBroker, FakeBroker
+from signal_schema import PublishBuffer, SignalSchema
+
+# Only the throttle slot, which holds the capture time
+schema = SignalSchema({'Vehicle.OBD.RelativeThrottlePosition': 'float'})
+
+class AgeRecordingBroker(FakeBroker):
+    """FakeBroker that records how old each stored throttle value (a capture time) is."""
+
+    def __init__(self, rtt):
+        super().__init__(rtt)
+        self.ages = []
+
+    def store(self, updates):
+        self.ages.append(time.monotonic() - updates['Vehicle.OBD.RelativeThrottlePosition'].value)
+        super().store(updates)
+
+def sample(buffer, rate, stop_event):
+    period = 1.0 / rate
+    while not stop_event.is_set():
+        now = time.monotonic()
+        buffer.write((now, 0, 0, 0, 0, 0, 0, 0), now)
+        time.sleep(period)
+
+def thread_publisher(broker, buffer, interval, stop_event):
+    """The blocking loop the scripts use with PUBLISHER=thread."""
+    frame = ControlFrame()
+    publish_buffer = PublishBuffer(schema)
+    while not stop_event.is_set():
+        if buffer.read(frame):
+            broker.set_current_values(publish_buffer.request(frame.values))
+        time.sleep(interval)
+
+def async_publisher(broker, buffer, interval, stop_event, max_in_flight):
+    async def run():
+        publisher = AsyncPublisher(AsyncFakeBroker(broker), buffer, schema, interval, max_in_flight=max_in_flight)
+        task = asyncio.ensure_future(publisher.run())
+        while not stop_event.is_set():
+            await asyncio.sleep(0.05)
+        publisher.stop()
+        await task
+        return publisher.stats()
+    return asyncio.run(run())
+
+def run(mode, args):
+    rng = random.Random(1)
+    broker = AgeRecordingBroker(lambda: args.spike if rng.random() < args.spike_rate else args.rtt)
+    buffer = FrameBuffer()
+    stop_event = threading.Event()
+    sampler = threading.Thread(target=sample, args=(buffer, args.sample_rate, stop_event))
+    sampler.start()
+    timer = threading.Timer(args.duration, stop_event.set)
+    timer.start()
+    stats = None
+    if mode == 'thread':
+        thread_publisher(broker, buffer, args.interval, stop_event)
+    else:
+        stats = async_publisher(broker, buffer, args.interval, stop_event, int(mode.split('x')[1]))
+    sampler.join()
+    ages = sorted(age * 1000 for age in broker.ages)
+    return len(ages) / args.duration, ages, stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--interval', type=float, default=0.02, help='publish interval in seconds')
+    parser.add_argument('--sample-rate', type=float, default=200.0, help='frames written per second')
+    parser.add_argument('--rtt', type=float, default=0.03, help='normal broker round trip in seconds')
+    parser.add_argument('--spike', type=float, default=0.3, help='round trip of a slow RPC in seconds')
+    parser.add_argument('--spike-rate', type=float, default=0.05, help='fraction of RPCs that are slow')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per mode')
+    args = parser.parse_args()
+
+    print(f"Target {1 / args.interval:g}/s, RTT {args.rtt * 1000:g} ms with {args.spike_rate:.0%} spikes "
+          f"of {args.spike * 1000:g} ms, {args.duration:g} s per mode")
+    print(f"{'mode':<12}{'rate/s':>8}{'dropped':>9}{'age p50':>9}{'age p99':>9}{'age max':>9}")
+    for mode in ('thread', 'async x1', 'async x4'):
+        rate, ages, stats = run(mode.replace(' ', ''), args)
+        dropped = stats['dropped'] if stats else '-'
+        print(f"{mode:<12}{rate:>8.1f}{dropped:>9}{ages[len(ages) // 2]:>9.1f}"
+              f"{ages[int(len(ages) * 0.99)]:>9.1f}{ages[-1]:>9.1f}")
+
+if __name__ == '__main__':
+    main()
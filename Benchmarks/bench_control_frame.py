@@ -0,0 +1,104 @@
+"""Measure the cost of the ControlFrame handoff and check that frames never tear.
+
+A writer thread stores frames whose eight slots all hold the same number while a
+reader thread copies them out; a frame with mixed slots would be a torn read. The
+same is done for the SharedFrameRing of READER=process, with the writer in another
+process and a reader that takes every frame with read_next().
+
+    python Benchmarks/bench_control_frame.py --duration 3
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'G29'))
+
+from control_frame import ControlFrame, FrameBuffer, SharedFrameRing, SLOT_COUNT
+
+def time_per_call(function, count=200000):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count * 1e9
+
+def write_ring(name, duration):
+    """Write numbered frames into the SharedFrameRing `name` for `duration` seconds (in the writer process)."""
+    ring = SharedFrameRing(name)
+    n = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        n += 1
+        ring.write((float(n),) * SLOT_COUNT, float(n))
+    ring.close()
+
+def check_ring(duration):
+    ring = SharedFrameRing(size=64)
+    frame = ControlFrame()
+    sample = (0.1, 0.2, 0.3, 0.4, 1, 0, 0, 1)
+    print(f"ring write: {time_per_call(lambda: ring.write(sample, 0.0)):.0f} ns")
+    print(f"ring read (new frame): {time_per_call(lambda: (ring.write(sample, 0.0), ring.read(frame))):.0f} ns incl. write")
+    print(f"ring read (duplicate): {time_per_call(lambda: ring.read(frame)):.0f} ns")
+
+    # Start from an empty ring so the frame numbers match the sequence numbers
+    ring.close(unlink=True)
+    ring = SharedFrameRing(size=64)
+    frame = ControlFrame()
+    writer = multiprocessing.get_context('spawn').Process(target=write_ring, args=(ring.name, duration))
+    writer.start()
+    reads = torn = 0
+    while True:
+        is_writing = writer.is_alive()
+        while ring.read_next(frame):
+            reads += 1
+            if len(set(frame.values)) != 1 or frame.values[0] != frame.timestamp or frame.timestamp != frame.seq:
+                torn += 1
+        if not is_writing:
+            break
+    writer.join()
+    print(f"ring across processes: {frame.seq} frames written, {reads} read, {ring.lost} overwritten before they "
+          f"were read, {torn} torn")
+    ring.close(unlink=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds of concurrent writing and reading')
+    args = parser.parse_args()
+
+    buffer = FrameBuffer()
+    frame = ControlFrame()
+    sample = (0.1, 0.2, 0.3, 0.4, 1, 0, 0, 1)
+    print(f"write: {time_per_call(lambda: buffer.write(sample, 0.0)):.0f} ns")
+    print(f"read (new frame): {time_per_call(lambda: (buffer.write(sample, 0.0), buffer.read(frame))):.0f} ns incl. write")
+    print(f"read (duplicate): {time_per_call(lambda: buffer.read(frame)):.0f} ns")
+
+    stop_event = threading.Event()
+    written = [0]
+
+    def writer():
+        n = 0
+        while not stop_event.is_set():
+            n += 1
+            buffer.write((float(n),) * SLOT_COUNT, float(n))
+        written[0] = n
+
+    reads = duplicates = torn = 0
+    thread = threading.Thread(target=writer)
+    thread.start()
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        if buffer.read(frame):
+            reads += 1
+            if len(set(frame.values)) != 1 or frame.values[0] != frame.timestamp:
+                torn += 1
+        else:
+            duplicates += 1
+    stop_event.set()
+    thread.join()
+    print(f"concurrent: {written[0]} frames written, {reads} read, {duplicates} duplicates skipped, {torn} torn")
+    check_ring(args.duration)
+
+if __name__ == '__main__':
+    main()
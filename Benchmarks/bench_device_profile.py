@@ -0,0 +1,97 @@
+"""Measure the per-tick cost of reading and normalizing a joystick with device profiles.
+
+Compares the hand-written reads that g29_kuksa.py and ps4_kuksa.py used before
+device profiles with DeviceProfile.read (the compiled per-tick transform), the
+vectorized transform_many on a single row, and transform_many per row on a batch.
+It also checks that every variant produces the same values.
+
+    python Benchmarks/bench_device_profile.py --ticks 200000 --batch 1000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'G29'))
+
+import numpy as np
+from device_profile import AXIS_MAX, PROFILES, DeviceProfile
+from fake_joystick import ScriptedJoystick
+
+def legacy_g29(joystick):
+    """read_wheel_values() of g29_kuksa.py before device profiles."""
+    return (
+        abs((joystick.get_axis(2) - 0.999969482421875)*0.2),
+        abs(joystick.get_axis(1) - 0.999969482421875),
+        abs(joystick.get_axis(3) - 0.999969482421875),
+        joystick.get_axis(0) * 5,
+        1 if joystick.get_button(4) else 0,
+        1 if joystick.get_button(5) else 0,
+        1 if joystick.get_button(6) else 0,
+        1 if joystick.get_button(7) else 0,
+    )
+
+def pedal_normalize(val):
+    return round((val + 1) / 2, 3)
+
+def steering_normalize(val):
+    return round(val * 420, 3)
+
+def legacy_ps4(joystick):
+    """JoystickReader.read_values() of ps4_kuksa.py before device profiles."""
+    return (
+        pedal_normalize(joystick.get_axis(5)),
+        pedal_normalize(joystick.get_axis(2)),
+        pedal_normalize(joystick.get_axis(4)),
+        steering_normalize(joystick.get_axis(1) * -1),
+        1 if joystick.get_button(3) else 0,
+        1 if joystick.get_button(2) else 0,
+        1 if joystick.get_button(1) else 0,
+        1 if joystick.get_button(0) else 0,
+    )
+
+LEGACY = {'g29': legacy_g29, 'ps4': legacy_ps4}
+
+def time_per_call(function, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count * 1e6
+
+def raw_row(profile, joystick):
+    return [joystick.get_button(slot['button']) if 'button' in slot else joystick.get_axis(slot['axis'])
+            for slot in profile.slots]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ticks', type=int, default=200000, help='calls timed per variant')
+    parser.add_argument('--batch', type=int, default=1000, help='rows per transform_many call in the batch case')
+    args = parser.parse_args()
+
+    joystick = ScriptedJoystick()
+    joystick.postEvents = False
+    random.seed(1)
+    print(f"{'profile':<8}{'legacy µs':>11}{'compiled µs':>13}{'numpy 1 row µs':>16}{'numpy/row µs':>14}{'max diff':>10}")
+    for name, legacy in LEGACY.items():
+        profile = DeviceProfile(PROFILES[name]).bind(joystick)
+
+        # Same values from every variant on random readings
+        difference = 0.0
+        for _ in range(1000):
+            joystick.axes = [random.uniform(-1.0, AXIS_MAX) for _ in joystick.axes]
+            joystick.buttons = [random.randint(0, 1) for _ in joystick.buttons]
+            expected = np.array(legacy(joystick), dtype=np.float64)
+            difference = max(difference, np.abs(np.array(profile.read()) - expected).max(),
+                             np.abs(profile.transform_many([raw_row(profile, joystick)])[0] - expected).max())
+
+        batch = np.array([raw_row(profile, joystick)] * args.batch)
+        row = [raw_row(profile, joystick)]
+        legacy_us = time_per_call(lambda: legacy(joystick), args.ticks)
+        compiled_us = time_per_call(profile.read, args.ticks)
+        numpy_us = time_per_call(lambda: profile.transform_many(row), args.ticks // 10)
+        batch_us = time_per_call(lambda: profile.transform_many(batch), max(1, args.ticks // args.batch)) / args.batch
+        print(f"{name:<8}{legacy_us:>11.2f}{compiled_us:>13.2f}{numpy_us:>16.2f}{batch_us:>14.3f}{difference:>10.1e}")
+
+if __name__ == '__main__':
+    main()
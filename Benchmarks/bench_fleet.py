@@ -0,0 +1,91 @@
+"""Measure broker load against the number of vehicles in fleet mode.
+
+For every fleet size, scripted joysticks (one per vehicle) move continuously while
+G29/fleet_kuksa.FleetPublisher publishes them into the FakeBroker, and one
+subscriber per vehicle plays the car, listening to its own namespace only. Each
+size runs with one batched set_current_values per tick and with one call per
+vehicle per tick.
+
+    python Benchmarks/bench_fleet.py --vehicles 1,4,16,32,48 --rtt 0.002 --duration 3
+"""
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', folder) for folder in ('G29', 'Common')]
+
+import fake_joystick
+from fake_broker import FakeBroker
+from fleet import CONTROL_SIGNALS, Namespace
+from fleet_kuksa import FleetPublisher, Vehicle
+
+def run(count, batch, rate, duration, rtt):
+    broker = FakeBroker(rtt=rtt)
+    joysticks = [fake_joystick.ScriptedJoystick() for _ in range(count)]
+    vehicles = []
+    for index, joystick in enumerate(joysticks):
+        joystick.postEvents = False
+        vehicles.append(Vehicle(f"car{index + 1}", 'g29', joystick))
+    stop_event = threading.Event()
+
+    # One subscriber per car, each receiving only its own vehicle's signals
+    delivered = [0] * count
+
+    def car(index):
+        paths = Namespace(vehicles[index].vehicleId).paths(CONTROL_SIGNALS)
+        for updates in broker.subscribe_current_values(paths):
+            delivered[index] += len(updates)
+
+    cars = [threading.Thread(target=car, args=(index,), daemon=True) for index in range(count)]
+    for thread in cars:
+        thread.start()
+
+    def drive():
+        # Every wheel turns continuously, each at its own phase, and is sampled at twice the publish rate
+        step = 0
+        while not stop_event.is_set():
+            step += 1
+            for index, (joystick, vehicle) in enumerate(zip(joysticks, vehicles)):
+                joystick.axes[0] = math.sin(step * 0.05 + index)
+                vehicle.read()
+            time.sleep(0.5 / rate)
+
+    publisher = FleetPublisher(broker, vehicles, 1.0 / rate, 'change', batch)
+    threads = [threading.Thread(target=drive), threading.Thread(target=publisher.run, args=(stop_event,))]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    broker.close()
+    return {
+        'tick_rate': publisher.ticks / duration,
+        'rpcs': publisher.rpcs / duration,
+        'datapoints': publisher.datapoints / duration,
+        'delivered': sum(delivered) / duration,
+        'overruns': publisher.overruns,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vehicles', default='1,4,16,32,48', help='comma-separated fleet sizes')
+    parser.add_argument('--rate', type=float, default=50.0, help='publish rate in Hz')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per fleet size and mode')
+    parser.add_argument('--rtt', type=float, default=0.002, help='simulated broker round trip in seconds')
+    args = parser.parse_args()
+
+    print(f"Publishing at {args.rate:g} Hz, broker RTT {args.rtt * 1000:g} ms, {args.duration:g} s per run")
+    print(f"{'vehicles':>8}  {'mode':<12}{'ticks/s':>9}{'RPCs/s':>9}{'Datapoints/s':>14}{'delivered/s':>13}{'overruns':>10}")
+    for count in (int(n) for n in args.vehicles.split(',')):
+        for batch in (True, False):
+            r = run(count, batch, args.rate, args.duration, args.rtt)
+            print(f"{count:>8}  {'batched' if batch else 'per vehicle':<12}{r['tick_rate']:>9.1f}{r['rpcs']:>9.1f}"
+                  f"{r['datapoints']:>14.1f}{r['delivered']:>13.1f}{r['overruns']:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Compare the car's jitter buffer modes offline on a jittery command stream.
+
+A controller sends (throttle, steering) at --rate Hz, taken from a synthetic
+steering sweep or from a recorded session log (--log), over a link with a base
+delay and random extra delay: exponential jitter plus occasional spikes, delivered
+in order as over the broker's gRPC stream. The car runs its 100 Hz control period
+on simulated time and applies, per mode, the newest command (off) or the playout
+of Jetracer/jitter_buffer.JitterBuffer (buffer, predict). Nothing sleeps, so a
+minute of driving takes a fraction of a second.
+
+    python Benchmarks/bench_jitter_buffer.py --rate 50 --jitter 0.01 --spikes 0.02 --duration 60
+"""
+import argparse
+import bisect
+import math
+import os
+import random
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', folder) for folder in ('Jetracer', 'G29', 'Common')]
+
+from jitter_buffer import JitterBuffer
+
+def synthetic(duration):
+    """Return (times, commands) of a steering sweep with throttle changes, sampled at 1 kHz."""
+    times = [i / 1000 for i in range(int(duration * 1000))]
+    commands = [(0.5 + 0.3 * math.sin(t * 0.7), 0.8 * math.sin(t * 2.1) * math.cos(t * 0.37)) for t in times]
+    return times, commands
+
+def recorded(path):
+    """Return (times, commands) of the throttle and steering slots of a session log."""
+    from session_log import SessionLog
+    log = SessionLog(path)
+    names = [name for name, _ in log.signals]
+    throttle, steering = names.index('Vehicle.OBD.RelativeThrottlePosition'), names.index('Vehicle.Speed')
+    first = log[0][0]
+    times, commands = [], []
+    for timestamp, _, values in log:
+        times.append(timestamp - first)
+        commands.append((values[throttle], values[steering]))
+    log.close()
+    return times, commands
+
+def sample(times, commands, t):
+    """Linear interpolation of the command stream at time t."""
+    i = bisect.bisect_right(times, t)
+    if i == 0:
+        return commands[0]
+    if i == len(times):
+        return commands[-1]
+    fraction = (t - times[i - 1]) / (times[i] - times[i - 1])
+    return tuple(a + (b - a) * fraction for a, b in zip(commands[i - 1], commands[i]))
+
+def link(times, commands, rate, base, jitter, spikes, spike_delay, seed):
+    """Return the (sent, arrived, command) messages of the controller, delivered in order."""
+    rng = random.Random(seed)
+    messages = []
+    arrived = 0.0
+    t = 0.0
+    while t < times[-1]:
+        delay = base + rng.expovariate(1 / jitter) if jitter else base
+        if rng.random() < spikes:
+            delay += spike_delay
+        arrived = max(arrived, t + delay)  # Head-of-line blocking: a late message holds back the next ones
+        messages.append((t, arrived, sample(times, commands, t)))
+        t += 1.0 / rate
+    return messages
+
+def check_scaled_prediction():
+    """Check that predict mode continues a trend beyond +-1, as the steering of the controller profiles goes.
+
+    Steering 2.0, 2.1, ... 2.4 is sent every 10 ms without jitter; once the commands
+    stop, the playouts within the horizon must continue upward from 2.4.
+    """
+    buffer = JitterBuffer(predict=True, horizon=0.05)
+    for i in range(5):
+        buffer.push(i * 0.01, i * 0.01, (0.5, 2.0 + i * 0.1))
+    outputs = [buffer.playout(0.04 + i * 0.01)[1] for i in range(6)]
+    if buffer.predicted == 0 or any(b < a or b < 2.4 - 1e-9 for a, b in zip(outputs, outputs[1:])):
+        raise AssertionError(f"Prediction does not continue steering past 2.4: {outputs}")
+    return outputs
+
+def drive(mode, messages, times, commands, base, tick_rate, horizon, margin, max_depth):
+    buffer = JitterBuffer(mode == 'predict', horizon, margin, max_depth=max_depth) if mode != 'off' else None
+    end = messages[-1][1]
+    next_message = 0
+    newest = None
+    outputs = []
+    squared_error = 0.0
+    for tick in range(int(end * tick_rate)):
+        now = tick / tick_rate
+        while next_message < len(messages) and messages[next_message][1] <= now:
+            sent, arrived, command = messages[next_message]
+            newest = command
+            if buffer:
+                buffer.push(sent, arrived, command)
+            next_message += 1
+        if newest is None:
+            continue
+        output = buffer.playout(now) if buffer else newest
+        outputs.append(output[1])
+        # Compare with the steering the controller had one base delay ago: no car can do better
+        squared_error += (output[1] - sample(times, commands, now - base)[1]) ** 2
+
+    # Roughness: RMS second difference of the steering output per control period
+    second = [outputs[i + 1] - 2 * outputs[i] + outputs[i - 1] for i in range(1, len(outputs) - 1)]
+    result = {
+        'tracking_rms': (squared_error / len(outputs)) ** 0.5,
+        'roughness': (sum(d * d for d in second) / len(second)) ** 0.5,
+    }
+    if buffer:
+        stats = buffer.stats()
+        result.update(stats, smoothing_rms=stats['error_rms'][1])
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--log', default='', help='session log to take the commands from instead of the synthetic sweep')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of synthetic commands')
+    parser.add_argument('--rate', type=float, default=50.0, help='commands sent per second')
+    parser.add_argument('--base', type=float, default=0.02, help='base one-way delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='mean exponential extra delay in seconds')
+    parser.add_argument('--spikes', type=float, default=0.02, help='fraction of messages delayed by a spike')
+    parser.add_argument('--spike-delay', type=float, default=0.1, help='extra delay of a spike in seconds')
+    parser.add_argument('--tick-rate', type=float, default=100.0, help='control periods per second of the car')
+    parser.add_argument('--horizon', type=float, default=0.05, help='extrapolation horizon of predict mode in seconds')
+    parser.add_argument('--margin', type=float, default=4.0, help='jitter deviations of headroom in the depth')
+    parser.add_argument('--max-depth', type=float, default=0.2, help='largest buffer depth in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    outputs = check_scaled_prediction()
+    print("Predicted steering past 2.4: " + ", ".join(f"{value:.2f}" for value in outputs))
+
+    times, commands = recorded(args.log) if args.log else synthetic(args.duration)
+    messages = link(times, commands, args.rate, args.base, args.jitter, args.spikes, args.spike_delay, args.seed)
+    print(f"{len(messages)} commands at {args.rate:g} Hz over {times[-1]:.1f} s, base delay {args.base * 1000:g} ms, "
+          f"jitter {args.jitter * 1000:g} ms, {args.spikes:.0%} spikes of {args.spike_delay * 1000:g} ms")
+    print(f"{'mode':<9}{'tracking':>10}{'roughness':>11}{'depth ms':>10}{'added p50':>11}{'p99 ms':>8}"
+          f"{'late':>6}{'predicted':>11}{'smoothing RMS':>15}")
+    for mode in ('off', 'buffer', 'predict'):
+        r = drive(mode, messages, times, commands, args.base, args.tick_rate, args.horizon, args.margin, args.max_depth)
+        line = f"{mode:<9}{r['tracking_rms']:>10.4f}{r['roughness']:>11.5f}"
+        if mode != 'off':
+            line += (f"{r['depth_ms']:>10.1f}{r['added_p50_ms']:>11.1f}{r['added_p99_ms']:>8.1f}{r['late']:>6}"
+                     f"{r['predicted']:>11}{r['smoothing_rms']:>15.4f}")
+        print(line)
+
+if __name__ == '__main__':
+    main()
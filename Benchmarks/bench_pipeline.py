@@ -0,0 +1,175 @@
+"""Benchmark the controller-to-car pipeline end to end, without hardware or a remote broker.
+
+A scripted joystick sweeps the steering axis; the real sampler and publisher from
+G29/ (g29_kuksa.py or ps4_kuksa.py) send it to an in-process FakeBroker, and the
+real car_controller.subscription_loop applies it to a recording NvidiaRacecar.
+Each rate runs in a fresh subprocess so CPU time and memory are not shared.
+
+    python Benchmarks/bench_pipeline.py --pipeline g29 --rates 10,100,1000 --duration 5
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', folder) for folder in ('G29', 'Jetracer', 'Common')]
+
+# Steering axis and the value car.steering ends up with, per pipeline
+PIPELINES = {
+    'g29': (0, lambda axis: axis * 5),
+    'ps4': (1, lambda axis: round(axis * -1 * 420, 3)),
+}
+
+def run_pipeline(pipeline, rate, duration, rtt, publisher, publish_mode, sampler_mode):
+    """Run one benchmark in this process and return its measurements."""
+    os.environ.update({
+        'SAMPLE_RATE': str(rate),
+        'SAMPLER_MODE': sampler_mode,
+        'PUBLISH_INTERVAL': str(1.0 / rate),
+        'PUBLISH_MODE': publish_mode,
+        'PUBLISHER': publisher,
+        'RATE_CONTROL': 'fixed',
+    })
+    import fake_joystick
+    import fake_racecar
+    from fake_broker import AsyncFakeBroker, FakeBroker
+    from kuksa_client.grpc import Datapoint
+
+    joystick = fake_joystick.ScriptedJoystick()
+    joystick.postEvents = sampler_mode == 'event'
+    fake_joystick.install(joystick)
+    fake_racecar.install()
+    broker = FakeBroker(rtt=rtt)
+
+    import async_publisher
+    import car_controller
+    logging.getLogger().setLevel(logging.WARNING)
+    car = fake_racecar.RecordingRacecar()
+    car_controller.car = car
+    async_publisher.open_async_transport = lambda *args: AsyncFakeBroker(broker)
+
+    axis, to_steering = PIPELINES[pipeline]
+    stop_event = threading.Event()
+    sweep = fake_joystick.SteeringSweep(joystick, axis, rate)
+    steering_to_axis = {to_steering(sweep.value(step)): sweep.value(step) for step in range(sweep.STEPS)}
+    threads = []
+
+    # Keep what the scripts print out of the results
+    sys.stdout = open(os.devnull, 'w')
+    if pipeline == 'g29':
+        import g29_kuksa
+        from input_sampler import InputSampler
+        g29_kuksa.connect = lambda *args, **kwargs: broker
+        g29_kuksa.init_wheel()
+        sampler = InputSampler(g29_kuksa.read_wheel_values, sampler_mode, rate)
+        threads.append(threading.Thread(target=sampler.run, daemon=True))
+        threads.append(threading.Thread(target=g29_kuksa.thread_ConnectToKuksa, daemon=True))
+    else:
+        import ps4_kuksa
+        ps4_kuksa.connect = lambda *args, **kwargs: broker
+        # ps4_kuksa publishes the brake on another signal; give the car the one it waits for
+        broker.set_current_values({'Vehicle.Chassis.Brake.PedalPosition': Datapoint(0.0)})
+        reader = ps4_kuksa.JoystickReader()
+        reader.daemon = True
+        sampler = reader.sampler
+        publisher_thread = ps4_kuksa.ConnectToKuksa(reader)
+        publisher_thread.daemon = True
+        threads += [reader, publisher_thread]
+    threads.append(threading.Thread(target=car_controller.subscription_loop, args=(broker, stop_event),
+                                    daemon=True))
+    for thread in threads:
+        thread.start()
+
+    time.sleep(0.5)  # Let every thread connect before measuring
+    cpu_start, wall_start, rss_start = time.process_time(), time.monotonic(), max_rss_mb()
+    sets_start, writes_start, samples_start = broker.calls['set'], len(car.steeringWrites), sampler.samples
+    sweep_thread = threading.Thread(target=sweep.run, args=(stop_event,))
+    sweep_thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    sweep_thread.join()
+    cpu, wall = time.process_time() - cpu_start, time.monotonic() - wall_start
+
+    latencies = []
+    seen = set()
+    for applied_at, steering in car.steeringWrites[writes_start:]:
+        axis_value = steering_to_axis.get(steering)
+        if axis_value is None or (steering, sweep.setAt.get(axis_value)) in seen:
+            continue
+        set_at = sweep.setAt[axis_value]
+        # Skip writes that are older than the latest time the value was set (the sweep wrapped around)
+        if applied_at >= set_at:
+            seen.add((steering, set_at))
+            latencies.append((applied_at - set_at) * 1000)
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else None
+
+    return {
+        'pipeline': pipeline,
+        'rate': rate,
+        'inputs': sweep.steps,
+        'sample_rate': (sampler.samples - samples_start) / wall,
+        'publish_rate': (broker.calls['set'] - sets_start) / wall,
+        'applied': len(latencies),
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+        'max_ms': latencies[-1] if latencies else None,
+        'cpu_percent': 100.0 * cpu / wall,
+        'rss_mb': max_rss_mb(),
+        'rss_growth_mb': max_rss_mb() - rss_start,
+    }
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pipeline', choices=sorted(PIPELINES), default='g29')
+    parser.add_argument('--rates', default='10,100,1000', help='comma-separated input/sample/publish rates in Hz')
+    parser.add_argument('--duration', type=float, default=5.0, help='measured seconds per rate')
+    parser.add_argument('--rtt', type=float, default=0.0, help='simulated broker round trip in seconds')
+    parser.add_argument('--publisher', choices=('thread', 'async'), default='thread')
+    parser.add_argument('--publish-mode', choices=('change', 'all'), default='change')
+    parser.add_argument('--sampler-mode', choices=('fixed', 'event'), default='fixed')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_pipeline(args.pipeline, float(args.rates), args.duration, args.rtt,
+                              args.publisher, args.publish_mode, args.sampler_mode)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        sys.__stdout__.flush()
+        os._exit(0)  # Do not wait for the publisher and controller threads
+
+    print(f"{args.pipeline} pipeline, {args.publisher} publisher, PUBLISH_MODE={args.publish_mode}, "
+          f"SAMPLER_MODE={args.sampler_mode}, broker RTT {args.rtt * 1000:g} ms, {args.duration:g} s per rate")
+    print(f"{'rate':>6}{'inputs':>8}{'sampled/s':>11}{'published/s':>13}{'applied':>9}"
+          f"{'p50 ms':>8}{'p99 ms':>8}{'max ms':>8}{'CPU %':>7}{'RSS MB':>8}")
+    for rate in args.rates.split(','):
+        command = [sys.executable, os.path.abspath(__file__), '--child', '--rates', rate] + [
+            f'--{name}={value}' for name, value in (
+                ('pipeline', args.pipeline), ('duration', args.duration), ('rtt', args.rtt),
+                ('publisher', args.publisher), ('publish-mode', args.publish_mode),
+                ('sampler-mode', args.sampler_mode))]
+        output = subprocess.run(command, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{rate:>6} failed:\n{output.stderr}")
+            continue
+        r = json.loads(output.stdout.strip().splitlines()[-1])
+
+        def ms(value):
+            return f"{value:8.2f}" if value is not None else f"{'-':>8}"
+
+        print(f"{r['rate']:>6g}{r['inputs']:>8}{r['sample_rate']:>11.1f}{r['publish_rate']:>13.1f}{r['applied']:>9}"
+              f"{ms(r['p50_ms'])}{ms(r['p99_ms'])}{ms(r['max_ms'])}{r['cpu_percent']:>7.1f}{r['rss_mb']:>8.1f}")
+
+if __name__ == '__main__':
+    main()
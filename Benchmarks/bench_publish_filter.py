@@ -0,0 +1,66 @@
+"""Count the Datapoints a publisher sends per mode on a synthetic driving session.
+
+The session is mostly idle (the wheel rests with a little sensor noise) with a
+steering sweep and a throttle press every few seconds, sampled at the publish rate.
+
+    python Benchmarks/bench_publish_filter.py --rate 10 --duration 600
+"""
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'G29'))
+
+from publish_filter import ChangeFilter
+
+DEADBANDS = {
+    'Vehicle.OBD.RelativeThrottlePosition': 0.002,
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 0.005,
+    'Vehicle.Chassis.Brake.PedalPosition': 0.005,
+    'Vehicle.Speed': 0.01,
+}
+
+def session(rate, duration, seed=1):
+    """Yield (time, values) for a wheel that is moved for 2 s out of every 20 s."""
+    rng = random.Random(seed)
+    for tick in range(int(rate * duration)):
+        now = tick / rate
+        moving = now % 20 < 2
+        phase = (now % 20) / 2 * math.pi
+        yield now, {
+            'Vehicle.OBD.RelativeThrottlePosition': (0.3 * math.sin(phase) if moving else 0.0) + rng.gauss(0, 0.0003),
+            'Vehicle.Powertrain.Transmission.ClutchEngagement': 0.0,
+            'Vehicle.Chassis.Brake.PedalPosition': rng.gauss(0, 0.001),
+            'Vehicle.Speed': (2.5 * math.sin(2 * phase) if moving else 0.0) + rng.gauss(0, 0.002),
+            'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': False,
+            'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': False,
+            'Vehicle.ADAS.CruiseControl.IsActive': moving and now % 20 < 0.2,
+            'Vehicle.ADAS.CruiseControl.IsEnabled': False,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=10.0, help='publish ticks per second')
+    parser.add_argument('--duration', type=float, default=600.0, help='session length in seconds')
+    parser.add_argument('--heartbeat', type=float, default=1.0, help='full-state heartbeat interval in seconds')
+    args = parser.parse_args()
+
+    sent_all = calls_all = 0
+    change_filter = ChangeFilter(DEADBANDS, args.heartbeat)
+    calls_change = 0
+    for now, values in session(args.rate, args.duration):
+        sent_all += len(values)
+        calls_all += 1
+        if change_filter.changes(values, now):
+            calls_change += 1
+
+    print(f"{args.duration:g} s session at {args.rate:g} Hz, heartbeat {args.heartbeat:g} s")
+    print(f"{'mode':<8}{'RPCs':>8}{'Datapoints':>12}")
+    print(f"{'all':<8}{calls_all:>8}{sent_all:>12}")
+    print(f"{'change':<8}{calls_change:>8}{change_filter.published:>12}")
+    print(f"Datapoints reduced {sent_all / max(change_filter.published, 1):.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Benchmark the adaptive publish rate against a broker whose link degrades and recovers.
+
+The real thread publisher of g29_kuksa.py publishes a steadily moving wheel
+(PUBLISH_MODE=all) into a FakeBroker whose round trip and error rate follow
+--phases, a comma-separated list of name:seconds:rtt_ms:error_percent. The RTT
+varies by up to 20% per call. Each strategy runs in a fresh subprocess:
+
+- adaptive: RATE_CONTROL=adaptive between --min-rate (default: 2 Hz, as in the
+  script) and --max-rate, starting at 2 Hz
+- fixed-0.5s: the fixed PUBLISH_INTERVAL the G29 script used to have
+- fixed-max: a fixed rate of --max-rate
+
+For every phase it reports:
+
+- the publish attempts per second the broker had to answer, and how many failed
+- the successful publishes per second
+- how old the broker's newest value was on average (sampled every 5 ms)
+- for the adaptive strategy, the controller's rate and smoothed RTT at the end of
+  the phase, and a trace of its rate every half second
+
+    python Benchmarks/bench_rate_control.py --phases healthy:8:2:0,congested:6:40:10,recovered:8:2:0
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', folder) for folder in ('G29', 'Common')]
+
+STRATEGIES = ('adaptive', 'fixed-0.5s', 'fixed-max')
+
+def parse_phases(phases):
+    """Return [(name, seconds, rtt seconds, error rate)] from name:seconds:rtt_ms:error_percent,..."""
+    parsed = []
+    for phase in phases.split(','):
+        name, seconds, rtt_ms, error_percent = phase.split(':')
+        parsed.append((name, float(seconds), float(rtt_ms) / 1000, float(error_percent) / 100))
+    return parsed
+
+def run_strategy(strategy, phases, min_rate, max_rate):
+    """Run the publisher through every phase in this process and return one result per phase."""
+    interval = {'adaptive': 0.5, 'fixed-0.5s': 0.5, 'fixed-max': 1.0 / max_rate}[strategy]
+    os.environ.update({
+        'SAMPLE_RATE': str(max_rate),
+        'PUBLISH_MODE': 'all',
+        'PUBLISHER': 'thread',
+        'PUBLISH_INTERVAL': str(interval),
+        'RATE_CONTROL': 'adaptive' if strategy == 'adaptive' else 'fixed',
+        'MIN_PUBLISH_RATE': str(min_rate),
+        'MAX_PUBLISH_RATE': str(max_rate),
+    })
+    import fake_joystick
+    from fake_broker import FakeBroker
+
+    joystick = fake_joystick.ScriptedJoystick()
+    joystick.postEvents = False
+    fake_joystick.install(joystick)
+    phase = {'rtt': phases[0][2], 'error_rate': phases[0][3]}
+    broker = FakeBroker(rtt=lambda: phase['rtt'] * random.uniform(0.8, 1.2), error_rate=lambda: phase['error_rate'])
+    stored = {'at': None}
+    store = broker.store
+
+    def store_and_stamp(updates):
+        store(updates)
+        stored['at'] = time.monotonic()
+    broker.store = store_and_stamp
+
+    sys.stdout = open(os.devnull, 'w')  # Keep what the script prints out of the results
+    import g29_kuksa
+    from input_sampler import InputSampler
+    logging.getLogger().setLevel(logging.ERROR)  # Injected failures are logged as warnings
+    g29_kuksa.connect = lambda *args, **kwargs: broker
+    g29_kuksa.init_wheel()
+    stop_event = threading.Event()
+    sweep = fake_joystick.SteeringSweep(joystick, 0, max_rate)
+    sampler = InputSampler(g29_kuksa.read_wheel_values, 'fixed', max_rate)
+    for target in (sampler.run, g29_kuksa.thread_ConnectToKuksa):
+        threading.Thread(target=target, daemon=True).start()
+    threading.Thread(target=sweep.run, args=(stop_event,), daemon=True).start()
+    time.sleep(0.5)
+
+    rate_control = g29_kuksa.publish_rate
+    results = []
+    for name, seconds, rtt, error_rate in phases:
+        phase.update(rtt=rtt, error_rate=error_rate)
+        start = time.monotonic()
+        sets, errors = broker.calls['set'], broker.errors
+        ages = []
+        trace = []
+        next_trace = start
+        while True:
+            now = time.monotonic()
+            if now - start >= seconds:
+                break
+            if stored['at'] is not None:
+                ages.append(now - stored['at'])
+            if now >= next_trace:
+                trace.append(round(rate_control.rate, 1))
+                next_trace += 0.5
+            time.sleep(0.005)
+        elapsed = time.monotonic() - start
+        sent, failed = broker.calls['set'] - sets, broker.errors - errors
+        stats = rate_control.stats()
+        results.append({
+            'phase': name,
+            'attempts': (sent + failed) / elapsed,
+            'failed': failed,
+            'published': sent / elapsed,
+            'age_ms': 1000 * sum(ages) / len(ages) if ages else None,
+            'rate': stats['rate'],
+            'rtt_ms': stats['rtt'],
+            'trace': trace,
+        })
+    stop_event.set()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--phases', default='healthy:8:2:0,congested:6:40:10,recovered:8:2:0',
+                        help='comma-separated name:seconds:rtt_ms:error_percent')
+    parser.add_argument('--min-rate', type=float, default=2.0, help='floor of the adaptive publish rate')
+    parser.add_argument('--max-rate', type=float, default=100.0, help='sample rate and ceiling of the publish rate')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES))
+    parser.add_argument('--child', choices=STRATEGIES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    phases = parse_phases(args.phases)
+
+    if args.child:
+        results = run_strategy(args.child, phases, args.min_rate, args.max_rate)
+        sys.__stdout__.write(json.dumps(results) + "\n")
+        sys.__stdout__.flush()
+        os._exit(0)  # Do not wait for the sampler and publisher threads
+
+    print("Phases: " + ", ".join(f"{name} {seconds:g} s at {rtt * 1000:g} ms RTT, {error_rate * 100:g}% errors"
+                                  for name, seconds, rtt, error_rate in phases))
+    print(f"{'strategy':<12}{'phase':<12}{'attempts/s':>11}{'failed':>8}{'published/s':>13}{'age ms':>9}"
+          f"{'rate Hz':>9}{'RTT ms':>8}")
+    traces = []
+    for strategy in args.strategies.split(','):
+        command = [sys.executable, os.path.abspath(__file__), '--child', strategy, f'--phases={args.phases}',
+                   f'--min-rate={args.min_rate}', f'--max-rate={args.max_rate}']
+        output = subprocess.run(command, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{strategy:<12}failed:\n{output.stderr}")
+            continue
+        for r in json.loads(output.stdout.strip().splitlines()[-1]):
+            age = f"{r['age_ms']:9.1f}" if r['age_ms'] is not None else f"{'-':>9}"
+            print(f"{strategy:<12}{r['phase']:<12}{r['attempts']:>11.1f}{r['failed']:>8}{r['published']:>13.1f}{age}"
+                  f"{r['rate']:>9.1f}{r['rtt_ms']:>8.1f}")
+            if strategy == 'adaptive':
+                traces.append((r['phase'], r['trace']))
+    for name, trace in traces:
+        print(f"adaptive rate every 0.5 s, {name}: {' '.join(f'{rate:g}' for rate in trace)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Compare the sample spacing of ps4_kuksa.py with the sampler in a thread and in a process of its own.
+
+JoystickReader samples a scripted controller at --rate while ConnectToKuksa
+publishes every frame (PUBLISH_MODE=all) into a FakeBroker that serializes the
+requests like the real client. --busy adds threads to the publishing process that
+run pure-Python work, such as logging or telemetry would. Each combination runs in
+a fresh subprocess, with READER=thread or READER=process (the sampler in a spawned
+process that hands frames over a SharedFrameRing).
+
+From the capture time of every frame it reports the achieved sample rate, how far
+the intervals between samples strayed from the period (p50/p99/max of the absolute
+deviation and the standard deviation of the intervals), the sampler overruns and
+the publish rate.
+
+    python Benchmarks/bench_sampler_jitter.py --rate 200 --duration 5 --busy 0,1
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from array import array
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE] + [os.path.join(HERE, '..', folder) for folder in ('G29', 'Common')]
+
+def install_joystick():
+    """Make pygame report a scripted controller; runs in the sampler process in process mode."""
+    import fake_joystick
+    joystick = fake_joystick.ScriptedJoystick('Scripted PS4')
+    joystick.postEvents = False
+    fake_joystick.install(joystick)
+
+def busy_work(stop_event):
+    """Pure-Python work that holds the GIL, like formatting telemetry."""
+    record = {'seq': 0, 'values': [0.1, 0.2, 0.3, 0.4, 1, 0, 0, 1], 'rtt': 1.5}
+    while not stop_event.is_set():
+        for _ in range(200):
+            record['seq'] += 1
+            json.dumps(record)
+        time.sleep(0.001)
+
+def run_mode(reader_mode, rate, publish_rate, duration, busy, rtt, nice):
+    """Run the sampler and publisher in this process (and the sampler process) and return the measurements."""
+    os.environ.update({
+        'SAMPLE_RATE': str(rate),
+        'SAMPLER_MODE': 'fixed',
+        'PUBLISH_MODE': 'all',
+        'PUBLISHER': 'thread',
+        'PUBLISH_INTERVAL': str(1.0 / publish_rate),
+        'RATE_CONTROL': 'fixed',
+        'READER': reader_mode,
+        'SAMPLER_NICE': str(nice),
+    })
+    from fake_broker import FakeBroker
+    from control_frame import ControlFrame, FrameBuffer
+
+    broker = FakeBroker(rtt=rtt, serialize=True)
+    sys.stdout = open(os.devnull, 'w')  # Keep what the script prints out of the results
+    import ps4_kuksa
+    logging.getLogger().setLevel(logging.WARNING)
+    ps4_kuksa.connect = lambda *args, **kwargs: broker
+
+    timestamps = array('d')
+    if reader_mode == 'process':
+        reader = ps4_kuksa.JoystickProcess(install_joystick)
+        frame = ControlFrame()
+
+        def collect():
+            # Every frame, from the ring's history
+            while not stop_event.is_set():
+                while reader.buffer.read_next(frame):
+                    timestamps.append(frame.timestamp)
+                time.sleep(0.005)
+    else:
+        install_joystick()
+
+        class RecordingBuffer(FrameBuffer):
+            def write(self, values, timestamp):
+                super().write(values, timestamp)
+                timestamps.append(timestamp)
+        reader = ps4_kuksa.JoystickReader(RecordingBuffer())
+        reader.daemon = True
+        collect = None
+
+    publisher = ps4_kuksa.ConnectToKuksa(reader)
+    publisher.daemon = True
+    stop_event = threading.Event()
+    reader.start()
+    publisher.start()
+    for _ in range(busy):
+        threading.Thread(target=busy_work, args=(stop_event,), daemon=True).start()
+    collector = None
+    if collect is not None:
+        collector = threading.Thread(target=collect, daemon=True)
+        collector.start()
+
+    # Wait for the sampler process to start up, then measure
+    while reader.sampler.samples == 0:
+        time.sleep(0.05)
+    time.sleep(0.5)
+    first = len(timestamps)
+    sets_start, overruns_start = broker.calls['set'], reader.sampler.stats()['overruns']
+    start = time.monotonic()
+    time.sleep(duration)
+    elapsed = time.monotonic() - start
+    sets, overruns = broker.calls['set'] - sets_start, reader.sampler.stats()['overruns'] - overruns_start
+    stop_event.set()
+    samples = timestamps[first:]
+    reader.stop()
+    publisher.stop()
+    if reader_mode == 'process':
+        # The publisher and the collector read the ring, so they stop before it is closed
+        publisher.join()
+        collector.join()
+        reader.join()
+        reader.close()
+
+    period = 1.0 / rate
+    intervals = [b - a for a, b in zip(samples, samples[1:])]
+    deviations = sorted(abs(interval - period) * 1000 for interval in intervals)
+    mean = sum(intervals) / len(intervals)
+
+    def percentile(fraction):
+        return deviations[min(len(deviations) - 1, int(fraction * len(deviations)))]
+
+    return {
+        'mode': reader_mode,
+        'busy': busy,
+        'sample_rate': len(samples) / elapsed,
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+        'max_ms': deviations[-1],
+        'std_ms': 1000 * math.sqrt(sum((interval - mean) ** 2 for interval in intervals) / len(intervals)),
+        'overruns': overruns,
+        'publish_rate': sets / elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=200.0, help='sample rate in Hz')
+    parser.add_argument('--publish-rate', type=float, default=100.0, help='publish rate in Hz')
+    parser.add_argument('--duration', type=float, default=5.0, help='measured seconds per run')
+    parser.add_argument('--busy', default='0,1', help='comma-separated numbers of busy threads next to the publisher')
+    parser.add_argument('--rtt', type=float, default=0.0, help='simulated broker round trip in seconds')
+    parser.add_argument('--nice', type=int, default=-10, help='SAMPLER_NICE of the sampler process')
+    parser.add_argument('--modes', default='thread,process')
+    parser.add_argument('--child', choices=('thread', 'process'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_mode(args.child, args.rate, args.publish_rate, args.duration, int(args.busy), args.rtt, args.nice)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        sys.__stdout__.flush()
+        os._exit(0)  # Do not wait for the publisher threads
+
+    print(f"Sampling at {args.rate:g} Hz, publishing at {args.publish_rate:g} Hz, broker RTT {args.rtt * 1000:g} ms, "
+          f"{os.cpu_count()} CPUs; deviation of the sample intervals from {1000 / args.rate:g} ms")
+    print(f"{'mode':<9}{'busy':>5}{'sampled/s':>11}{'p50 ms':>8}{'p99 ms':>8}{'max ms':>8}{'std ms':>8}"
+          f"{'overruns':>10}{'published/s':>13}")
+    for busy in args.busy.split(','):
+        for mode in args.modes.split(','):
+            command = [sys.executable, os.path.abspath(__file__), '--child', mode, f'--busy={busy}'] + [
+                f'--{name}={value}' for name, value in (
+                    ('rate', args.rate), ('publish-rate', args.publish_rate), ('duration', args.duration),
+                    ('rtt', args.rtt), ('nice', args.nice))]
+            output = subprocess.run(command, capture_output=True, text=True)
+            if output.returncode != 0:
+                print(f"{mode:<9}{busy:>5} failed:\n{output.stderr}")
+                continue
+            r = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{r['mode']:<9}{r['busy']:>5}{r['sample_rate']:>11.1f}{r['p50_ms']:>8.3f}{r['p99_ms']:>8.3f}"
+                  f"{r['max_ms']:>8.3f}{r['std_ms']:>8.3f}{r['overruns']:>10}{r['publish_rate']:>13.1f}")
+
+if __name__ == '__main__':
+    main()
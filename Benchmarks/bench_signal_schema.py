@@ -0,0 +1,224 @@
+"""Measure the per-tick cost and allocations of the publish and apply hot paths, with and without the signal schema.
+
+Publishing: the thread publisher of g29_kuksa.py turns the newest ControlFrame into
+a set_current_values request, as it did before (frame_to_signals, ChangeFilter and
+eight new Datapoints in a new dict) and with Common/signal_schema.py (SlotChangeFilter
+and a PublishBuffer). Applying: car_controller.py merges a broker update and turns it
+into a (throttle, steering) command, as it did before (namespace renaming, a dict
+of Datapoints and path lookups) and by decoding into a slot array.
+
+Every variant runs at --rate ticks per second; the cost of each tick is timed
+with perf_counter, and in a second pass tracemalloc records the memory allocated
+within each tick (peak above the level before the tick).
+
+    python Benchmarks/bench_signal_schema.py --rate 1000 --duration 3
+"""
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', folder) for folder in ('G29', 'Jetracer', 'Common')]
+
+import fake_racecar
+fake_racecar.install()
+
+import car_controller
+from control_frame import ControlFrame, THROTTLE, CLUTCH, BRAKE, STEERING, HANDBRAKE, REVERSE, ENTER, EXIT
+from fleet import CONTROL_SIGNALS, Namespace
+from kuksa_client.grpc import Datapoint
+from publish_filter import ChangeFilter, SlotChangeFilter
+from signal_schema import PublishBuffer, SignalSchema
+
+DEADBANDS = {
+    'Vehicle.OBD.RelativeThrottlePosition': 0.002,
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 0.005,
+    'Vehicle.Chassis.Brake.PedalPosition': 0.005,
+    'Vehicle.Speed': 0.01,
+}
+
+def legacy_frame_to_signals(frame):
+    """frame_to_signals() of g29_kuksa.py before the signal schema."""
+    values = frame.values
+    return {
+        'Vehicle.OBD.RelativeThrottlePosition': values[THROTTLE],
+        'Vehicle.Powertrain.Transmission.ClutchEngagement': values[CLUTCH],
+        'Vehicle.Chassis.Brake.PedalPosition': values[BRAKE],
+        'Vehicle.Speed': values[STEERING],
+        'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': bool(values[HANDBRAKE]),
+        'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': bool(values[REVERSE]),
+        'Vehicle.ADAS.CruiseControl.IsActive': bool(values[ENTER]),
+        'Vehicle.ADAS.CruiseControl.IsEnabled': bool(values[EXIT]),
+    }
+
+class LegacyLatestValues:
+    """car_controller.LatestValues before the signal schema: a dict of Datapoints."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._values = {}
+        self._pending = set()
+        self._snapshot = None
+        self.receivedAt = None
+        self.received = 0
+        self.merged = 0
+
+    def update(self, updates):
+        with self._lock:
+            for path, datapoint in updates.items():
+                if datapoint is None:
+                    continue
+                self.received += 1
+                if path in self._pending:
+                    self.merged += 1
+                self._values[path] = datapoint
+                self._pending.add(path)
+            self._snapshot = None
+            self.receivedAt = time.monotonic()
+        self._changed.set()
+
+    def current(self):
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = dict(self._values)
+                self._pending.clear()
+            return self._snapshot, self.receivedAt
+
+def legacy_command_from_updates(updates):
+    """car_controller.command_from_updates() before the signal schema."""
+    throttle = car_controller.clamp(updates['Vehicle.OBD.RelativeThrottlePosition'].value, -1.0, 1.0)
+    brake = updates['Vehicle.Chassis.Brake.PedalPosition'].value
+    steering = updates['Vehicle.Speed'].value
+    handbrake = updates['Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear'].value
+    reverse = updates['Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear'].value
+    if throttle == -1.0 and steering == 0.0 and reverse == 0:
+        return 0.0, 0.0
+    if reverse == 1:
+        throttle = -throttle
+    if brake > 0:
+        throttle = max(0, throttle - brake)
+    if handbrake == 1:
+        throttle = 0
+    return throttle, steering
+
+def frames(count):
+    """Frames of a moving wheel: steering and throttle change every tick, a button flips now and then."""
+    result = []
+    for i in range(count):
+        frame = ControlFrame()
+        frame.seq = i + 1
+        frame.values[THROTTLE] = 0.5 + 0.4 * math.sin(i * 0.01)
+        frame.values[STEERING] = math.sin(i * 0.003)
+        frame.values[HANDBRAKE] = float(i // 500 % 2)
+        result.append(frame)
+    return result
+
+def publish_variants(mode):
+    """Return {name: tick(frame, now)} of the old and the schema publisher in `mode` ('change' or 'all')."""
+    change_filter = ChangeFilter(DEADBANDS, 1.0)
+
+    def legacy(frame, now):
+        values = legacy_frame_to_signals(frame)
+        if mode == 'change':
+            values = change_filter.changes(values, now)
+        return {path: Datapoint(value) for path, value in values.items()}
+
+    schema = SignalSchema(CONTROL_SIGNALS)
+    slot_filter = SlotChangeFilter(schema.deadbands(DEADBANDS), 1.0)
+    publish_buffer = PublishBuffer(schema)
+
+    def with_schema(frame, now):
+        slots = slot_filter.changes(frame.values, now) if mode == 'change' else schema.allSlots
+        return publish_buffer.request(frame.values, slots)
+
+    return {'before': legacy, 'schema': with_schema}
+
+def apply_variants(vehicle_id):
+    """Return {name: tick(updates, now)} of the old and the schema decoding on the car."""
+    namespace = Namespace(vehicle_id)
+    namespace.paths(CONTROL_SIGNALS)
+    legacy_latest = LegacyLatestValues()
+
+    def legacy(updates, now):
+        legacy_latest.update(namespace.from_broker(updates))
+        values, _ = legacy_latest.current()
+        # The fixed-rate loop checked every tick that all signals had been received
+        if all(path in values for path in CONTROL_SIGNALS):
+            return legacy_command_from_updates(values)
+
+    schema = SignalSchema(CONTROL_SIGNALS, namespace)
+    latest = car_controller.LatestValues(schema)
+
+    def with_schema(updates, now):
+        latest.update(updates)
+        values, _ = latest.current()
+        if values is not None:
+            return car_controller.command_from_values(values)
+
+    return {'before': legacy, 'schema': with_schema}
+
+def broker_updates(frame_list, vehicle_id):
+    """The updates a car receives for each frame: all eight signals, under the vehicle's namespace."""
+    namespace = Namespace(vehicle_id)
+    paths = namespace.paths(CONTROL_SIGNALS)
+    schema = SignalSchema(CONTROL_SIGNALS)
+    return [{path: Datapoint(value) for path, value in zip(paths, schema.to_signals(frame.values).values())}
+            for frame in frame_list]
+
+def timed(tick, inputs, rate):
+    """Run `tick` over `inputs` paced at `rate`; return (mean µs, p99 µs) of the time spent in each tick."""
+    period = 1.0 / rate
+    costs = []
+    deadline = time.perf_counter()
+    for i, item in enumerate(inputs):
+        start = time.perf_counter()
+        tick(item, i * period)
+        costs.append(time.perf_counter() - start)
+        deadline += period
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    costs.sort()
+    return sum(costs) / len(costs) * 1e6, costs[int(0.99 * len(costs))] * 1e6
+
+def allocated(tick, inputs, period):
+    """Return the mean bytes allocated within one tick, as seen by tracemalloc."""
+    tracemalloc.start()
+    total = 0
+    for i, item in enumerate(inputs):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        tick(item, i * period)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - before
+    tracemalloc.stop()
+    return total / len(inputs)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=1000.0, help='ticks per second')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per variant')
+    parser.add_argument('--vehicle-id', default='', help='namespace of the car (fleet mode), empty for plain paths')
+    args = parser.parse_args()
+
+    count = int(args.rate * args.duration)
+    frame_list = frames(count)
+    updates = broker_updates(frame_list, args.vehicle_id)
+    print(f"{count} ticks at {args.rate:g} Hz per variant{f', vehicle {args.vehicle_id}' if args.vehicle_id else ''}")
+    print(f"{'path':<22}{'variant':<9}{'mean µs':>9}{'p99 µs':>9}{'CPU % at rate':>15}{'bytes/tick':>12}")
+    cases = [(f"publish ({mode})", lambda mode=mode: publish_variants(mode), frame_list) for mode in ('change', 'all')]
+    cases.append(("apply", lambda: apply_variants(args.vehicle_id), updates))
+    for name, make, inputs in cases:
+        for variant in ('before', 'schema'):
+            mean_us, p99_us = timed(make()[variant], inputs, args.rate)
+            # Allocation pass on a fresh instance, so both passes see the same filter state
+            per_tick = allocated(make()[variant], inputs[:min(len(inputs), 5000)], 1.0 / args.rate)
+            print(f"{name:<22}{variant:<9}{mean_us:>9.2f}{p99_us:>9.2f}{mean_us * args.rate / 1e4:>15.2f}{per_tick:>12.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Measure the startup and crash recovery of the controller and car entry points.
+
+Every run starts g29_kuksa.py (with a scripted joystick) and car_controller.py (with
+a recording racecar that takes --racecar-init seconds to start, like the servo
+driver on the Jetson) as fresh processes, connected over the udp transport, and
+reads the startup profiles they write to STARTUP_PROFILE. Connecting sleeps for
+--connect-delay first, the handshake and first round trip to a remote broker.
+Once both are up, the car and then the controller are killed and started again,
+as a restart policy would; the time from the kill to the first applied command
+(first published frame) of the new process is its recovery time.
+
+With --sequential as well, every run is repeated with the setup steps run one
+after the other, as the entry points did before they overlapped them. Finally
+pygame.init() is compared with the joystick-only init of input_sampler.py, each
+in a fresh process.
+
+    python Benchmarks/bench_startup.py --runs 5 --racecar-init 0.5 --connect-delay 0.15
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import runpy
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+SCRIPTS = {
+    'car': os.path.join(ROOT, 'Jetracer', 'car_controller.py'),
+    'g29': os.path.join(ROOT, 'G29', 'g29_kuksa.py'),
+}
+FINAL = {'car': 'first_command', 'g29': 'first_frame'}
+
+def run_child(role, args):
+    """Run one entry point as __main__ of this process, with the stand-ins installed."""
+    script = SCRIPTS[role]
+    sys.argv = [script]
+    sys.path[:0] = [HERE, os.path.dirname(script), os.path.join(ROOT, 'Common')]
+    sys.stdout = open(os.devnull, 'w')  # The entry points print startup messages and telemetry
+
+    import startup
+    import transport
+    if args.sequential:
+        def run_now(function, *function_args, milestone=None):
+            future = concurrent.futures.Future()
+            future.set_result(function(*function_args))
+            if milestone:
+                startup.startup_profile.mark(milestone)
+            return future
+        startup.start_in_background = run_now
+
+    real_prewarm = transport.prewarm
+
+    def prewarm(client, paths=()):
+        time.sleep(args.connect_delay)  # Handshake and first round trip to a remote broker
+        real_prewarm(client, paths)
+    transport.prewarm = prewarm
+
+    if role == 'car':
+        import fake_racecar
+        fake_racecar.install()
+        fake_racecar.RecordingRacecar.initDelay = args.racecar_init
+    else:
+        import fake_joystick
+        fake_joystick.install(fake_joystick.ScriptedJoystick())
+    runpy.run_path(script, run_name='__main__')
+
+def measure_pygame(mode):
+    """Return the seconds pygame takes to get ready for joystick input in this process."""
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    sys.path.insert(0, os.path.join(ROOT, 'G29'))
+    from input_sampler import init_joystick_input
+    import pygame
+    start = time.perf_counter()
+    if mode == 'full':
+        pygame.init()
+        pygame.joystick.init()
+    else:
+        init_joystick_input()
+    return time.perf_counter() - start
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+class Processes:
+    """Starts the entry points as children and waits for their startup profiles."""
+
+    def __init__(self, args, sequential, profile_path):
+        self.args = args
+        self.sequential = sequential
+        self.profilePath = profile_path
+        self.env = dict(os.environ, TRANSPORT='udp', UDP_ADDRESS=f'127.0.0.1:{free_udp_port()}',
+                        STARTUP_PROFILE=profile_path, PUBLISH_MODE=args.publish_mode,
+                        PUBLISH_INTERVAL=str(args.publish_interval), SDL_AUDIODRIVER='dummy',
+                        PYGAME_HIDE_SUPPORT_PROMPT='1')
+        self.children = {}
+
+    def start(self, role):
+        command = [sys.executable, os.path.abspath(__file__), '--child', role,
+                   f'--racecar-init={self.args.racecar_init}', f'--connect-delay={self.args.connect_delay}']
+        if self.sequential:
+            command.append('--sequential')
+        self.children[role] = subprocess.Popen(command, env=self.env, stdout=subprocess.DEVNULL,
+                                               stderr=subprocess.DEVNULL)
+        return self.children[role].pid
+
+    def kill(self, role):
+        child = self.children.pop(role)
+        child.kill()
+        child.wait()
+
+    def stop(self):
+        for role in list(self.children):
+            self.kill(role)
+
+    def profile(self, pid, timeout=10.0):
+        """Return the startup profile written by process `pid`, waiting for it up to `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists(self.profilePath):
+                with open(self.profilePath) as profile_file:
+                    for line in profile_file:
+                        record = json.loads(line)
+                        if record['pid'] == pid:
+                            return record
+            time.sleep(0.01)
+        raise TimeoutError(f"process {pid} reported no startup profile")
+
+def run_once(args, sequential):
+    """Start, crash and restart both entry points once; return {measurement: seconds}."""
+    with tempfile.TemporaryDirectory() as directory:
+        processes = Processes(args, sequential, os.path.join(directory, 'startup.jsonl'))
+        try:
+            results = {}
+            car_pid = processes.start('car')
+            g29_pid = processes.start('g29')
+            for role, pid in (('car', car_pid), ('g29', g29_pid)):
+                for name, seconds in processes.profile(pid)['milestones'].items():
+                    results[f'{role} {name}'] = seconds
+            time.sleep(0.5)
+
+            for role in ('car', 'g29'):
+                killed_at = time.time()
+                processes.kill(role)
+                record = processes.profile(processes.start(role))
+                results[f'{role} recovery'] = record['started'] + record['milestones'][FINAL[role]] - killed_at
+                time.sleep(0.5)
+            return results
+        finally:
+            processes.stop()
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--racecar-init', type=float, default=0.5, help='seconds the racecar takes to start')
+    parser.add_argument('--connect-delay', type=float, default=0.15, help='seconds connecting to the broker takes')
+    parser.add_argument('--publish-mode', choices=('change', 'all'), default='all',
+                        help="with 'change' a restarted car waits for the next heartbeat over udp")
+    parser.add_argument('--publish-interval', type=float, default=0.01)
+    parser.add_argument('--sequential', action='store_true', help='also measure the setup steps run one after the other')
+    parser.add_argument('--child', choices=sorted(SCRIPTS) + ['pygame-full', 'pygame-joystick'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child in SCRIPTS:
+        run_child(args.child, args)
+        return
+    if args.child:
+        print(json.dumps(measure_pygame(args.child.split('-')[1])))
+        return
+
+    print(f"{args.runs} runs, racecar init {args.racecar_init * 1000:g} ms, connect {args.connect_delay * 1000:g} ms, "
+          f"PUBLISH_MODE={args.publish_mode} every {args.publish_interval * 1000:g} ms over udp; medians in ms "
+          f"since the process started")
+    variants = [('overlapped', False)] + ([('sequential', True)] if args.sequential else [])
+    table = {}
+    for name, sequential in variants:
+        runs = [run_once(args, sequential) for _ in range(args.runs)]
+        table[name] = {key: median([run[key] for run in runs if key in run]) for key in runs[0]}
+    keys = list(table['overlapped'])
+    print(f"{'milestone':<24}" + "".join(f"{name:>12}" for name, _ in variants))
+    for key in keys:
+        print(f"{key:<24}" + "".join(f"{table[name].get(key, float('nan')) * 1000:>12.0f}" for name, _ in variants))
+
+    print(f"{'pygame':<24}{'init ms':>12}")
+    for mode in ('full', 'joystick'):
+        times = [float(subprocess.run([sys.executable, os.path.abspath(__file__), '--child', f'pygame-{mode}'],
+                                      capture_output=True, text=True).stdout) for _ in range(args.runs)]
+        print(f"{mode:<24}{median(times) * 1000:>12.1f}")
+
+if __name__ == '__main__':
+    main()
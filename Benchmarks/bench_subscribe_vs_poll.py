@@ -0,0 +1,108 @@
+"""Compare input-to-actuator latency of car_controller's polling, subscription and fixed-rate loops.
+
+Runs both loops against the in-process FakeBroker with a simulated publisher and
+reports how long it takes for a published steering value to reach car.steering.
+Slew limits are turned off so that the fixed-rate loop writes published values unchanged.
+
+    python Benchmarks/bench_subscribe_vs_poll.py --rate 50 --duration 5 --rtt 0.005
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Jetracer'))
+
+import fake_racecar
+fake_racecar.install()
+
+import car_controller
+from fake_broker import FakeBroker
+from kuksa_client.grpc import Datapoint
+
+def publish(broker, rate, stop_event, sent):
+    """Publish a new steering value every 1/rate seconds, remembering when each was sent."""
+    seq = 0
+    period = 1.0 / rate
+    while not stop_event.is_set():
+        seq += 1
+        steering = round(seq * 0.001, 6)
+        sent[steering] = time.monotonic()
+        broker.set_current_values({
+            'Vehicle.OBD.RelativeThrottlePosition': Datapoint(0.1),
+            'Vehicle.Powertrain.Transmission.ClutchEngagement': Datapoint(0.0),
+            'Vehicle.Chassis.Brake.PedalPosition': Datapoint(0.0),
+            'Vehicle.Speed': Datapoint(steering),
+            'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': Datapoint(False),
+            'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': Datapoint(False),
+            'Vehicle.ADAS.CruiseControl.IsActive': Datapoint(False),
+            'Vehicle.ADAS.CruiseControl.IsEnabled': Datapoint(False),
+        })
+        time.sleep(period)
+
+def run(mode, rate, duration, rtt):
+    broker = FakeBroker(rtt=rtt)
+    car = fake_racecar.RecordingRacecar()
+    car_controller.car = car
+    sent = {}
+    stop_event = threading.Event()
+
+    publisher = threading.Thread(target=publish, args=(broker, rate, stop_event, sent))
+    loop = {
+        'poll': car_controller.poll_loop,
+        'subscribe': car_controller.subscription_loop,
+        'fixed': car_controller.fixed_rate_loop,
+    }[mode]
+    controller = threading.Thread(target=loop, args=(broker, stop_event))
+    publisher.start()
+    controller.start()
+    time.sleep(duration)
+    stop_event.set()
+    broker.close()
+    publisher.join()
+    controller.join()
+
+    # Latency of a value is measured to its first write into car.steering
+    applied = {}
+    for timestamp, value in car.steeringWrites:
+        applied.setdefault(value, timestamp)
+    latencies = sorted((applied[value] - sent[value]) * 1000 for value in applied if value in sent)
+    return {
+        'mode': mode,
+        'published': len(sent),
+        'applied': len(latencies),
+        'broker_calls': broker.calls['get'] + broker.calls['subscribe'],
+        'latencies': latencies,
+    }
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=50.0, help='publisher rate in Hz')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per mode')
+    parser.add_argument('--rtt', type=float, default=0.005, help='simulated broker round trip in seconds')
+    parser.add_argument('--actuator-rate', type=float, default=100.0, help='rate of the fixed-rate loop in Hz')
+    args = parser.parse_args()
+    car_controller.ACTUATOR_RATE = args.actuator_rate
+
+    logging.getLogger().setLevel(logging.WARNING)
+    car_controller.THROTTLE_SLEW = car_controller.STEERING_SLEW = 0.0
+    print(f"Publisher {args.rate:g} Hz, broker RTT {args.rtt * 1000:g} ms, {args.duration:g} s per mode")
+    print(f"{'mode':<10}{'published':>10}{'applied':>9}{'calls':>7}{'mean ms':>9}{'p50 ms':>8}{'p99 ms':>8}{'max ms':>8}")
+    for mode in ('poll', 'subscribe', 'fixed'):
+        result = run(mode, args.rate, args.duration, args.rtt)
+        latencies = result['latencies']
+        if not latencies:
+            print(f"{mode:<10}no values applied")
+            continue
+        print(f"{mode:<10}{result['published']:>10}{result['applied']:>9}{result['broker_calls']:>7}"
+              f"{statistics.mean(latencies):>9.2f}{percentile(latencies, 0.5):>8.2f}"
+              f"{percentile(latencies, 0.99):>8.2f}{latencies[-1]:>8.2f}")
+
+if __name__ == '__main__':
+    main()
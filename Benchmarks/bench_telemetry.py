@@ -0,0 +1,196 @@
+"""Measure what the car's per-frame output costs the fixed-rate actuator loop when the terminal is slow.
+
+car_controller.fixed_rate_loop drives a RecordingRacecar at --rate Hz from commands
+that a thread streams into a FakeBroker at --publish-rate Hz. The loop's stdout is
+a line-buffered pipe (shrunk to one page where Linux allows it) drained by a
+process that reads --terminal bytes per second, like an SSH session on a poor link.
+Each mode runs in a fresh subprocess:
+
+- off: TELEMETRY=off, nothing is recorded
+- text, jsonl, binary: every period is recorded into a Telemetry ring and a writer
+  thread prints --telemetry-rate summaries per second in that format
+- print: the ten print() calls per frame the loops used to make
+
+It reports the achieved loop rate, the busy time of a period (p50/p99/max), the
+wake-up lateness (p99/max), deadline misses and the bytes the terminal received.
+
+    python Benchmarks/bench_telemetry.py --rate 100 --duration 5 --terminal 4000
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE] + [os.path.join(HERE, '..', folder) for folder in ('Jetracer', 'Common')]
+
+MODES = ('off', 'text', 'jsonl', 'binary', 'print')
+
+# Linux fcntl to resize a pipe
+F_SETPIPE_SZ = 1031
+
+# Reads stdin at most argv[1] bytes per second and counts them
+SLOW_TERMINAL = """
+import sys, time
+rate, total = float(sys.argv[1]), 0
+while True:
+    chunk = sys.stdin.buffer.read1(256)
+    if not chunk:
+        break
+    total += len(chunk)
+    time.sleep(len(chunk) / rate)
+sys.stderr.write(str(total))
+"""
+
+class PrintingTelemetry:
+    """Prints every frame the way car_controller.print_current_values did, in place of a Telemetry."""
+
+    def add_source(self, name, stats):
+        pass
+
+    def record(self, values, timestamp=None):
+        print("Current Values:")
+        print(f"Throttle: {values[0]}")
+        print(f"Clutch: {values[1]}")
+        print(f"Brake: {values[2]}")
+        print(f"Steering: {values[3]}")
+        print(f"Handbrake Active: {bool(values[4])}")
+        print(f"Reverse Active: {bool(values[5])}")
+        print(f"Enter Active: {bool(values[6])}")
+        print(f"Exit Active: {bool(values[7])}")
+        print("----------------------------")
+
+def slow_stdout(terminal_rate):
+    """Point stdout at a pipe drained by a slow reader; return the reader and a file for the results."""
+    results = os.fdopen(os.dup(1), 'w')
+    read_end, write_end = os.pipe()
+    try:
+        fcntl.fcntl(write_end, F_SETPIPE_SZ, 4096)
+    except OSError:
+        pass
+    terminal = subprocess.Popen([sys.executable, '-c', SLOW_TERMINAL, str(terminal_rate)], stdin=read_end,
+                                stderr=subprocess.PIPE, text=True)
+    os.close(read_end)
+    sys.stdout.flush()
+    os.dup2(write_end, 1)
+    os.close(write_end)
+    sys.stdout.reconfigure(line_buffering=True)  # Like a terminal
+    return terminal, results
+
+def run_mode(mode, rate, publish_rate, duration, telemetry_rate, terminal_rate):
+    os.environ.update({'TELEMETRY': 'off' if mode in ('off', 'print') else 'on', 'ACTUATOR_RATE': str(rate)})
+    terminal, results = slow_stdout(terminal_rate)
+
+    import fake_racecar
+    fake_racecar.install()
+    import car_controller
+    from actuator_loop import ActuatorLoop
+    from fake_broker import FakeBroker
+    from signal_schema import PublishBuffer
+    from telemetry import Telemetry
+    logging.getLogger().setLevel(logging.ERROR)
+
+    loops = []
+
+    class CapturedLoop(ActuatorLoop):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            loops.append(self)
+    car_controller.ActuatorLoop = CapturedLoop
+    car_controller.car = fake_racecar.RecordingRacecar()
+
+    if mode == 'print':
+        telemetry = PrintingTelemetry()
+    elif mode == 'off':
+        telemetry = None
+    else:
+        telemetry = Telemetry('Current Values', car_controller.TELEMETRY_FIELDS, telemetry_rate, '-', mode).start()
+
+    broker = FakeBroker()
+    stop_event = threading.Event()
+    schema = car_controller.schema
+    publish_buffer = PublishBuffer(schema)
+
+    def publish():
+        values = schema.values()
+        step = 0
+        while not stop_event.is_set():
+            step += 1
+            values[car_controller.THROTTLE] = 0.5
+            values[car_controller.STEERING] = (step % 200) / 100.0 - 1.0
+            broker.set_current_values(publish_buffer.request(values, schema.allSlots))
+            time.sleep(1.0 / publish_rate)
+
+    threading.Thread(target=publish, daemon=True).start()
+    threading.Thread(target=car_controller.fixed_rate_loop, args=(broker, stop_event, telemetry),
+                     daemon=True).start()
+
+    time.sleep(0.5)
+    loop = loops[0]
+    loop.stats()  # Start the histograms afresh
+    misses = loop.misses
+    time.sleep(duration)
+    stats = loop.stats(reset=False)
+    busy, jitter = loop.busy.summary(), loop.jitter.summary()
+    stop_event.set()
+    if telemetry is not None and mode != 'print':
+        telemetry.stop()
+
+    result = {
+        'mode': mode,
+        'rate': stats['rate'],
+        'busy_p50_ms': busy['p50_ms'],
+        'busy_p99_ms': busy['p99_ms'],
+        'busy_max_ms': busy['max_ms'],
+        'late_p99_ms': jitter['p99_ms'],
+        'late_max_ms': jitter['max_ms'],
+        'misses': loop.misses - misses,
+    }
+    # Let the terminal report what it received before this process goes away
+    os.close(1)
+    sys.stdout = open(os.devnull, 'w')
+    result['terminal_bytes'] = int(terminal.communicate(timeout=60)[1] or 0)
+    results.write(json.dumps(result) + "\n")
+    results.flush()
+    os._exit(0)  # Do not wait for the loop and publisher threads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=100.0, help='actuator loop rate in Hz')
+    parser.add_argument('--publish-rate', type=float, default=50.0, help='command rate in Hz')
+    parser.add_argument('--duration', type=float, default=5.0, help='measured seconds per mode')
+    parser.add_argument('--telemetry-rate', type=float, default=2.0, help='telemetry summaries per second')
+    parser.add_argument('--terminal', type=float, default=4000.0, help='bytes per second the terminal takes')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.child, args.rate, args.publish_rate, args.duration, args.telemetry_rate, args.terminal)
+
+    print(f"Actuator loop at {args.rate:g} Hz, commands at {args.publish_rate:g} Hz, terminal at {args.terminal:g} B/s, "
+          f"{args.telemetry_rate:g} telemetry summaries/s")
+    print(f"{'mode':<8}{'rate Hz':>9}{'busy p50':>10}{'p99 ms':>8}{'max ms':>9}{'late p99':>10}{'max ms':>9}"
+          f"{'misses':>8}{'terminal B':>12}")
+    for mode in args.modes.split(','):
+        command = [sys.executable, os.path.abspath(__file__), '--child', mode] + [
+            f'--{name}={value}' for name, value in (
+                ('rate', args.rate), ('publish-rate', args.publish_rate), ('duration', args.duration),
+                ('telemetry-rate', args.telemetry_rate), ('terminal', args.terminal))]
+        output = subprocess.run(command, capture_output=True, text=True)
+        lines = output.stdout.strip().splitlines()
+        if not lines:
+            print(f"{mode:<8}failed:\n{output.stderr}")
+            continue
+        r = json.loads(lines[-1])
+        received = f"{r['terminal_bytes']:>12}" if 'terminal_bytes' in r else f"{'-':>12}"
+        print(f"{r['mode']:<8}{r['rate']:>9.1f}{r['busy_p50_ms']:>10.3f}{r['busy_p99_ms']:>8.3f}{r['busy_max_ms']:>9.2f}"
+              f"{r['late_p99_ms']:>10.3f}{r['late_max_ms']:>9.2f}{r['misses']:>8}{received}")
+
+if __name__ == '__main__':
+    main()
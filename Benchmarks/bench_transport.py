@@ -0,0 +1,100 @@
+"""Compare the send-to-receive latency of the transports in Common/transport.py on localhost.
+
+A sender publishes a new steering value every 1/rate seconds through each transport,
+and a receiver subscribed on the car side records when each value arrives.
+FakeBroker with --rtt stands in for a remote KUKSA broker; pass --kuksa host:port
+to also measure a real databroker (for example one started locally with Docker).
+
+    python Benchmarks/bench_transport.py --rate 200 --duration 3 --rtt 0.01
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+
+from fake_broker import FakeBroker
+from kuksa_client.grpc import Datapoint
+from kuksa_client.grpc import VSSClient
+from transport import MemoryTransport, MirrorTransport, UdpTransport
+
+SIGNAL = 'Vehicle.Speed'
+
+def measure(sender, receiver, rate, duration):
+    """Return (sent, received, latencies in ms) of steering values sent from `sender` to `receiver`."""
+    sent = {}
+    received = {}
+
+    def receive():
+        for updates in receiver.subscribe_current_values([SIGNAL]):
+            datapoint = updates.get(SIGNAL)
+            if datapoint is not None:
+                received.setdefault(datapoint.value, time.perf_counter())
+
+    threading.Thread(target=receive, daemon=True).start()
+    time.sleep(0.2)  # Let the subscription start
+
+    period = 1.0 / rate
+    deadline = time.perf_counter()
+    end = deadline + duration
+    value = 0.0
+    while deadline < end:
+        value += 1.0
+        sent[value] = time.perf_counter()
+        sender.set_current_values({SIGNAL: Datapoint(value)})
+        deadline += period
+        time.sleep(max(0.0, deadline - time.perf_counter()))
+    time.sleep(0.2)  # Let the last values arrive
+    latencies = sorted((received[v] - sent[v]) * 1000 for v in received if v in sent)
+    return len(sent), len(latencies), latencies
+
+def transports(rtt, kuksa, udp_port):
+    """Yield (name, sender, receiver, cleanup) for every transport to measure."""
+    yield 'memory', MemoryTransport('bench'), MemoryTransport('bench'), lambda: MemoryTransport('bench').store.close()
+
+    receiver = UdpTransport(('127.0.0.1', udp_port), bind=True)
+    yield 'udp', UdpTransport(('127.0.0.1', udp_port)), receiver, receiver.close
+
+    broker = FakeBroker(rtt=rtt)
+    yield f'broker (RTT {rtt * 1000:g} ms)', broker, broker, broker.close
+
+    # The mirror copies into a broker as slow as the one above without slowing the UDP path
+    receiver = UdpTransport(('127.0.0.1', udp_port + 1), bind=True)
+    mirror_broker = FakeBroker(rtt=rtt)
+    sender = MirrorTransport(UdpTransport(('127.0.0.1', udp_port + 1)), lambda: mirror_broker)
+    sender.__enter__()
+    yield 'udp + mirror', sender, receiver, lambda: (sender.__exit__(None, None, None), receiver.close())
+    print(f"{'':<24}(mirror: {sender.mirrored} RPCs to the broker, {sender.failed} failed)")
+
+    if kuksa:
+        host, _, port = kuksa.rpartition(':')
+        with VSSClient(host, int(port)) as sender, VSSClient(host, int(port)) as receiver:
+            yield f'kuksa {kuksa}', sender, receiver, lambda: None
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=200.0, help='values sent per second')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per transport')
+    parser.add_argument('--rtt', type=float, default=0.01, help='round trip of the stand-in broker in seconds')
+    parser.add_argument('--kuksa', default='', help='host:port of a KUKSA databroker to measure as well')
+    parser.add_argument('--udp-port', type=int, default=55590, help='first local UDP port to use')
+    args = parser.parse_args()
+
+    print(f"{args.rate:g} values/s for {args.duration:g} s per transport")
+    print(f"{'transport':<24}{'sent':>7}{'received':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, sender, receiver, cleanup in transports(args.rtt, args.kuksa, args.udp_port):
+        sent, count, latencies = measure(sender, receiver, args.rate, args.duration)
+        cleanup()
+        if not latencies:
+            print(f"{name:<24}{sent:>7}{0:>10}")
+            continue
+        print(f"{name:<24}{sent:>7}{count:>10}{percentile(latencies, 0.5):>9.3f}"
+              f"{percentile(latencies, 0.99):>9.3f}{latencies[-1]:>9.3f}")
+
+if __name__ == '__main__':
+    main()
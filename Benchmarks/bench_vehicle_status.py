@@ -0,0 +1,196 @@
+"""Load-test the vehicle status the car sends back, and check that it leaves the control path alone.
+
+car_controller.fixed_rate_loop drives a RecordingRacecar at --actuator-rate Hz from
+steering commands streamed into a FakeBroker at --command-rate Hz (every value
+unique, slew limits off). The car's StatusPublisher sends its status at each of
+--rates Hz (0 = off, the baseline) on a connection of its own, and a controller-side
+StatusMonitor follows it. --cars adds synthetic cars that publish their status under
+Fleet.<id> into the same broker, each followed by a monitor of its own, to load the
+broker. The broker serializes every request like the real client and answers each
+call after --rtt seconds. Each combination runs in a fresh subprocess.
+
+It reports:
+
+- downstream: command-to-car.steering latency (p50/p99), and the actuator loop's
+  p99 wake-up lateness, p99 busy time and deadline misses
+- upstream: status requests per second from the car, Datapoints per request,
+  periods skipped, and how long after the car applied a steering value the
+  controller's monitor showed it (p50/p99)
+- the broker's set calls per second over all cars
+
+    python Benchmarks/bench_vehicle_status.py --rates 0,10,50,200 --cars 1,16 --rtt 0.005
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE] + [os.path.join(HERE, '..', folder) for folder in ('Jetracer', 'Common')]
+
+def connected(client):
+    """A finished Future of `client`, as start_in_background() would return."""
+    future = concurrent.futures.Future()
+    future.set_result(client)
+    return future
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+def run_config(status_rate, cars, command_rate, actuator_rate, duration, rtt):
+    os.environ.update({'ACTUATOR_RATE': str(actuator_rate), 'THROTTLE_SLEW': '0', 'STEERING_SLEW': '0',
+                       'TELEMETRY': 'off'})
+    import fake_racecar
+    fake_racecar.install()
+    import car_controller
+    from fake_broker import FakeBroker
+    from fleet import STATUS_SIGNALS, Namespace
+    from signal_schema import PublishBuffer, SignalSchema
+    from vehicle_status import APPLIED_STEERING, APPLIED_THROTTLE, LOOP_RATE, StatusMonitor, StatusPublisher
+    logging.getLogger().setLevel(logging.ERROR)
+
+    broker = FakeBroker(rtt=rtt, serialize=True)
+    car = car_controller.car = fake_racecar.RecordingRacecar()
+    stop_event = threading.Event()
+    sent = {}
+    commands = [0]
+
+    def publish_commands():
+        schema = car_controller.schema
+        publish_buffer = PublishBuffer(schema)
+        values = schema.values()
+        values[car_controller.THROTTLE] = 0.1
+        period = 1.0 / command_rate
+        deadline = time.monotonic()
+        while not stop_event.is_set():
+            commands[0] += 1
+            values[car_controller.STEERING] = round(commands[0] * 0.0001, 6)
+            sent[values[car_controller.STEERING]] = time.monotonic()
+            broker.set_current_values(publish_buffer.request(values))
+            deadline += period
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+    # The car under test and the controller following it
+    status = StatusPublisher(connected(broker), car_controller.status_schema, status_rate) if status_rate else None
+    result = {}
+
+    def drive():
+        result['loop'] = car_controller.fixed_rate_loop(broker, stop_event, status=status)
+
+    monitor = StatusMonitor(connected(broker), SignalSchema(STATUS_SIGNALS)).start() if status_rate else None
+
+    # Synthetic cars loading the same broker
+    others = []
+    for index in range(1, cars if status_rate else 1):
+        schema = SignalSchema(STATUS_SIGNALS, Namespace(f'car{index}'))
+        publisher = StatusPublisher(connected(broker), schema, status_rate)
+
+        def sample(values, phase=index):
+            now = time.monotonic()
+            values[APPLIED_THROTTLE] = 0.5 + 0.5 * math.sin(now + phase)
+            values[APPLIED_STEERING] = math.cos(now + phase)
+            values[LOOP_RATE] = actuator_rate
+        publisher.start(sample)
+        StatusMonitor(connected(broker), schema).start()
+        others.append(publisher)
+
+    # When the controller first saw each applied steering value
+    seen = {}
+
+    def watch():
+        while not stop_event.is_set():
+            values, _ = monitor.current()
+            if values is not None:
+                seen.setdefault(values[APPLIED_STEERING], time.monotonic())
+            time.sleep(0.0005)
+
+    threads = [threading.Thread(target=publish_commands, daemon=True), threading.Thread(target=drive, daemon=True)]
+    if monitor is not None:
+        threads.append(threading.Thread(target=watch, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    time.sleep(0.5)  # Let every thread connect before measuring
+    start = time.monotonic()
+    sets, commands_start = broker.calls['set'], commands[0]
+    status_start = status.sent if status else 0
+    time.sleep(duration)
+    elapsed = time.monotonic() - start
+    all_sets = broker.calls['set'] - sets
+    status_sent = (status.sent if status else 0) - status_start
+    stop_event.set()
+    broker.close()
+    threads[1].join()
+    loop = result['loop']
+    stats = loop.stats()
+
+    # Latency of a command to its first write into car.steering, of an applied value to the monitor
+    applied = {}
+    for timestamp, value in car.steeringWrites:
+        applied.setdefault(value, timestamp)
+    downstream = sorted((applied[value] - sent[value]) * 1000 for value in applied if value in sent)
+    upstream = sorted((seen[value] - applied[value]) * 1000 for value in seen if value in applied)
+    return {
+        'rate': status_rate,
+        'cars': cars if status_rate else 1,
+        'down_p50_ms': percentile(downstream, 0.5),
+        'down_p99_ms': percentile(downstream, 0.99),
+        'late_p99_ms': stats['jitter_p99_ms'],
+        'busy_p99_ms': stats['busy_p99_ms'],
+        'misses': stats['misses'],
+        'status_rate': status_sent / elapsed,
+        'datapoints': len(car_controller.status_schema.paths) if status_rate else 0,
+        'skipped': status.skipped if status else 0,
+        'up_p50_ms': percentile(upstream, 0.5),
+        'up_p99_ms': percentile(upstream, 0.99),
+        'broker_sets': all_sets / elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rates', default='0,10,50,200', help='comma-separated status rates in Hz (0 = off)')
+    parser.add_argument('--cars', default='1,16', help='comma-separated numbers of cars publishing their status')
+    parser.add_argument('--command-rate', type=float, default=50.0, help='command rate in Hz')
+    parser.add_argument('--actuator-rate', type=float, default=100.0, help='rate of the fixed-rate loop in Hz')
+    parser.add_argument('--duration', type=float, default=5.0, help='measured seconds per run')
+    parser.add_argument('--rtt', type=float, default=0.005, help='simulated broker round trip in seconds')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        rate, cars = args.child.split(':')
+        result = run_config(float(rate), int(cars), args.command_rate, args.actuator_rate, args.duration, args.rtt)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        sys.__stdout__.flush()
+        os._exit(0)  # Do not wait for the publisher and subscription threads
+
+    print(f"Commands at {args.command_rate:g} Hz, actuator loop at {args.actuator_rate:g} Hz, broker RTT "
+          f"{args.rtt * 1000:g} ms, {args.duration:g} s per run")
+    print(f"{'status Hz':>9}{'cars':>6}{'down p50':>10}{'p99 ms':>8}{'late p99':>10}{'busy p99':>10}{'misses':>8}"
+          f"{'status/s':>10}{'points':>8}{'skipped':>9}{'up p50':>8}{'p99 ms':>8}{'broker sets/s':>15}")
+    configs = []
+    for rate in args.rates.split(','):
+        for cars in (args.cars.split(',') if float(rate) else ['1']):
+            configs.append(f'{rate}:{cars}')
+    for config in configs:
+        command = [sys.executable, os.path.abspath(__file__), f'--child={config}'] + [
+            f'--{name}={value}' for name, value in (
+                ('command-rate', args.command_rate), ('actuator-rate', args.actuator_rate),
+                ('duration', args.duration), ('rtt', args.rtt))]
+        output = subprocess.run(command, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{config} failed:\n{output.stderr}")
+            continue
+        r = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f"{r['rate']:>9g}{r['cars']:>6}{r['down_p50_ms']:>10.2f}{r['down_p99_ms']:>8.2f}{r['late_p99_ms']:>10.3f}"
+              f"{r['busy_p99_ms']:>10.3f}{r['misses']:>8}{r['status_rate']:>10.1f}{r['datapoints']:>8}{r['skipped']:>9}"
+              f"{r['up_p50_ms']:>8.2f}{r['up_p99_ms']:>8.2f}{r['broker_sets']:>15.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import datetime
+import queue
+import random
+import threading
+import time
+from kuksa.val.v2 import types_pb2, val_pb2
+from kuksa_client.grpc import DataType, Datapoint, VSSClientError
+
+class FakeBroker:
+    """In-process stand-in for the KUKSA data broker.
+
+    Mirrors the parts of VSSClient the scripts use (set/get/subscribe current values).
+    Like the real broker it stamps Datapoints that arrive without a timestamp.
+    `rtt` adds a per-call delay to imitate the network round trip to a remote broker;
+    it may be a number of seconds or a callable returning one per call. `error_rate`
+    is the probability that a call fails after its round trip with the VSSClientError
+    of the real client, again a number or a callable returning one per call. With
+    `serialize` every set builds and serializes the PublishValue requests the real
+    client sends, so a benchmark pays its CPU cost too.
+    """
+
+    def __init__(self, rtt=0.0, error_rate=0.0, serialize=False):
+        self.rtt = rtt
+        self.error_rate = error_rate
+        self.serialize = serialize
+        self._lock = threading.Lock()
+        self._values = {}
+        self._subscribers = []
+        self.calls = {'set': 0, 'get': 0, 'subscribe': 0}
+        self.errors = 0
+        self.datapointsSet = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # The broker outlives the clients that connect to it; call close() to end subscriptions
+        pass
+
+    def delay(self):
+        return self.rtt() if callable(self.rtt) else self.rtt
+
+    def fail(self):
+        """Raise the error of a failed call, as often as `error_rate` asks for."""
+        error_rate = self.error_rate() if callable(self.error_rate) else self.error_rate
+        if error_rate and random.random() < error_rate:
+            with self._lock:
+                self.errors += 1
+            raise VSSClientError({'code': 14, 'reason': 'unavailable', 'message': 'injected by FakeBroker'}, [])
+
+    def _round_trip(self):
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        self.fail()
+
+    def set_current_values(self, updates):
+        if self.serialize:
+            encode_set_request(updates)
+        self._round_trip()
+        self.store(updates)
+
+    def get_current_values(self, paths):
+        self._round_trip()
+        return self.lookup(paths)
+
+    def store(self, updates):
+        """Apply a set request without the simulated round trip."""
+        with self._lock:
+            self.calls['set'] += 1
+            self.datapointsSet += len(updates)
+            now = time.monotonic()
+            stamp = datetime.datetime.now(datetime.timezone.utc)
+            # Stamp copies: like the real client, the caller's request is left untouched
+            updates = {path: datapoint if datapoint.timestamp is not None else Datapoint(datapoint.value, stamp)
+                       for path, datapoint in updates.items()}
+            for path, datapoint in updates.items():
+                self._values[path] = (datapoint, now)
+            subscribers = list(self._subscribers)
+        for paths, inbox in subscribers:
+            changed = {path: datapoint for path, datapoint in updates.items() if path in paths}
+            if changed:
+                inbox.put(changed)
+
+    def lookup(self, paths):
+        """Answer a get request without the simulated round trip."""
+        with self._lock:
+            self.calls['get'] += 1
+            return {path: self._values.get(path, (Datapoint(None), 0))[0] for path in paths}
+
+    def subscribe_current_values(self, paths):
+        paths = set(paths)
+        inbox = queue.Queue()
+        with self._lock:
+            self.calls['subscribe'] += 1
+            # Like the real broker, the first message carries the current value of every signal
+            initial = {path: self._values[path][0] for path in paths if path in self._values}
+            self._subscribers.append((paths, inbox))
+        if initial:
+            inbox.put(initial)
+        while True:
+            updates = inbox.get()
+            if updates is None:
+                return
+            yield updates
+
+    def close(self):
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for _, inbox in subscribers:
+            inbox.put(None)
+
+def encode_set_request(updates):
+    """Serialize `updates` ({path: Datapoint}) like VSSClient.set_current_values does, one request per signal."""
+    return [val_pb2.PublishValueRequest(
+        signal_id=types_pb2.SignalID(path=path),
+        data_point=datapoint.v2_to_message(DataType.BOOLEAN if isinstance(datapoint.value, bool) else DataType.FLOAT),
+    ).SerializeToString() for path, datapoint in updates.items()]
+
+class AsyncFakeBroker:
+    """asyncio view of a FakeBroker, mirroring kuksa_client.grpc.aio.VSSClient.
+
+    The broker's `rtt` is awaited instead of slept, so concurrent RPCs overlap like they do on a real channel.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def _round_trip(self):
+        delay = self.broker.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self.broker.fail()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def set_current_values(self, updates):
+        if self.broker.serialize:
+            encode_set_request(updates)
+        await self._round_trip()
+        self.broker.store(updates)
+
+    async def get_current_values(self, paths):
+        await self._round_trip()
+        return self.broker.lookup(paths)
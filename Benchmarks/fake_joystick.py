@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+# Run pygame without a display or sound card
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+
+class ScriptedJoystick:
+    """Stand-in for pygame.joystick.Joystick whose axes and buttons are set by a script.
+
+    Every change also posts the matching pygame event, so event-driven sampling works too.
+    """
+
+    def __init__(self, name='Scripted G29', num_axes=6, num_buttons=12, num_hats=1):
+        self.name = name
+        self.axes = [0.0] * num_axes
+        self.buttons = [0] * num_buttons
+        self.hats = [(0, 0)] * num_hats
+        self.postEvents = True
+        self._lock = threading.Lock()
+
+    def init(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def get_name(self):
+        return self.name
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_numhats(self):
+        return len(self.hats)
+
+    def get_axis(self, index):
+        return self.axes[index]
+
+    def get_button(self, index):
+        return self.buttons[index]
+
+    def get_hat(self, index):
+        return self.hats[index]
+
+    def set_axis(self, index, value):
+        self.axes[index] = value
+        if self.postEvents:
+            pygame.event.post(pygame.event.Event(pygame.JOYAXISMOTION, joy=0, instance_id=0, axis=index, value=value))
+
+    def set_button(self, index, pressed):
+        self.buttons[index] = 1 if pressed else 0
+        if self.postEvents:
+            event_type = pygame.JOYBUTTONDOWN if pressed else pygame.JOYBUTTONUP
+            pygame.event.post(pygame.event.Event(event_type, joy=0, instance_id=0, button=index))
+
+def install(joystick):
+    """Make pygame report `joystick` as the only connected joystick."""
+    # The event queue needs the (dummy) video subsystem, nothing else of pygame.init()
+    pygame.display.init()
+    pygame.joystick.init()
+    pygame.joystick.get_count = lambda: 1
+    pygame.joystick.Joystick = lambda index: joystick
+
+class SteeringSweep:
+    """Moves one axis through a repeating sweep at `rate` steps per second, remembering when each value was set."""
+
+    STEPS = 500
+
+    def __init__(self, joystick, axis, rate):
+        self.joystick = joystick
+        self.axis = axis
+        self.rate = rate
+        self.setAt = {}  # axis value -> monotonic time it was last set
+        self.steps = 0
+
+    def value(self, step):
+        return -1.0 + (step % self.STEPS) * (2.0 / self.STEPS)
+
+    def run(self, stop_event):
+        period = 1.0 / self.rate
+        deadline = time.monotonic()
+        while not stop_event.is_set():
+            value = self.value(self.steps)
+            self.setAt[value] = time.monotonic()
+            self.joystick.set_axis(self.axis, value)
+            self.steps += 1
+            deadline += period
+            time.sleep(max(0.0, deadline - time.monotonic()))
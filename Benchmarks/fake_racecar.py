@@ -0,0 +1,36 @@
+import sys
+import time
+import types
+
+class RecordingRacecar:
+    """Stand-in for jetracer.nvidia_racecar.NvidiaRacecar that records every actuator write.
+
+    Set `initDelay` to the seconds the real one takes to start (servo driver and I2C setup).
+    """
+
+    initDelay = 0.0
+
+    def __init__(self, *args, **kwargs):
+        if self.initDelay:
+            time.sleep(self.initDelay)
+        self.throttle = 0.0
+        self.steering = 0.0
+        self.reverse = 0
+        self.steeringWrites = []  # (monotonic time, value)
+        self.throttleWrites = []
+
+    def __setattr__(self, name, value):
+        if name == 'steering' and 'steeringWrites' in self.__dict__:
+            self.steeringWrites.append((time.monotonic(), value))
+        elif name == 'throttle' and 'throttleWrites' in self.__dict__:
+            self.throttleWrites.append((time.monotonic(), value))
+        object.__setattr__(self, name, value)
+
+def install():
+    """Register RecordingRacecar as jetracer.nvidia_racecar.NvidiaRacecar so car_controller imports it."""
+    package = types.ModuleType('jetracer')
+    module = types.ModuleType('jetracer.nvidia_racecar')
+    module.NvidiaRacecar = RecordingRacecar
+    package.nvidia_racecar = module
+    sys.modules['jetracer'] = package
+    sys.modules['jetracer.nvidia_racecar'] = module
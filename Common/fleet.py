@@ -0,0 +1,97 @@
+"""Namespaced VSS signal sets, so that one broker can serve several controllers and cars.
+
+Without a vehicle ID the plain VSS paths are used, as by a single controller and car.
+With VEHICLE_ID=car1 every control signal lives under Fleet.car1, for example
+Fleet.car1.Vehicle.Speed. The broker has to know these paths; write them as a VSS
+JSON file with
+
+    python fleet.py car1 car2 car3 > fleet.json
+
+and start the databroker with --vss <standard VSS file>,fleet.json.
+"""
+import json
+import os
+import sys
+from tracing import TRACE_SIGNAL
+
+# Root branch under which every vehicle of the fleet has its own copy of the control signals
+FLEET_ROOT = 'Fleet'
+
+# Vehicle this process drives or publishes for; empty for the plain VSS paths
+VEHICLE_ID = os.environ.get('VEHICLE_ID', '')
+
+# Signals a controller sends to the car, in ControlFrame slot order, with their VSS datatypes
+CONTROL_SIGNALS = {
+    'Vehicle.OBD.RelativeThrottlePosition': 'float',
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 'float',
+    'Vehicle.Chassis.Brake.PedalPosition': 'float',
+    'Vehicle.Speed': 'float',
+    'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': 'boolean',
+    'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': 'boolean',
+    'Vehicle.ADAS.CruiseControl.IsActive': 'boolean',
+    'Vehicle.ADAS.CruiseControl.IsEnabled': 'boolean',
+}
+
+# Signals the car sends back to the controller (see vehicle_status.py), in slot order, with their VSS datatypes:
+# the applied throttle and steering, the actuator loop's rate (Hz) and p99 wake-up lateness and busy time (ms),
+# the age of the newest command (s) and whether the watchdog holds the throttle at zero
+STATUS_SIGNALS = {
+    'Vehicle.OBD.ThrottleActuator': 'float',
+    'Vehicle.OBD.Speed': 'float',
+    'Vehicle.OBD.EngineLoad': 'float',
+    'Vehicle.OBD.TimingAdvance': 'float',
+    'Vehicle.OBD.AbsoluteLoad': 'float',
+    'Vehicle.OBD.RunTime': 'float',
+    'Vehicle.OBD.Status.IsMILOn': 'boolean',
+}
+
+class Namespace:
+    """Maps the plain VSS paths of one vehicle to and from its paths on a shared broker."""
+
+    def __init__(self, vehicle_id=''):
+        self.vehicleId = vehicle_id
+        self.prefix = f"{FLEET_ROOT}.{vehicle_id}." if vehicle_id else ''
+        self._plain = {}
+
+    def path(self, path):
+        return self.prefix + path
+
+    def paths(self, paths):
+        """Return the broker paths of `paths`, remembering them for from_broker()."""
+        broker_paths = [self.prefix + path for path in paths]
+        self._plain.update(zip(broker_paths, paths))
+        return broker_paths
+
+    def to_broker(self, values):
+        """Rename the keys of a {plain path: value} dict to broker paths."""
+        if not self.prefix:
+            return values
+        return {self.prefix + path: value for path, value in values.items()}
+
+    def from_broker(self, values):
+        """Rename the keys of a {broker path: value} dict, as returned by the broker, to plain paths."""
+        if not self.prefix:
+            return values
+        plain = self._plain
+        return {plain.get(path) or path[len(self.prefix):]: value for path, value in values.items()}
+
+def vss_tree(vehicle_ids, signals=None):
+    """Return a VSS JSON tree that defines `signals` (default: CONTROL_SIGNALS, STATUS_SIGNALS and TRACE_SIGNAL) for every vehicle."""
+    if signals is None:
+        signals = dict(CONTROL_SIGNALS, **STATUS_SIGNALS, **{TRACE_SIGNAL: 'string'})
+    root = {'type': 'branch', 'description': 'Vehicles sharing this broker.', 'children': {}}
+    for vehicle_id in vehicle_ids:
+        vehicle = root['children'][vehicle_id] = {
+            'type': 'branch', 'description': f'Signals of vehicle {vehicle_id}.', 'children': {}}
+        for path, datatype in signals.items():
+            *branches, leaf = path.split('.')
+            node = vehicle
+            for branch in branches:
+                node = node['children'].setdefault(branch, {'type': 'branch', 'description': branch, 'children': {}})
+            node['children'][leaf] = {'type': 'actuator', 'datatype': datatype, 'description': leaf}
+    return {FLEET_ROOT: root}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(f"usage: python {sys.argv[0]} VEHICLE_ID [VEHICLE_ID ...] > fleet.json")
+    json.dump(vss_tree(sys.argv[1:]), sys.stdout, indent=2)
@@ -0,0 +1,80 @@
+from array import array
+
+# Linear range in units; above it every power of two is split into SUB_BUCKETS // 2 buckets
+SUB_BUCKETS = 128
+HALF_BUCKETS = SUB_BUCKETS // 2
+SUB_BITS = SUB_BUCKETS.bit_length()
+
+class LatencyHistogram:
+    """Log-linear latency histogram in the style of HdrHistogram.
+
+    Values are counted in units of `resolution` seconds. Below SUB_BUCKETS units
+    every unit has its own bucket, above that the relative error stays under
+    1 / HALF_BUCKETS (about 1.6%). Recording is O(1) and memory is fixed.
+    """
+
+    def __init__(self, max_seconds=60.0, resolution=1e-6):
+        self.resolution = resolution
+        self.maxUnits = int(max_seconds / resolution)
+        self.counts = array('Q', bytes(8 * (self._index(self.maxUnits) + 1)))
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.negative = 0  # Values below zero (e.g. from clock offset error), counted as 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(units):
+        if units < SUB_BUCKETS:
+            return units
+        shift = units.bit_length() - SUB_BITS + 1
+        return SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (units >> shift) - HALF_BUCKETS
+
+    @staticmethod
+    def _value(index):
+        """Midpoint of a bucket, in units."""
+        if index < SUB_BUCKETS:
+            return index
+        shift, offset = divmod(index - SUB_BUCKETS, HALF_BUCKETS)
+        shift += 1
+        return ((offset + HALF_BUCKETS) << shift) + (1 << shift) / 2
+
+    def record(self, seconds):
+        if seconds < 0:
+            self.negative += 1
+            seconds = 0.0
+        units = min(int(seconds / self.resolution), self.maxUnits)
+        self.counts[self._index(units)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Return the latency in seconds below which `fraction` of the recorded values fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(fraction * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index) * self.resolution, self.max)
+        return self.max
+
+    def summary(self):
+        """Return count, mean, max and the usual percentiles in milliseconds."""
+        return {
+            'count': self.count,
+            'negative': self.negative,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p90_ms': self.percentile(0.9) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'p999_ms': self.percentile(0.999) * 1000,
+            'max_ms': self.max * 1000,
+        }
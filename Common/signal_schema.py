@@ -0,0 +1,90 @@
+"""Fixed slot layout of the control signals, shared by the publishing and the applying side.
+
+A SignalSchema gives every VSS signal a slot index and a datatype once, so the
+hot paths move flat arrays of floats instead of building {path: value} dicts
+with string keys on every tick: the controller fills a PublishBuffer from the
+slot values of a frame, and the car decodes broker updates straight into a slot array.
+"""
+from array import array
+from kuksa_client.grpc import Datapoint
+
+class SignalSchema:
+    """Slot index and VSS datatype of each signal, in the order of `signals` ({path: datatype}).
+
+    With a `namespace` (see fleet.py) the slots hold the vehicle's broker paths.
+    Buttons ('boolean') are stored as 0.0 / 1.0 like in ControlFrame.values.
+    """
+
+    def __init__(self, signals, namespace=None):
+        self.paths = tuple(namespace.paths(signals) if namespace else signals)
+        self.types = tuple(signals.values())
+        self.size = len(self.paths)
+        self.slots = {path: slot for slot, path in enumerate(self.paths)}
+        self.isButton = tuple(datatype == 'boolean' for datatype in self.types)
+        self.allSlots = (1 << self.size) - 1  # Bit mask of every slot
+        self.slotCounts = [bin(mask).count('1') for mask in range(self.allSlots + 1)]  # Slots set in each mask
+
+    def values(self):
+        """Return a new slot array, all zero."""
+        return array('d', bytes(8 * self.size))
+
+    def deadbands(self, deadbands):
+        """Return the per-slot deadbands of a {path: deadband} dict (0 for signals it does not list)."""
+        return array('d', (deadbands.get(path, 0.0) for path in self.paths))
+
+    def decode(self, updates, values, others=None):
+        """Write the values of the schema's signals in `updates` ({path: Datapoint}) into `values`.
+
+        Returns the bit mask of the slots written. Empty Datapoints are skipped, and
+        those of other signals are stored in the `others` dict if one is given.
+        """
+        slots = self.slots
+        mask = 0
+        for path, datapoint in updates.items():
+            if datapoint is None or datapoint.value is None:
+                continue
+            slot = slots.get(path)
+            if slot is not None:
+                values[slot] = datapoint.value
+                mask |= 1 << slot
+            elif others is not None:
+                others[path] = datapoint
+        return mask
+
+    def to_signals(self, values):
+        """Return {path: value} of a slot array, with buttons as bools."""
+        return {path: bool(value) if is_button else value
+                for path, is_button, value in zip(self.paths, self.isButton, values)}
+
+class PublishBuffer:
+    """Reusable set_current_values requests for the slots of a SignalSchema.
+
+    Every slot has one Datapoint for the lifetime of the buffer, and the request
+    dict of each combination of slots is built once and then reused, so sending
+    allocates no Datapoints and no dicts. The returned request is overwritten by
+    the next call; clients must have sent it (as the blocking VSSClient has) or
+    copied it before then.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.datapoints = [Datapoint(False if is_button else 0.0) for is_button in schema.isButton]
+        self._requests = [None] * (schema.allSlots + 1)
+
+    def request(self, values, mask=None):
+        """Return the {path: Datapoint} request for the slots in `mask` (default all), holding `values`."""
+        if mask is None:
+            mask = self.schema.allSlots
+        entry = self._requests[mask]
+        if entry is None:
+            entry = self._requests[mask] = self._build(mask)
+        request, slots = entry
+        for slot, datapoint, is_button in slots:
+            datapoint.value = values[slot] != 0.0 if is_button else values[slot]
+        return request
+
+    def _build(self, mask):
+        schema = self.schema
+        slots = tuple((slot, self.datapoints[slot], schema.isButton[slot])
+                      for slot in range(schema.size) if mask >> slot & 1)
+        return {schema.paths[slot]: datapoint for slot, datapoint, _ in slots}, slots
@@ -0,0 +1,102 @@
+"""Startup profiling and background initialization for the controller and car entry points.
+
+Every process has one StartupProfile that records when each milestone of its
+startup was reached, counted from the moment the process was started (so the
+interpreter start and the imports are included). Once the final milestone (the
+first published frame on the controller, the first applied command on the car)
+is reached, the profile is logged and, with STARTUP_PROFILE set, appended to that
+file as a JSON line:
+
+    {"process": "car_controller", "pid": 42, "started": 1718000000.12,
+     "milestones": {"connected": 0.41, "racecar": 1.32, "first_command": 1.38}}
+
+Slow setup steps, such as opening the racecar or connecting to the broker, are
+started with start_in_background() so that they overlap instead of adding up.
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Path of a JSON lines file every startup profile is appended to (empty = only log it)
+STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE', '')
+
+def process_age():
+    """Return the seconds since this process was started, or None if the OS does not tell."""
+    try:
+        with open('/proc/self/stat') as stat:
+            # Fields after the command name; the start time is field 22 of the whole line, in clock ticks since boot
+            fields = stat.read().rpartition(')')[2].split()
+        with open('/proc/uptime') as uptime:
+            booted = float(uptime.read().split()[0])
+        return max(0.0, booted - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StartupProfile:
+    """Seconds from the process start to each startup milestone, reported once the final one is reached."""
+
+    def __init__(self, process=None, path=STARTUP_PROFILE):
+        self.process = process or os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'python'
+        self.path = path
+        age = process_age()
+        # Without /proc the clock starts when this module is imported
+        self.startedAt = time.monotonic() - (age or 0.0)
+        self.started = time.time() - (age or 0.0)
+        self.milestones = {}
+        self.isComplete = False
+        self._lock = threading.Lock()
+
+    def mark(self, milestone):
+        """Record the first time `milestone` is reached; later calls are ignored."""
+        if milestone not in self.milestones:
+            with self._lock:
+                self.milestones.setdefault(milestone, time.monotonic() - self.startedAt)
+
+    def complete(self, milestone):
+        """Mark the final milestone and report the profile; cheap enough to call on every tick."""
+        if self.isComplete:
+            return
+        with self._lock:
+            if self.isComplete:
+                return
+            self.milestones[milestone] = time.monotonic() - self.startedAt
+            self.isComplete = True
+        self.report()
+
+    def report(self):
+        logger.info("Startup of %s: %s", self.process,
+                    ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.milestones.items()))
+        if self.path:
+            record = {'process': self.process, 'pid': os.getpid(), 'started': self.started,
+                      'milestones': self.milestones}
+            with open(self.path, 'a') as profile_file:
+                profile_file.write(json.dumps(record) + "\n")
+
+# The profile of this process
+startup_profile = StartupProfile()
+
+def start_in_background(function, *args, milestone=None):
+    """Run function(*args) in a daemon thread and return a Future of its result.
+
+    `milestone` is marked in the startup profile once the function returns.
+    """
+    future = concurrent.futures.Future()
+
+    def run():
+        try:
+            result = function(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        if milestone:
+            startup_profile.mark(milestone)
+        future.set_result(result)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
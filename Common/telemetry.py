@@ -0,0 +1,213 @@
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+# TELEMETRY=off records nothing; otherwise every frame of the control loops goes into an in-memory ring and a
+# background thread writes a summary TELEMETRY_RATE times per second to TELEMETRY_OUTPUT ('-' = stdout, else a
+# file that is appended to) as TELEMETRY_FORMAT 'text' (human-readable), 'jsonl' or 'binary' (see Telemetry.pack)
+TELEMETRY = os.environ.get('TELEMETRY', 'on')
+TELEMETRY_RATE = float(os.environ.get('TELEMETRY_RATE', 2.0))
+TELEMETRY_FORMAT = os.environ.get('TELEMETRY_FORMAT', 'text')
+TELEMETRY_OUTPUT = os.environ.get('TELEMETRY_OUTPUT', '-')
+TELEMETRY_RING_SIZE = int(os.environ.get('TELEMETRY_RING_SIZE', 1024))
+
+FORMATS = ('text', 'jsonl', 'binary')
+
+# Binary summary: magic, time, frames, lost, newest seq, field count, then newest, mean, min and max per field
+BINARY_HEADER = struct.Struct('<4sdIIQI')
+BINARY_MAGIC = b'TLM1'
+
+class Telemetry:
+    """Records the frames of a control loop and writes summaries of them from a background thread.
+
+    record() only stores the frame's time and values in a preallocated ring of
+    `size` frames, so the loop never formats text or waits on a terminal. The writer
+    thread wakes `rate` times per second, summarizes the frames recorded since its
+    last visit (newest, mean, min, max per field) together with the stats() dicts
+    of the sources added with add_source(), and writes the summary to `output`.
+    A slow terminal only delays the writer. Frames it did not get to before the
+    loop lapped the ring are counted as lost.
+
+    record() is meant for one thread; the writer reads the ring without locks and
+    drops frames that were overwritten while it copied them.
+    """
+
+    def __init__(self, name, fields, rate=TELEMETRY_RATE, output=TELEMETRY_OUTPUT, format=TELEMETRY_FORMAT,
+                 size=TELEMETRY_RING_SIZE):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown telemetry format: {format}")
+        self.name = name
+        self.fields = list(fields)
+        self.rate = rate
+        self.output = output
+        self.format = format
+        self.size = size
+        self.seq = 0  # Frames recorded so far
+        self.lost = 0
+        self.written = 0  # Summaries written
+        self.sources = []  # (name, stats function)
+        self._stride = len(self.fields) + 1  # Time, values
+        self._ring = array('d', bytes(8 * size * self._stride))
+        self._read = 0  # Newest seq the writer has summarized
+        self._last = None
+        self._stream = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_source(self, name, stats):
+        """Add the dict returned by `stats()` to every summary, under `name`."""
+        self.sources.append((name, stats))
+
+    def record(self, values, timestamp=None):
+        """Store a frame of len(fields) numbers, taken at `timestamp` (default: now)."""
+        seq = self.seq + 1
+        base = seq % self.size * self._stride
+        ring = self._ring
+        ring[base] = time.time() if timestamp is None else timestamp
+        ring[base + 1:base + self._stride] = values if type(values) is array else array('d', values)
+        self.seq = seq
+
+    def _frames(self):
+        """Return the times and values of the frames recorded since the last call, oldest first."""
+        newest = self.seq
+        first = max(self._read + 1, newest - self.size + 1)
+        lost = first - self._read - 1
+        ring, stride, size = self._ring, self._stride, self.size
+        frames = []
+        for seq in range(first, newest + 1):
+            base = seq % size * stride
+            frames.append(ring[base:base + stride])
+        # The loop may have lapped the oldest slots while they were copied (or be writing the next one)
+        overwritten = min(len(frames), max(0, self.seq - size + 2 - first))
+        if overwritten:
+            frames = frames[overwritten:]
+            lost += overwritten
+        self._read = newest
+        self.lost += lost
+        return frames, lost
+
+    def summary(self, now=None):
+        """Summarize the frames recorded since the last summary; the writer thread calls this."""
+        now = time.time() if now is None else now
+        elapsed = now - self._last if self._last is not None else 1.0 / self.rate
+        self._last = now
+        frames, lost = self._frames()
+        summary = {
+            'name': self.name,
+            'time': now,
+            'seq': self.seq,
+            'frames': len(frames),
+            'rate': (len(frames) + lost) / elapsed if elapsed > 0 else 0.0,
+            'lost': lost,
+            'fields': self.fields,
+            'newest': None,
+            'mean': None,
+            'min': None,
+            'max': None,
+        }
+        if frames:
+            columns = list(zip(*frames))[1:]
+            summary['newest'] = list(frames[-1][1:])
+            summary['mean'] = [sum(column) / len(column) for column in columns]
+            summary['min'] = [min(column) for column in columns]
+            summary['max'] = [max(column) for column in columns]
+        for name, stats in self.sources:
+            try:
+                summary[name] = stats()
+            except Exception as e:
+                summary[name] = {'error': str(e)}
+        return summary
+
+    def format_text(self, summary):
+        lines = [f"{self.name} #{summary['seq']} - {summary['frames']} frames ({summary['rate']:.1f} Hz)"
+                 + (f", {summary['lost']} lost" if summary['lost'] else "")]
+        if summary['newest'] is not None:
+            lines.append("  " + ", ".join(f"{field}: {value:g}" for field, value in zip(self.fields, summary['newest'])))
+        for name, _ in self.sources:
+            stats = summary[name]
+            lines.append(f"  {name} - " + ", ".join(
+                f"{key}: {value:.1f}" if isinstance(value, float) else f"{key}: {value}" for key, value in stats.items()))
+        return "\n".join(lines) + "\n"
+
+    def pack(self, summary):
+        """Encode a summary as BINARY_HEADER followed by the newest, mean, min and max values as doubles.
+
+        Sources are left out; a summary without frames has a field count of 0.
+        """
+        count = len(self.fields) if summary['newest'] is not None else 0
+        header = BINARY_HEADER.pack(BINARY_MAGIC, summary['time'], summary['frames'], summary['lost'],
+                                    summary['seq'], count)
+        if not count:
+            return header
+        return header + array('d', summary['newest'] + summary['mean'] + summary['min'] + summary['max']).tobytes()
+
+    def write(self, summary):
+        if self.format == 'binary':
+            self._stream.write(self.pack(summary))
+        elif self.format == 'jsonl':
+            self._stream.write(json.dumps(summary) + "\n")
+        else:
+            self._stream.write(self.format_text(summary))
+        self._stream.flush()
+        self.written += 1
+
+    def _open(self):
+        if self.output == '-':
+            return sys.stdout.buffer if self.format == 'binary' else sys.stdout
+        return open(self.output, 'ab' if self.format == 'binary' else 'a')
+
+    def run(self):
+        self._stream = self._open()
+        try:
+            while not self._stop.wait(1.0 / self.rate):
+                self.write(self.summary())
+            # Whatever was recorded after the last summary
+            if self.seq != self._read:
+                self.write(self.summary())
+        finally:
+            if self.output != '-':
+                self._stream.close()
+
+    def start(self):
+        """Start the writer thread; returns self."""
+        self._thread = threading.Thread(target=self.run, name=f"{self.name} telemetry", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """Write a last summary and stop the writer thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+def read_binary(data):
+    """Decode the summaries of a 'binary' telemetry file into (time, frames, lost, seq, newest, mean, min, max) tuples."""
+    summaries = []
+    offset = 0
+    while offset + BINARY_HEADER.size <= len(data):
+        magic, timestamp, frames, lost, seq, count = BINARY_HEADER.unpack_from(data, offset)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"Not a telemetry summary at byte {offset}")
+        offset += BINARY_HEADER.size
+        values = array('d', data[offset:offset + 8 * 4 * count])
+        offset += 8 * 4 * count
+        columns = [list(values[i * count:(i + 1) * count]) for i in range(4)] if count else [None] * 4
+        summaries.append((timestamp, frames, lost, seq, *columns))
+    return summaries
+
+def make_telemetry(name, fields):
+    """Return a started Telemetry for `fields` as configured by the environment, or None with TELEMETRY=off."""
+    if TELEMETRY == 'off':
+        return None
+    return Telemetry(name, fields).start()
+
+if __name__ == '__main__':
+    # Print the summaries of a binary telemetry file
+    with open(sys.argv[1], 'rb') as f:
+        for timestamp, frames, lost, seq, newest, mean, low, high in read_binary(f.read()):
+            print(f"{time.strftime('%H:%M:%S', time.localtime(timestamp))} #{seq} {frames} frames, {lost} lost, "
+                  f"newest {newest}")
@@ -0,0 +1,82 @@
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+from kuksa_client.grpc import VSSClient
+from kuksa_client.grpc import Datapoint
+
+# Set LATENCY_TRACE=1 on the controller and the car; the broker must know both signals
+LATENCY_TRACE = os.environ.get('LATENCY_TRACE', '0') == '1'
+# String signal carrying "seq;capture time;publish time;controller clock offset" with every published frame
+TRACE_SIGNAL = os.environ.get('TRACE_SIGNAL', 'Vehicle.Driver.Identifier.Subject')
+# String signal written and read back to measure the offset between the local and the broker clock
+CLOCK_PROBE_SIGNAL = os.environ.get('CLOCK_PROBE_SIGNAL', 'Vehicle.Driver.Identifier.Issuer')
+
+Trace = namedtuple('Trace', ['seq', 'capturedAt', 'publishedAt', 'clockOffset'])
+
+logger = logging.getLogger(__name__)
+
+def encode_trace(seq, captured_at, published_at, clock_offset):
+    """Times are wall-clock seconds of the publishing host; clock_offset is broker minus publisher clock."""
+    return f"{seq};{captured_at:.6f};{published_at:.6f};{clock_offset:.6f}"
+
+def decode_trace(value):
+    """Parse a TRACE_SIGNAL value, returning None if it is not a trace."""
+    try:
+        seq, captured_at, published_at, clock_offset = value.split(';')
+        return Trace(int(seq), float(captured_at), float(published_at), float(clock_offset))
+    except (AttributeError, ValueError):
+        return None
+
+class ClockSync(threading.Thread):
+    """Estimates the offset of the broker clock from the local clock (broker minus local).
+
+    Every `interval` seconds a token is written to CLOCK_PROBE_SIGNAL without a
+    timestamp, so the broker stamps it on arrival, and read back. As in NTP the
+    broker stamp is assumed to lie halfway through the write, and the sample with
+    the shortest round trip among the last `window` probes is used.
+    """
+
+    def __init__(self, ip, port, interval=10.0, window=8):
+        super().__init__(daemon=True)
+        self.ip = ip
+        self.port = port
+        self.interval = interval
+        self.samples = deque(maxlen=window)  # (round trip, offset)
+        self.offset = 0.0
+        self.rtt = None
+        self.isRunning = True
+        self._token = f"{socket.gethostname()}-{os.getpid()}"
+        self._probes = 0
+
+    def run(self):
+        while self.isRunning:
+            try:
+                with VSSClient(self.ip, self.port) as client:
+                    while self.isRunning:
+                        self.probe(client)
+                        time.sleep(self.interval)
+            except Exception as e:
+                logger.warning("Clock offset probe failed: %s", e)
+                time.sleep(self.interval)
+
+    def stop(self):
+        self.isRunning = False
+
+    def probe(self, client):
+        self._probes += 1
+        token = f"{self._token}-{self._probes}"
+        sent_at = time.time()
+        client.set_current_values({CLOCK_PROBE_SIGNAL: Datapoint(token)})
+        received_at = time.time()
+        datapoint = client.get_current_values([CLOCK_PROBE_SIGNAL]).get(CLOCK_PROBE_SIGNAL)
+        # Another host may have probed in between; only our own token carries our timing
+        if datapoint is not None and datapoint.value == token and datapoint.timestamp is not None:
+            self.add_sample(sent_at, received_at, datapoint.timestamp.timestamp())
+
+    def add_sample(self, sent_at, received_at, broker_time):
+        rtt = received_at - sent_at
+        self.samples.append((rtt, broker_time - (sent_at + received_at) / 2))
+        self.rtt, self.offset = min(self.samples)
@@ -0,0 +1,359 @@
+"""Transports that carry control signals from the controller to the car.
+
+Every transport offers the part of kuksa_client's VSSClient the scripts use
+(set_current_values, get_current_values, subscribe_current_values, used as a
+context manager), so the publishers and car_controller.py run unchanged on any of them:
+
+    kuksa   Through the KUKSA Data Broker (default).
+    udp     Direct datagrams from the controller to the car. Every packet carries a
+            sequence number and the car drops packets older than the newest it has seen.
+    memory  Within one process, for tests and benchmarks.
+
+With TRANSPORT_MIRROR=1 a controller on the udp or memory transport also copies
+what it sends into the broker, without waiting for it, so the signals stay
+observable in KUKSA while the car is driven over the fast path.
+"""
+import datetime
+import logging
+import os
+import queue
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from kuksa_client.grpc import Datapoint
+from kuksa_client.grpc import VSSClient
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT = os.environ.get('TRANSPORT', 'kuksa')
+# udp: address of the car (controller side) or address to listen on (car side)
+UDP_ADDRESS = os.environ.get('UDP_ADDRESS', '0.0.0.0:55556')
+TRANSPORT_MIRROR = os.environ.get('TRANSPORT_MIRROR', '0') == '1'
+
+def open_transport(ip, port, receive=False):
+    """Return the TRANSPORT configured by the environment; `ip` and `port` are those of the KUKSA broker.
+
+    `receive` selects the car side of point-to-point transports.
+    """
+    if TRANSPORT == 'kuksa':
+        return VSSClient(ip, port)
+    if TRANSPORT == 'udp':
+        host, _, udp_port = UDP_ADDRESS.rpartition(':')
+        transport = UdpTransport((host, int(udp_port)), bind=receive)
+    elif TRANSPORT == 'memory':
+        transport = MemoryTransport()
+    else:
+        raise ValueError(f"Unknown transport: {TRANSPORT}")
+    if TRANSPORT_MIRROR and not receive:
+        transport = MirrorTransport(transport, lambda: VSSClient(ip, port))
+    return transport
+
+def prewarm(client, paths=()):
+    """Finish setting up the connection of `client` before its first real call.
+
+    gRPC connects lazily, so the first published frame would otherwise also wait
+    for the TCP and HTTP/2 handshakes. For the broker one request is made here:
+    the datatypes of `paths`, which the client looks up before every set anyway
+    and which also fails early if the broker does not know a signal, or else the
+    server info. Transports without a connection to set up return at once.
+    """
+    if not isinstance(client, VSSClient):
+        return
+    if paths:
+        client.get_value_types(list(paths))
+    else:
+        client.get_server_info()
+
+def connect(ip, port, paths=(), receive=False):
+    """Open the configured transport, enter it and prewarm() it for `paths`.
+
+    Returns the entered client; the caller leaves it with client.__exit__(None, None, None).
+    Run it with startup.start_in_background() to connect while the joystick or racecar starts.
+    """
+    client = open_transport(ip, port, receive)
+    client.__enter__()
+    try:
+        prewarm(client, paths)
+    except BaseException:
+        client.__exit__(*sys.exc_info())
+        raise
+    return client
+
+def open_async_transport(ip, port):
+    """asyncio counterpart of open_transport() for the sending side."""
+    if TRANSPORT == 'kuksa':
+        from kuksa_client.grpc.aio import VSSClient as AsyncVSSClient
+        return AsyncVSSClient(ip, port)
+    return AsyncTransport(open_transport(ip, port))
+
+class SignalStore:
+    """Newest Datapoint of every signal, with subscriptions, as kept by the receiving side of a transport."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._subscribers = []
+
+    def store(self, updates):
+        with self._lock:
+            self._values.update(updates)
+            subscribers = list(self._subscribers)
+        for paths, inbox in subscribers:
+            changed = {path: datapoint for path, datapoint in updates.items() if path in paths}
+            if changed:
+                inbox.put(changed)
+
+    def lookup(self, paths):
+        with self._lock:
+            return {path: self._values.get(path) for path in paths}
+
+    def subscribe(self, paths):
+        paths = set(paths)
+        inbox = queue.Queue()
+        with self._lock:
+            # Like the broker, start with the current value of every known signal
+            initial = {path: self._values[path] for path in paths if path in self._values}
+            self._subscribers.append((paths, inbox))
+        if initial:
+            inbox.put(initial)
+        while True:
+            updates = inbox.get()
+            if updates is None:
+                return
+            yield updates
+
+    def close(self):
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for _, inbox in subscribers:
+            inbox.put(None)
+
+class MemoryTransport:
+    """In-process transport: every instance with the same `name` shares one SignalStore."""
+
+    _stores = {}
+    _storesLock = threading.Lock()
+
+    def __init__(self, name='jetracer'):
+        with MemoryTransport._storesLock:
+            self.store = MemoryTransport._stores.setdefault(name, SignalStore())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def set_current_values(self, updates):
+        stamp = datetime.datetime.now(datetime.timezone.utc)
+        self.store.store({path: datapoint if datapoint.timestamp is not None else Datapoint(datapoint.value, stamp)
+                          for path, datapoint in updates.items()})
+
+    def get_current_values(self, paths):
+        return self.store.lookup(paths)
+
+    def subscribe_current_values(self, paths):
+        return self.store.subscribe(paths)
+
+# magic, sender session, sequence number, send time, number of signals
+PACKET_HEADER = struct.Struct('<4sIQdH')
+PACKET_MAGIC = b'JRU2'
+# Tag and encoding of each value type; anything else is sent as a string (tag 's')
+VALUE_STRUCTS = {ord('?'): struct.Struct('<?'), ord('d'): struct.Struct('<d')}
+VALUE_FORMATS = {bool: b'?', float: b'd', int: b'd'}
+STRING_LENGTH = struct.Struct('<H')
+
+class UdpTransport:
+    """Point-to-point transport over UDP datagrams; one set_current_values call is one packet.
+
+    The sender numbers its packets within a random session ID. The receiver
+    (bind=True) drops every packet that is not newer than the newest one of the
+    same session, so a reordered or duplicated packet never overwrites a newer
+    value. Accepted signals are stamped with the send time of their packet, the
+    counterpart of the broker stamping values on arrival, so the car can measure jitter.
+    A restarted sender gets a new session and is accepted from its first packet.
+    """
+
+    def __init__(self, address, bind=False):
+        self.address = address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.session = random.getrandbits(32)
+        self.seq = 0
+        self.received = 0
+        self.dropped = 0  # Packets older than one already received
+        self.sent = 0
+        self._paths = {}  # path -> encoded name, cached per path
+        self._store = None
+        if bind:
+            self.socket.bind(address)
+            self._store = SignalStore()
+            self._lastSeq = {}
+            threading.Thread(target=self._receive, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+        self.socket.close()
+
+    def encode(self, updates):
+        self.seq += 1
+        parts = [PACKET_HEADER.pack(PACKET_MAGIC, self.session, self.seq, time.time(), len(updates))]
+        for path, datapoint in updates.items():
+            name = self._paths.get(path)
+            if name is None:
+                encoded = path.encode()
+                name = self._paths[path] = STRING_LENGTH.pack(len(encoded)) + encoded
+            parts.append(name)
+            value = datapoint.value
+            tag = VALUE_FORMATS.get(type(value))
+            if tag is None:
+                encoded = str(value).encode()
+                parts.append(b's' + STRING_LENGTH.pack(len(encoded)) + encoded)
+            else:
+                parts.append(tag + VALUE_STRUCTS[tag[0]].pack(value))
+        return b''.join(parts)
+
+    @staticmethod
+    def decode(packet):
+        """Return (session, seq, send time, {path: value}) of a packet."""
+        magic, session, seq, sent, count = PACKET_HEADER.unpack_from(packet)
+        if magic != PACKET_MAGIC:
+            raise ValueError("not a transport packet")
+        offset = PACKET_HEADER.size
+        values = {}
+        for _ in range(count):
+            (length,) = STRING_LENGTH.unpack_from(packet, offset)
+            offset += STRING_LENGTH.size
+            path = packet[offset:offset + length].decode()
+            offset += length
+            kind = packet[offset]
+            offset += 1
+            if kind == ord('s'):
+                (length,) = STRING_LENGTH.unpack_from(packet, offset)
+                offset += STRING_LENGTH.size
+                values[path] = packet[offset:offset + length].decode()
+                offset += length
+            else:
+                value_struct = VALUE_STRUCTS[kind]
+                (values[path],) = value_struct.unpack_from(packet, offset)
+                offset += value_struct.size
+        return session, seq, sent, values
+
+    def set_current_values(self, updates):
+        self.socket.sendto(self.encode(updates), self.address)
+        self.sent += 1
+
+    def get_current_values(self, paths):
+        return self._store.lookup(paths)
+
+    def subscribe_current_values(self, paths):
+        return self._store.subscribe(paths)
+
+    def _receive(self):
+        while True:
+            try:
+                packet = self.socket.recv(65535)
+            except OSError:
+                return  # Socket closed
+            try:
+                session, seq, sent, values = self.decode(packet)
+            except (ValueError, KeyError, struct.error, UnicodeDecodeError):
+                continue
+            if seq <= self._lastSeq.get(session, 0):
+                self.dropped += 1
+                continue
+            self._lastSeq[session] = seq
+            self.received += 1
+            stamp = datetime.datetime.fromtimestamp(sent, datetime.timezone.utc)
+            self._store.store({path: Datapoint(value, stamp) for path, value in values.items()})
+
+class MirrorTransport:
+    """Sends through `primary` and copies every update into a second client in the background.
+
+    Updates waiting for the mirror are merged per signal, so a slow or unreachable
+    mirror only loses intermediate values and never delays the primary transport.
+    """
+
+    def __init__(self, primary, open_mirror):
+        self.primary = primary
+        self.openMirror = open_mirror
+        self.mirrored = 0
+        self.failed = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._running = False
+
+    def __enter__(self):
+        self.primary.__enter__()
+        self._running = True
+        threading.Thread(target=self._mirror, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._running = False
+        self._ready.set()
+        return self.primary.__exit__(*exc)
+
+    def set_current_values(self, updates):
+        self.primary.set_current_values(updates)
+        with self._lock:
+            self._pending.update(updates)
+        self._ready.set()
+
+    def get_current_values(self, paths):
+        return self.primary.get_current_values(paths)
+
+    def subscribe_current_values(self, paths):
+        return self.primary.subscribe_current_values(paths)
+
+    def _mirror(self):
+        try:
+            with self.openMirror() as mirror:
+                self._forward(mirror)
+        except Exception as e:
+            logger.error("Mirroring to KUKSA stopped: %s", e)
+
+    def _forward(self, mirror):
+        while self._running:
+            self._ready.wait()
+            self._ready.clear()
+            with self._lock:
+                updates, self._pending = self._pending, {}
+            if not updates:
+                continue
+            try:
+                # Let the broker stamp the values on arrival
+                mirror.set_current_values({path: Datapoint(datapoint.value) for path, datapoint in updates.items()})
+                self.mirrored += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Mirroring to KUKSA failed: %s", e)
+
+class AsyncTransport:
+    """asyncio view of a transport whose calls do not block (udp, memory, or mirrored)."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def __aenter__(self):
+        self.transport.__enter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.transport.__exit__(*exc)
+
+    async def set_current_values(self, updates):
+        self.transport.set_current_values(updates)
+
+    async def get_current_values(self, paths):
+        return self.transport.get_current_values(paths)
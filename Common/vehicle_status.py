@@ -0,0 +1,209 @@
+"""Vehicle status sent from the car back to the controller.
+
+The car publishes what it actually applied and how its control loop is doing as
+the STATUS_SIGNALS of fleet.py, all of them in one request per period. The
+controller follows them with a subscription and compares them to what it commands.
+Both sides use a connection of their own for this, so the status never queues
+behind (or in front of) the control signals.
+"""
+import logging
+import threading
+import time
+from kuksa_client.grpc import VSSClient
+from histogram import LatencyHistogram
+from signal_schema import PublishBuffer
+from transport import TRANSPORT, connect, prewarm
+
+# Slot of each status signal, in the order of fleet.STATUS_SIGNALS
+APPLIED_THROTTLE, APPLIED_STEERING, LOOP_RATE, LOOP_JITTER, LOOP_BUSY, COMMAND_AGE, WATCHDOG = range(7)
+
+logger = logging.getLogger(__name__)
+
+def connect_status(ip, port, paths=()):
+    """Open the connection the status travels on, like transport.connect().
+
+    The status goes through the KUKSA broker at `ip`:`port` unless TRANSPORT=memory;
+    the udp transport only carries controls from the controller to the car.
+    """
+    if TRANSPORT != 'udp':
+        return connect(ip, port, paths)
+    client = VSSClient(ip, port)
+    client.__enter__()
+    try:
+        prewarm(client, paths)
+    except BaseException:
+        client.__exit__(None, None, None)
+        raise
+    return client
+
+class StatusPublisher:
+    """Publishes the car's status `rate` times per second from a thread of its own, all slots in one request.
+
+    `sample(values)` fills the status slot array from the state the control loop
+    leaves behind; it must only read, so the control loop never waits for the
+    status. Periods are scheduled against absolute deadlines, and periods a slow
+    broker overran are skipped rather than sent late, so a slow broker lowers the
+    status rate instead of building a backlog. `connection` is a Future of a client
+    from connect_status(), as returned by startup.start_in_background().
+    """
+
+    def __init__(self, connection, schema, rate=10.0):
+        self.connection = connection
+        self.schema = schema
+        self.rate = rate
+        self.publishBuffer = PublishBuffer(schema)
+        self.sample = None
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0     # Periods skipped because a request took longer than a period
+        self.isFailing = False
+        self.rtt = LatencyHistogram(max_seconds=10.0)
+        self._stop = threading.Event()
+        self._lastStats = None
+
+    def start(self, sample):
+        """Start publishing the status that `sample(values)` writes into a slot array."""
+        self.sample = sample
+        threading.Thread(target=self.run, name='Status publisher', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        try:
+            client = self.connection.result()
+        except Exception as e:
+            logger.error("Cannot connect for the vehicle status: %s", e)
+            return
+        values = self.schema.values()
+        period = 1.0 / self.rate
+        deadline = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                self.sample(values)
+                start = time.monotonic()
+                try:
+                    client.set_current_values(self.publishBuffer.request(values))
+                    self.sent += 1
+                    if self.isFailing:
+                        self.isFailing = False
+                        logger.info("Vehicle status publishing resumed")
+                except Exception as e:
+                    self.failed += 1
+                    if not self.isFailing:
+                        self.isFailing = True
+                        logger.warning("Publishing the vehicle status failed: %s", e)
+                now = time.monotonic()
+                self.rtt.record(now - start)
+
+                deadline += period
+                if now > deadline:
+                    missed = int((now - deadline) / period) + 1
+                    self.skipped += missed
+                    deadline += missed * period
+                self._stop.wait(deadline - now)
+        finally:
+            client.__exit__(None, None, None)
+
+    def stats(self):
+        """Return the achieved status rate (Hz), the counters and the request round trip (ms) since the previous call."""
+        now = time.monotonic()
+        last_now, last_sent = self._lastStats or (now, self.sent)
+        self._lastStats = (now, self.sent)
+        rtt, self.rtt = self.rtt, LatencyHistogram(max_seconds=10.0)
+        rtt = rtt.summary()
+        return {
+            'rate': (self.sent - last_sent) / (now - last_now) if now > last_now else 0.0,
+            'sent': self.sent,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'rtt_p50_ms': rtt['p50_ms'],
+            'rtt_p99_ms': rtt['p99_ms'],
+        }
+
+class StatusMonitor:
+    """Follows the status the car publishes through a subscription, on a thread of its own.
+
+    The newest values are decoded into a slot array. The status counts as lost once
+    nothing arrived for `timeout` seconds; the car publishes every period even when
+    nothing changed, so silence means the car or its link is gone. A failed
+    subscription is retried every `retry` seconds. `connection` is a Future of a
+    client from connect_status().
+    """
+
+    def __init__(self, connection, schema, timeout=1.0, retry=5.0):
+        self.connection = connection
+        self.schema = schema
+        self.timeout = timeout
+        self.retry = retry
+        self.values = schema.values()
+        self.receivedAt = None  # Monotonic time of the newest update
+        self.updates = 0
+        self._known = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._lastStats = None
+
+    def start(self):
+        threading.Thread(target=self.run, name='Status monitor', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        try:
+            client = self.connection.result()
+        except Exception as e:
+            logger.error("Cannot connect for the vehicle status: %s", e)
+            return
+        while not self._stop.is_set():
+            try:
+                for updates in client.subscribe_current_values(self.schema.paths):
+                    with self._lock:
+                        self._known |= self.schema.decode(updates, self.values)
+                        self.receivedAt = time.monotonic()
+                        self.updates += 1
+                    if self._stop.is_set():
+                        return
+            except Exception as e:
+                logger.warning("Vehicle status subscription failed: %s", e)
+            self._stop.wait(self.retry)
+
+    def current(self):
+        """Return (a copy of the status slot array, its age in seconds), or (None, None) before every signal arrived."""
+        with self._lock:
+            if self._known != self.schema.allSlots:
+                return None, None
+            return self.values[:], time.monotonic() - self.receivedAt
+
+    def is_lost(self, age):
+        return age is None or age > self.timeout
+
+    def stats(self, throttle=None, steering=None):
+        """Return the car's status next to the commanded `throttle` and `steering`, with the update rate and status age."""
+        now = time.monotonic()
+        last_now, last_updates = self._lastStats or (now, self.updates)
+        self._lastStats = (now, self.updates)
+        values, age = self.current()
+        stats = {'updates': (self.updates - last_updates) / (now - last_now) if now > last_now else 0.0,
+                 'lost': self.is_lost(age)}
+        if values is None:
+            return stats
+        stats.update({
+            'throttle': values[APPLIED_THROTTLE],
+            'steering': values[APPLIED_STEERING],
+        })
+        if throttle is not None:
+            stats['throttle_cmd'] = throttle
+        if steering is not None:
+            stats['steering_cmd'] = steering
+        stats.update({
+            'loop_rate': values[LOOP_RATE],
+            'jitter_p99_ms': values[LOOP_JITTER],
+            'busy_p99_ms': values[LOOP_BUSY],
+            'command_age_ms': values[COMMAND_AGE] * 1000,
+            'watchdog': bool(values[WATCHDOG]),
+            'age_ms': age * 1000,
+        })
+        return stats
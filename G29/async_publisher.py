@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from kuksa_client.grpc import Datapoint
+from control_frame import ControlFrame
+from signal_schema import PublishBuffer
+from tracing import TRACE_SIGNAL, encode_trace
+from transport import open_async_transport
+from startup import startup_profile
+
+class LatestSlot:
+    """Single-slot queue where a newer update replaces the one still waiting.
+
+    Updates are bit masks of the slots to send and are merged, so a superseded
+    frame never hides a signal change that only it carried (as can happen with
+    change-based publishing); the merged slots are sent with the newest frame's values.
+    """
+
+    def __init__(self):
+        self._mask = 0
+        self._frame = None
+        self._ready = asyncio.Event()
+        self.dropped = 0  # Frames superseded before they were sent
+
+    def put(self, mask, frame=None):
+        """Store the slots in `mask`; `frame` is the (seq, capture time, slot values) of the frame they came from."""
+        if self._mask:
+            self.dropped += 1
+        self._mask |= mask
+        self._frame = frame
+        self._ready.set()
+
+    def wake(self):
+        """Wake a waiting get(), which then returns a mask of 0 if nothing was put."""
+        self._ready.set()
+
+    async def get(self):
+        """Return (mask, frame) of the newest update, or (0, frame) after wake()."""
+        await self._ready.wait()
+        self._ready.clear()
+        mask, self._mask = self._mask, 0
+        return mask, self._frame
+
+class AsyncPublisher:
+    """Publishes ControlFrames to the KUKSA Data Broker from two asyncio tasks.
+
+    The input task reads the newest frame from a FrameBuffer every `interval`
+    seconds and puts the slots to send (all of a new frame, or those a
+    publish_filter.SlotChangeFilter `change_filter` selects) into a LatestSlot; the
+    publish task sends them with at most `max_in_flight` RPCs outstanding. Requests
+    come from a PublishBuffer of `schema` per RPC slot, since the asyncio client
+    reads the Datapoints until its RPC completes. A slow RPC therefore
+    delays nothing but itself, and stale frames are dropped instead of queued.
+    Keep `max_in_flight` at 1 if updates must reach the broker in order. With a
+    `clock_sync` every RPC also carries a TRACE_SIGNAL for latency tracing. With a
+    `rate_control` (rate_control.RateController) every RPC reports its round trip
+    and outcome to it, and its interval replaces `interval`. With a `source_running`
+    callable the publisher also stops once it returns False (the reader stopped).
+    With a `telemetry` (telemetry.Telemetry) the frame behind every successful RPC
+    is recorded into it; stats() is meant to be one of its sources.
+    stop() must be called on the publisher's event loop; other threads go through
+    loop.call_soon_threadsafe().
+    """
+
+    def __init__(self, client, buffer, schema, interval, change_filter=None, max_in_flight=1,
+                 clock_sync=None, rate_control=None, source_running=None, telemetry=None):
+        self.client = client
+        self.buffer = buffer
+        self.schema = schema
+        self.publishBuffers = [PublishBuffer(schema) for _ in range(max_in_flight)]
+        self.interval = interval
+        self.change_filter = change_filter
+        self.maxInFlight = max_in_flight
+        self.clock_sync = clock_sync
+        self.rate_control = rate_control
+        self.source_running = source_running
+        self.telemetry = telemetry
+        self.isRunning = False
+        self.frame = ControlFrame()
+        self.slot = None
+        self._slots = None
+        self._tasks = None
+        self.inFlight = 0
+        self.published = 0
+        self.failed = 0
+        self.isFailing = False
+        self.latencies = deque(maxlen=1024)  # Seconds per set_current_values, most recent RPCs
+        self._lastStats = (time.monotonic(), 0)
+
+    async def run(self):
+        """Run the input and publish tasks until stop() is called."""
+        self.isRunning = True
+        # Created here so they belong to the running event loop
+        self.slot = LatestSlot()
+        self._slots = asyncio.Semaphore(self.maxInFlight)
+        self._tasks = set()
+        await asyncio.gather(self._input_loop(), self._publish_loop())
+
+    def stop(self):
+        self.isRunning = False
+        if self.slot is not None:
+            self.slot.wake()
+
+    async def _input_loop(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while self.isRunning:
+            if self.source_running is not None and not self.source_running():
+                self.isRunning = False
+                break
+            is_new_frame = self.buffer.read(self.frame)
+            if self.change_filter is not None:
+                mask = self.change_filter.changes(self.frame.values)
+            elif is_new_frame:
+                mask = self.schema.allSlots
+            else:
+                mask = 0
+            if mask:
+                self.slot.put(mask, (self.frame.seq, self.frame.timestamp, self.frame.values[:]))
+
+            deadline += self.rate_control.interval if self.rate_control is not None else self.interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+        # Wake the publish task so it can see that we stopped
+        self.slot.wake()
+
+    async def _publish_loop(self):
+        while self.isRunning:
+            # Wait for a free RPC slot first, so frames arriving meanwhile are merged in the LatestSlot
+            await self._slots.acquire()
+            mask, frame = await self.slot.get()
+            if not mask:
+                self._slots.release()
+                continue
+            task = asyncio.ensure_future(self._send(mask, frame))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+
+    async def _send(self, mask, frame):
+        self.inFlight += 1
+        # The semaphore keeps at most max_in_flight sends, so a buffer is always free
+        publish_buffer = self.publishBuffers.pop()
+        start = time.perf_counter()
+        try:
+            seq, captured_at, values = frame
+            datapoints = publish_buffer.request(values, mask)
+            if self.clock_sync is not None:
+                datapoints = {**datapoints, TRACE_SIGNAL: Datapoint(
+                    encode_trace(seq, captured_at, time.time(), self.clock_sync.offset))}
+            await self.client.set_current_values(datapoints)
+        except Exception as e:
+            self.failed += 1
+            # Only the first failure is logged; stats() counts them for the telemetry summaries
+            if not self.isFailing:
+                self.isFailing = True
+                logging.warning("Publishing to KUKSA failed: %s", e)
+            if self.rate_control is not None:
+                self.rate_control.record(time.perf_counter() - start, ok=False)
+        else:
+            self.published += 1
+            if self.isFailing:
+                self.isFailing = False
+                logging.info("Publishing to KUKSA resumed")
+            rtt = time.perf_counter() - start
+            self.latencies.append(rtt)
+            if self.rate_control is not None:
+                self.rate_control.record(rtt)
+            startup_profile.complete('first_frame')
+            if self.telemetry is not None:
+                self.telemetry.record(values, captured_at)
+        finally:
+            self.publishBuffers.append(publish_buffer)
+            self.inFlight -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Return publish rate since the previous call, counters and RPC latency percentiles in ms."""
+        now = time.monotonic()
+        last_now, last_published = self._lastStats
+        self._lastStats = (now, self.published)
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+        return {
+            'rate': (self.published - last_published) / max(now - last_now, 1e-9),
+            'published': self.published,
+            'dropped': self.slot.dropped if self.slot else 0,
+            'failed': self.failed,
+            'inFlight': self.inFlight,
+            'p50': percentile(0.5),
+            'p90': percentile(0.9),
+            'p99': percentile(0.99),
+        }
+
+async def publish_to_kuksa(ip, port, buffer, schema, interval, change_filter=None, max_in_flight=1,
+                           clock_sync=None, rate_control=None, source_running=None, on_start=None, telemetry=None):
+    """Connect to the KUKSA Data Broker with the asyncio client and publish frames from `buffer` until stopped.
+
+    `on_start(publisher)` is called on the event loop before publishing starts, so the
+    caller can keep the AsyncPublisher to stop it from another thread. With a
+    `telemetry` the published frames go into it and its summaries show the
+    publisher's stats as 'Publisher'.
+    """
+    async with open_async_transport(ip, port) as client:
+        startup_profile.mark('connected')
+        publisher = AsyncPublisher(client, buffer, schema, interval, change_filter, max_in_flight, clock_sync,
+                                   rate_control, source_running, telemetry)
+        if telemetry is not None:
+            telemetry.add_source('Publisher', publisher.stats)
+        if on_start is not None:
+            on_start(publisher)
+        await publisher.run()
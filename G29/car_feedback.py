@@ -0,0 +1,75 @@
+import logging
+import threading
+from control_frame import ControlFrame, STEERING
+from vehicle_status import APPLIED_STEERING, WATCHDOG
+
+class RumbleFeedback:
+    """Lets the driver feel the car through the rumble motors of the wheel or gamepad.
+
+    `rate` times per second the steering the car applied (from a StatusMonitor)
+    is compared with the newest sample in `buffer`. The low-frequency motor runs
+    with a strength that grows with the difference, up to full at `full_error`,
+    so the wheel shakes while the car lags behind it (slew limits, a slow link).
+    Both motors run at full strength once a status that had arrived is lost, and
+    while the car's watchdog holds the throttle at zero. Before the first status
+    (or with a car that sends none) the motors stay off. Each rumble lasts two
+    periods, so the motors stop by themselves if this thread stops.
+
+    Needs pygame 2.0.2 or later and a device with rumble support; otherwise it
+    logs that once and does nothing.
+    """
+
+    # Strengths below this stop the motors
+    MIN_STRENGTH = 0.1
+
+    def __init__(self, joystick, monitor, buffer, full_error=0.5, rate=10.0):
+        self.joystick = joystick
+        self.monitor = monitor
+        self.buffer = buffer
+        self.fullError = full_error
+        self.period = 1.0 / rate
+        self.frame = ControlFrame()
+        self.isRumbling = False
+        self._stop = threading.Event()
+
+    def strength(self):
+        """Return the (low, high) motor strengths for the current status and wheel sample."""
+        values, age = self.monitor.current()
+        if values is None:
+            return 0.0, 0.0  # No status received yet
+        if self.monitor.is_lost(age) or values[WATCHDOG]:
+            return 1.0, 1.0
+        self.buffer.read(self.frame)
+        error = abs(self.frame.values[STEERING] - values[APPLIED_STEERING])
+        low = min(1.0, error / self.fullError) if self.fullError > 0 else 0.0
+        return (low, 0.0) if low >= self.MIN_STRENGTH else (0.0, 0.0)
+
+    def start(self):
+        threading.Thread(target=self.run, name='Rumble feedback', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        rumble = getattr(self.joystick, 'rumble', None)
+        if rumble is None:
+            logging.info("Rumble feedback needs pygame 2.0.2 or later")
+            return
+        duration = int(2000 * self.period)
+        checked = False
+        try:
+            while not self._stop.wait(self.period):
+                low, high = self.strength()
+                if low or high:
+                    if not rumble(low, high, duration) and not checked:
+                        logging.info("%s has no rumble motors, feedback is off", self.joystick.get_name())
+                        return
+                    checked = True
+                    self.isRumbling = True
+                elif self.isRumbling:
+                    self.joystick.stop_rumble()
+                    self.isRumbling = False
+        finally:
+            if self.isRumbling:
+                self.joystick.stop_rumble()
@@ -0,0 +1,171 @@
+import time
+from array import array
+from multiprocessing import shared_memory
+
+# Slot of each control in ControlFrame.values (buttons are stored as 0.0 / 1.0)
+THROTTLE = 0
+CLUTCH = 1
+BRAKE = 2
+STEERING = 3
+HANDBRAKE = 4
+REVERSE = 5
+ENTER = 6
+EXIT = 7
+SLOT_COUNT = 8
+SLOT_NAMES = ('Throttle', 'Clutch', 'Brake', 'Steering', 'Handbrake', 'Reverse', 'Enter', 'Exit')
+
+class ControlFrame:
+    """One consistent sample of all controls, with its sequence number and capture time."""
+
+    __slots__ = ('seq', 'timestamp', 'values')
+
+    def __init__(self):
+        self.seq = 0
+        self.timestamp = 0.0
+        self.values = array('d', bytes(8 * SLOT_COUNT))
+
+class FrameBuffer:
+    """Hands the newest ControlFrame from the reader thread to the publisher without locks.
+
+    This is a seqlock for a single writer: the counter is odd while a write is in
+    progress, so a reader that saw the counter change (or saw it odd) retries and
+    never returns a frame that mixes two samples. Writers never wait.
+    """
+
+    __slots__ = ('_counter', '_timestamp', '_values')
+
+    def __init__(self):
+        self._counter = 0
+        self._timestamp = 0.0
+        self._values = array('d', bytes(8 * SLOT_COUNT))
+
+    def write(self, values, timestamp):
+        """Store a new sample; `values` is a sequence of SLOT_COUNT numbers."""
+        self._counter += 1
+        # Slot by slot into the preallocated array: no temporary array per sample
+        v = self._values
+        v[0], v[1], v[2], v[3], v[4], v[5], v[6], v[7] = values
+        self._timestamp = timestamp
+        self._counter += 1
+
+    def read(self, frame):
+        """Copy the newest sample into `frame`. Return False if it is the frame already held."""
+        while True:
+            counter = self._counter
+            if counter & 1:
+                time.sleep(0)  # Let the writer thread finish instead of spinning on the GIL
+                continue
+            seq = counter >> 1
+            if seq == frame.seq:
+                return False
+            frame.values[:] = self._values
+            frame.timestamp = self._timestamp
+            if self._counter == counter:
+                frame.seq = seq
+                return True
+            time.sleep(0)
+
+class SharedFrameRing:
+    """Hands ControlFrames from a sampler process to other processes through shared memory.
+
+    A ring of `size` frames in a multiprocessing.shared_memory block, written by one
+    process and read by any number, without locks or pickling: frames are stored as
+    raw doubles. Like FrameBuffer, every slot is a seqlock, its sequence number
+    stored before and after the values, and the header holds the sequence number of
+    the newest frame. A reader copying a slot is only disturbed if the writer laps
+    the whole ring meanwhile, so it practically never retries, and a reader that
+    needs every frame can catch up with read_next(). This relies on stores becoming
+    visible to other processes in program order, as they do on x86.
+
+    Create it with no `name` in the owning process and attach to it by name elsewhere.
+    The header also carries a stop flag and the sampler's counters.
+    """
+
+    HEADER = 8  # Newest seq, stop flag, samples, overruns, CPU seconds, ring size, 2 spare
+    SLOT = SLOT_COUNT + 3  # Seq, timestamp, values, seq again
+
+    def __init__(self, name=None, size=64):
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=8 * (self.HEADER + size * self.SLOT))
+            self._view = self._memory.buf.cast('d')
+            self._view[5] = size
+        else:
+            # Processes started by multiprocessing share the creator's resource tracker, so attaching
+            # registers nothing new and only the creator's unlink releases the block
+            self._memory = shared_memory.SharedMemory(name=name)
+            self._view = self._memory.buf.cast('d')
+        self.size = int(self._view[5])
+        self.lost = 0  # Frames read_next() skipped because the writer had already overwritten them
+
+    @property
+    def name(self):
+        return self._memory.name
+
+    def write(self, values, timestamp):
+        """Store a new sample; `values` is a sequence of SLOT_COUNT numbers."""
+        view = self._view
+        seq = int(view[0]) + 1
+        base = self.HEADER + seq % self.size * self.SLOT
+        view[base] = seq
+        view[base + 1] = timestamp
+        # Slot by slot into the shared block, as in FrameBuffer.write()
+        i = base + 2
+        view[i], view[i + 1], view[i + 2], view[i + 3], view[i + 4], view[i + 5], view[i + 6], view[i + 7] = values
+        view[base + self.SLOT - 1] = seq
+        view[0] = seq
+
+    def read(self, frame):
+        """Copy the newest sample into `frame`. Return False if it is the frame already held."""
+        while True:
+            seq = int(self._view[0])
+            if seq == frame.seq:
+                return False
+            if self._copy(seq, frame):
+                return True
+
+    def read_next(self, frame):
+        """Copy the sample after `frame` into it, or the oldest one still in the ring. Return False if there is none yet."""
+        while True:
+            newest = int(self._view[0])
+            if newest <= frame.seq:
+                return False
+            seq = max(frame.seq + 1, newest - self.size + 1)
+            skipped = seq - frame.seq - 1
+            if self._copy(seq, frame):
+                self.lost += skipped
+                return True
+
+    def _copy(self, seq, frame):
+        view = self._view
+        base = self.HEADER + seq % self.size * self.SLOT
+        if view[base + self.SLOT - 1] != seq:
+            return False  # Still being written, or already overwritten
+        memoryview(frame.values)[:] = view[base + 2:base + 2 + SLOT_COUNT]
+        frame.timestamp = view[base + 1]
+        if view[base] != seq:
+            return False  # Overwritten while it was copied
+        frame.seq = seq
+        return True
+
+    def stop(self):
+        """Ask the sampler process to stop."""
+        self._view[1] = 1.0
+
+    @property
+    def stopped(self):
+        return self._view[1] != 0.0
+
+    def publish_counters(self, samples, overruns, cpu_time):
+        """Store the sampler's counters for counters() in other processes."""
+        self._view[2:5] = array('d', (samples, overruns, cpu_time))
+
+    def counters(self):
+        """Return the (samples, overruns, CPU seconds) last published by the sampler."""
+        return int(self._view[2]), int(self._view[3]), self._view[4]
+
+    def close(self, unlink=False):
+        """Detach from the shared memory; the creating process passes `unlink` to free it."""
+        self._view.release()
+        self._memory.close()
+        if unlink:
+            self._memory.unlink()
@@ -0,0 +1,197 @@
+import json
+import math
+from control_frame import SLOT_COUNT
+
+# Full-scale reading of an SDL axis (32767 / 32768); pedals at rest report this value
+AXIS_MAX = 0.999969482421875
+
+# Declarative input device profiles. 'slots' lists, in ControlFrame slot order
+# (throttle, clutch, brake, steering, handbrake, reverse, enter, exit), where each
+# control is read from and how its raw reading is transformed:
+#   value = clamp(scale * curve(deadzone(invert(raw) + offset)), min, max)
+# rounded to 'precision' decimals when given. Omitted fields leave the reading unchanged.
+PROFILES = {
+    'g29': {
+        'name': 'Logitech G29',
+        'slots': [
+            {'axis': 2, 'invert': True, 'offset': AXIS_MAX, 'scale': 0.2, 'min': 0.0},  # Throttle
+            {'axis': 1, 'invert': True, 'offset': AXIS_MAX, 'min': 0.0},  # Clutch
+            {'axis': 3, 'invert': True, 'offset': AXIS_MAX, 'min': 0.0},  # Brake
+            {'axis': 0, 'scale': 5.0},  # Steering
+            {'button': 4},  # Handbrake
+            {'button': 5},  # Reverse
+            {'button': 6},  # Enter
+            {'button': 7},  # Exit
+        ],
+    },
+    'ps4': {
+        'name': 'Sony PS4 controller',
+        'precision': 3,
+        'slots': [
+            {'axis': 5, 'offset': 1.0, 'scale': 0.5},  # Throttle (R2)
+            {'axis': 2, 'offset': 1.0, 'scale': 0.5},  # Clutch (L2)
+            {'axis': 4, 'offset': 1.0, 'scale': 0.5},  # Brake
+            {'axis': 1, 'invert': True, 'scale': 420.0},  # Steering (left stick)
+            {'button': 3},  # Handbrake
+            {'button': 2},  # Reverse
+            {'button': 1},  # Enter
+            {'button': 0},  # Exit
+        ],
+    },
+    # PS4 controller with unprocessed axis readings, as sent by Test_File_PS4/ps4.py
+    'ps4_raw': {
+        'name': 'Sony PS4 controller (raw axes)',
+        'slots': [
+            {'axis': 5},  # Throttle (R2)
+            {'axis': 2},  # Clutch (L2)
+            {'axis': 4},  # Brake (right stick Y)
+            {'axis': 1},  # Steering (left stick X)
+            {'button': 3},  # Handbrake (L1)
+            {'button': 2},  # Reverse (circle)
+            {'button': 1},  # Enter (cross)
+            {'button': 0},  # Exit (triangle)
+        ],
+    },
+}
+
+def load_profile(name, calibration=None):
+    """Return the profile called `name` from PROFILES, or load it from a JSON file of the same layout.
+
+    With a `calibration` (see load_calibration) the measured rest offsets and deadzones are applied.
+    """
+    if name in PROFILES:
+        profile = PROFILES[name]
+    else:
+        with open(name) as profile_file:
+            profile = json.load(profile_file)
+    return calibrate(profile, calibration) if calibration else profile
+
+def load_calibration(path):
+    """Return the calibration file written by Test_File_PS4/ps4_test.py, or an empty dict if `path` is empty.
+
+    It holds, per axis number, the reading at rest ('rest'), the deadzone that
+    hides its noise ('deadzone') and the measured noise, plus the device's update
+    rate and the recommended 'sample_rate' (both null if the rate could not be
+    measured).
+    """
+    if not path:
+        return {}
+    with open(path) as calibration_file:
+        return json.load(calibration_file)
+
+def calibrate(profile, calibration):
+    """Return a copy of `profile` with the rest offset and deadzone of every calibrated axis.
+
+    The offset moves the measured rest reading to zero after `invert` (replacing
+    guessed constants such as AXIS_MAX), and the deadzone hides the noise around it.
+    """
+    axes = calibration.get('axes', {})
+    slots = []
+    for slot in profile['slots']:
+        measured = axes.get(str(slot['axis'])) if 'axis' in slot else None
+        if measured is not None:
+            rest = measured['rest']
+            slot = dict(slot, offset=rest if slot.get('invert') else -rest, deadzone=measured['deadzone'])
+        slots.append(slot)
+    return dict(profile, slots=slots)
+
+class DeviceProfile:
+    """A device profile compiled into one transform for all controls.
+
+    `read` and `transform` run a Python function generated from the profile, with
+    every constant folded in and unused stages left out, which is the cheapest way
+    to handle one joystick per tick. `transform_many` applies the same profile to
+    many rows of readings (several joysticks, or a recorded stream) in a single
+    vectorized NumPy pass; NumPy is only imported by its first call, so starting a
+    controller does not wait for it.
+    """
+
+    def __init__(self, profile):
+        slots = profile['slots']
+        if len(slots) != SLOT_COUNT:
+            raise ValueError(f"profile '{profile.get('name')}' has {len(slots)} slots, expected {SLOT_COUNT}")
+        self.name = profile.get('name', '')
+        self.slots = slots
+        self.precision = profile.get('precision')
+        self.transform = self._compile([f"raw[{i}]" for i in range(SLOT_COUNT)], ('raw',))
+        self.read = None
+        self._vectors = None
+
+    def bind(self, joystick):
+        """Compile `read` for `joystick`, so each tick reads every control once with no lookups."""
+        # Indices go through int() like the other fields through float(), since they are pasted into source
+        inputs = [f"button({int(slot['button'])})" if 'button' in slot else f"axis({int(slot['axis'])})"
+                  for slot in self.slots]
+        self.read = self._compile(inputs, (), {'axis': joystick.get_axis, 'button': joystick.get_button})
+        return self
+
+    def _compile(self, inputs, arguments, namespace=None):
+        """Generate a function that returns the transformed value of every slot as a tuple."""
+        lines = []
+        results = []
+        for index, (slot, source) in enumerate(zip(self.slots, inputs)):
+            if 'button' in slot:
+                results.append(f"1.0 if {source} else 0.0")
+                continue
+            expression = f"-{source}" if slot.get('invert') else source
+            if slot.get('offset'):
+                expression = f"({expression} + {float(slot['offset'])!r})"
+            if slot.get('deadzone') or slot.get('curve', 1.0) != 1.0:
+                # These stages need the intermediate value more than once
+                value = f"v{index}"
+                lines.append(f"{value} = {expression}")
+                if slot.get('deadzone'):
+                    deadzone = float(slot['deadzone'])
+                    lines.append(f"if -{deadzone!r} < {value} < {deadzone!r}: {value} = 0.0")
+                if slot.get('curve', 1.0) != 1.0:
+                    lines.append(f"{value} = copysign(abs({value}) ** {float(slot['curve'])!r}, {value})")
+                expression = value
+            if slot.get('scale', 1.0) != 1.0:
+                expression = f"{expression} * {float(slot['scale'])!r}"
+            if 'min' in slot or 'max' in slot:
+                # Conditional expressions instead of min()/max() calls, which cost more than the rest of the slot
+                low, high = float(slot.get('min', -math.inf)), float(slot.get('max', math.inf))
+                value = f"v{index}"
+                if 'min' in slot and 'max' in slot:
+                    expression = f"({low!r} if ({value} := {expression}) < {low!r} else {high!r} if {value} > {high!r} else {value})"
+                elif 'min' in slot:
+                    expression = f"({value} if ({value} := {expression}) > {low!r} else {low!r})"
+                else:
+                    expression = f"({value} if ({value} := {expression}) < {high!r} else {high!r})"
+            if self.precision is not None:
+                expression = f"round({expression}, {int(self.precision)})"
+            results.append(expression)
+        lines.append(f"return ({', '.join(results)})")
+        source = f"def transform({', '.join(arguments)}):\n" + "".join(f"    {line}\n" for line in lines)
+        namespace = dict(namespace or {}, copysign=math.copysign)
+        exec(source, namespace)
+        return namespace['transform']
+
+    def _vectorize(self):
+        """Return the per-slot parameters of the profile as NumPy arrays for transform_many."""
+        import numpy as np
+
+        def field(key, default):
+            return np.array([float(slot.get(key, default)) for slot in self.slots], dtype=np.float64)
+
+        buttons = np.array(['button' in slot for slot in self.slots])
+        sign = np.where([slot.get('invert', False) for slot in self.slots], -1.0, 1.0)
+        low = np.where(buttons, 0.0, field('min', -np.inf))
+        high = np.where(buttons, 1.0, field('max', np.inf))
+        return sign, field('offset', 0.0), field('scale', 1.0), field('deadzone', 0.0), field('curve', 1.0), low, high, \
+            buttons
+
+    def transform_many(self, raw):
+        """Apply the profile to an (N, SLOT_COUNT) array of raw readings; returns a new array."""
+        import numpy as np
+        if self._vectors is None:
+            self._vectors = self._vectorize()
+        sign, offset, scale, deadzone, curve, low, high, buttons = self._vectors
+        values = np.asarray(raw, dtype=np.float64) * sign + offset
+        values[np.abs(values) < deadzone] = 0.0
+        values = np.copysign(np.abs(values) ** curve, values) * scale
+        values = np.where(buttons, values != 0.0, values)
+        np.clip(values, low, high, out=values)
+        if self.precision is not None:
+            np.round(values, self.precision, out=values)
+        return values
@@ -0,0 +1,179 @@
+"""Publish several joysticks from one machine, each driving its own car on a shared broker.
+
+Every vehicle's signals live under Fleet.<vehicle ID> (see Common/fleet.py) and the
+changes of all vehicles are sent in one set_current_values call per tick.
+
+    FLEET=car1=g29,car2=ps4 python fleet_kuksa.py
+"""
+import os
+import sys
+import threading
+import time
+import pygame
+from kuksa_client.grpc import Datapoint
+from publish_filter import ChangeFilter
+from input_sampler import InputSampler, init_joystick_input
+from control_frame import ControlFrame, FrameBuffer
+from device_profile import DeviceProfile, load_profile
+
+# Shared modules live in ../Common in the repository and next to this script in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from fleet import CONTROL_SIGNALS, Namespace
+from transport import open_transport
+
+# Comma-separated VEHICLE_ID=DEVICE_PROFILE pairs, one per joystick in the order pygame lists them
+FLEET = os.environ.get('FLEET', 'car1=g29')
+
+# 'change' sends only signals that moved beyond their deadband (plus a periodic full heartbeat), 'all' sends every tick
+PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'change')
+HEARTBEAT_INTERVAL = float(os.environ.get('HEARTBEAT_INTERVAL', 1.0))
+PUBLISH_INTERVAL = float(os.environ.get('PUBLISH_INTERVAL', 0.05))
+
+# 'fixed' samples all joysticks at SAMPLE_RATE Hz, 'event' samples whenever pygame reports input
+SAMPLER_MODE = os.environ.get('SAMPLER_MODE', 'fixed')
+SAMPLE_RATE = float(os.environ.get('SAMPLE_RATE', 100.0))
+
+# Smallest change worth publishing per signal; buttons are sent on every flip
+deadbands = {
+    'Vehicle.OBD.RelativeThrottlePosition': 0.005,
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 0.005,
+    'Vehicle.Chassis.Brake.PedalPosition': 0.005,
+    'Vehicle.Speed': 0.01,
+}
+
+def parse_fleet(fleet):
+    """Parse FLEET into a list of (vehicle ID, device profile name)."""
+    vehicles = []
+    for entry in fleet.split(','):
+        vehicle_id, _, profile = entry.strip().partition('=')
+        vehicles.append((vehicle_id, profile or 'g29'))
+    return vehicles
+
+class Vehicle:
+    """One joystick driving one car of the fleet."""
+
+    def __init__(self, vehicle_id, profile, joystick):
+        self.vehicleId = vehicle_id
+        self.namespace = Namespace(vehicle_id)
+        self.profile = DeviceProfile(load_profile(profile)).bind(joystick)
+        self.buffer = FrameBuffer()
+        self.frame = ControlFrame()
+        self.changeFilter = ChangeFilter(self.namespace.to_broker(deadbands), HEARTBEAT_INTERVAL)
+        # Broker path of every slot and whether it carries a button
+        self.slots = list(zip(self.namespace.paths(CONTROL_SIGNALS),
+                              [datatype == 'boolean' for datatype in CONTROL_SIGNALS.values()]))
+
+    def read(self):
+        self.buffer.write(self.profile.read(), time.time())
+
+    def signals(self):
+        """Return {broker path: value} of the frame last taken from the buffer."""
+        return {path: bool(value) if is_button else value
+                for (path, is_button), value in zip(self.slots, self.frame.values)}
+
+class FleetPublisher:
+    """Publishes the newest frame of every vehicle each `interval` seconds.
+
+    With `batch` the changes of all vehicles go into one set_current_values call per
+    tick, so the broker handles one request per tick however many cars there are.
+    Without it every vehicle is sent in its own call, as separate controller
+    processes would.
+    """
+
+    def __init__(self, client, vehicles, interval, mode='change', batch=True):
+        self.client = client
+        self.vehicles = vehicles
+        self.interval = interval
+        self.mode = mode
+        self.batch = batch
+        self.ticks = 0
+        self.rpcs = 0
+        self.datapoints = 0
+        self.overruns = 0
+
+    def publish_once(self):
+        batch = {}
+        for vehicle in self.vehicles:
+            is_new_frame = vehicle.buffer.read(vehicle.frame)
+            if self.mode == 'change':
+                values = vehicle.changeFilter.changes(vehicle.signals())
+            elif is_new_frame:
+                values = vehicle.signals()
+            else:
+                continue
+            if not values:
+                continue
+            if self.batch:
+                batch.update(values)
+            else:
+                self._send(values)
+        if batch:
+            self._send(batch)
+        self.ticks += 1
+
+    def _send(self, values):
+        self.client.set_current_values({path: Datapoint(value) for path, value in values.items()})
+        self.rpcs += 1
+        self.datapoints += len(values)
+
+    def run(self, stop_event):
+        deadline = time.monotonic()
+        while not stop_event.is_set():
+            self.publish_once()
+            deadline += self.interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.interval:
+                # Ticks take longer than the interval: skip instead of bursting
+                self.overruns += 1
+                deadline = time.monotonic()
+
+def main():
+    kuksaDataBroker_IP = '20.79.188.178'
+    kuksaDataBroker_Port = 55555
+
+    fleet = parse_fleet(FLEET)
+    num_joysticks = init_joystick_input()
+    if num_joysticks < len(fleet):
+        print(f"FLEET lists {len(fleet)} vehicles but only {num_joysticks} joysticks are connected!")
+        pygame.quit()
+        sys.exit(1)
+
+    vehicles = []
+    for index, (vehicle_id, profile) in enumerate(fleet):
+        joystick = pygame.joystick.Joystick(index)
+        joystick.init()
+        vehicles.append(Vehicle(vehicle_id, profile, joystick))
+        print(f"{vehicle_id}: {joystick.get_name()} ({profile})")
+
+    def read_all():
+        pygame.event.pump()  # Update joystick state
+        for vehicle in vehicles:
+            vehicle.read()
+
+    stop_event = threading.Event()
+    sampler = InputSampler(read_all, SAMPLER_MODE, SAMPLE_RATE)
+    threading.Thread(target=sampler.run, daemon=True).start()
+
+    with open_transport(kuksaDataBroker_IP, kuksaDataBroker_Port) as client:
+        publisher = FleetPublisher(client, vehicles, PUBLISH_INTERVAL, PUBLISH_MODE)
+        threading.Thread(target=publisher.run, args=(stop_event,), daemon=True).start()
+        try:
+            last = (time.monotonic(), 0, 0)
+            while sampler.isRunning or not sampler.samples:
+                time.sleep(1)
+                now = time.monotonic()
+                elapsed = now - last[0]
+                stats = sampler.stats()
+                print(f"Fleet of {len(vehicles)} - {(publisher.rpcs - last[1]) / elapsed:.1f} RPCs/s, "
+                      f"{(publisher.datapoints - last[2]) / elapsed:.1f} Datapoints/s, "
+                      f"sampler {stats['rate']:.1f} Hz, {publisher.overruns} publish overruns")
+                last = (now, publisher.rpcs, publisher.datapoints)
+        except KeyboardInterrupt:
+            pass
+        stop_event.set()
+        sampler.stop()
+
+if __name__ == '__main__':
+    main()
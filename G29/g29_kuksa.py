@@ -1,126 +1,247 @@
+import asyncio
 import logging
+import os
+import sys
 import time
 import threading
 import pygame
-from kuksa_client.grpc import VSSClient
 from kuksa_client.grpc import Datapoint
-
-print("\r++++++++++++++++++++++++++++++++++++\r")
-print("Welcome to the G29 Controller\r")
-print("+++++++++++++++++++++++++++++++++++++\r")
-
-# Initialize Pygame for joystick handling
-pygame.init()
-pygame.joystick.init()
-
-# Check for connected joysticks
-num_joysticks = pygame.joystick.get_count()
-if num_joysticks == 0:
-    print("No joystick connected!")
-    pygame.quit()
-    exit()
-
-# Initialize the first joystick (assumed to be the G29)
-joystick = pygame.joystick.Joystick(0)
-joystick.init()
-print(f"Joystick initialized: {joystick.get_name()}")
-
-# Control mappings
-controls = {
-    'steering_wheel': 0,
-    'clutch': 1,
-    'throttle': 2,
-    'brake': 3,
-    'handbrake': 4,
-    'reverse': 5,
-    'enter': 6,
-    'exit': 7
+from publish_filter import SlotChangeFilter
+from input_sampler import InputSampler, open_joystick
+from control_frame import ControlFrame, FrameBuffer, SLOT_NAMES, THROTTLE, STEERING
+from session_log import SessionRecorder
+from device_profile import DeviceProfile, load_calibration, load_profile
+from rate_control import make_rate_control
+
+# Shared modules live in ../Common in the repository and next to this script in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from async_publisher import publish_to_kuksa
+from tracing import LATENCY_TRACE, TRACE_SIGNAL, ClockSync, encode_trace
+from transport import connect
+from fleet import CONTROL_SIGNALS, STATUS_SIGNALS
+from signal_schema import PublishBuffer, SignalSchema
+from startup import start_in_background, startup_profile
+from telemetry import make_telemetry
+from vehicle_status import StatusMonitor, connect_status
+from car_feedback import RumbleFeedback
+
+kuksaDataBroker_IP = '20.79.188.178'
+kuksaDataBroker_Port = 55555
+
+# 'change' sends only signals that moved beyond their deadband (plus a periodic full heartbeat), 'all' sends every tick
+PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'change')
+HEARTBEAT_INTERVAL = float(os.environ.get('HEARTBEAT_INTERVAL', 1.0))
+PUBLISH_INTERVAL = float(os.environ.get('PUBLISH_INTERVAL', 0.5))
+
+# 'thread' publishes with the blocking client, 'async' with the asyncio pipeline in async_publisher.py
+PUBLISHER = os.environ.get('PUBLISHER', 'thread')
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 1))
+
+# Axis mapping and normalization: a profile name from device_profile.py or a JSON profile file
+DEVICE_PROFILE = os.environ.get('DEVICE_PROFILE', 'g29')
+
+# Calibration file written by Test_File_PS4/ps4_test.py: rest offsets and deadzones of the axes and the sample rate
+DEVICE_CALIBRATION = os.environ.get('DEVICE_CALIBRATION', '')
+calibration = load_calibration(DEVICE_CALIBRATION)
+
+# 'fixed' samples the wheel at SAMPLE_RATE Hz, 'event' samples whenever pygame reports wheel input;
+# SAMPLE_RATE defaults to the rate in the calibration, else 100
+SAMPLER_MODE = os.environ.get('SAMPLER_MODE', 'fixed')
+SAMPLE_RATE = float(os.environ.get('SAMPLE_RATE', calibration.get('sample_rate') or 100.0))
+
+# 'adaptive' starts publishing every PUBLISH_INTERVAL and moves the rate between MIN_PUBLISH_RATE (default: the
+# same rate) and MAX_PUBLISH_RATE (default: SAMPLE_RATE) with the measured broker RTT and errors; 'fixed' keeps it
+RATE_CONTROL = os.environ.get('RATE_CONTROL', 'adaptive')
+MIN_PUBLISH_RATE = float(os.environ.get('MIN_PUBLISH_RATE', 1.0 / PUBLISH_INTERVAL))
+MAX_PUBLISH_RATE = float(os.environ.get('MAX_PUBLISH_RATE', SAMPLE_RATE))
+RATE_INCREASE = float(os.environ.get('RATE_INCREASE', 10.0))
+
+# The car's status (applied throttle and steering, loop timing, watchdog) is followed on a connection of its own and
+# shown next to the commanded values; it counts as lost after STATUS_TIMEOUT seconds without an update
+CAR_STATUS = os.environ.get('CAR_STATUS', '1') == '1'
+STATUS_TIMEOUT = float(os.environ.get('STATUS_TIMEOUT', 1.0))
+
+# 'rumble' shakes the wheel while the car's steering lags behind it (full strength at a difference of FEEDBACK_ERROR)
+# and once the car's status stops arriving or its watchdog holds the throttle; 'off' disables it
+FEEDBACK = os.environ.get('FEEDBACK', 'rumble')
+FEEDBACK_ERROR = float(os.environ.get('FEEDBACK_ERROR', 0.5))
+
+# Path of a session log that records every wheel sample for replay_session.py (empty = off)
+RECORD_SESSION = os.environ.get('RECORD_SESSION', '')
+
+# Smallest change worth publishing per signal; buttons are sent on every flip
+deadbands = {
+    'Vehicle.OBD.RelativeThrottlePosition': 0.002,
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 0.005,
+    'Vehicle.Chassis.Brake.PedalPosition': 0.005,
+    'Vehicle.Speed': 0.01,
 }
 
-# Global variables for G29 values
-digitalAuto_Throttle = 0.0
-digitalAuto_Clutch = 0.0
-digitalAuto_Brake = 0.0
-digitalAuto_Steering = 0.0
+# Slot layout of the published signals, in ControlFrame slot order
+schema = SignalSchema(CONTROL_SIGNALS)
+
+# Slot layout of the status the car sends back
+status_schema = SignalSchema(STATUS_SIGNALS)
+
+# Reads and normalizes every control of the wheel in one compiled pass, once bound in init_wheel()
+wheel_profile = DeviceProfile(load_profile(DEVICE_PROFILE, calibration))
+
+# Latest G29 sample, handed from the reader thread to the publisher as one consistent frame
+control_buffer = FrameBuffer()
 
-# Global variables for button states
-digitalAuto_Handbrake = 0  # 1 if pressed, 0 if not pressed
-digitalAuto_Reverse = 0     # 1 if pressed, 0 if not pressed
-digitalAuto_Enter = 0       # 1 if pressed, 0 if not pressed
-digitalAuto_Exit = 0        # 1 if pressed, 0 if not pressed
+# Publish rate, adapted to the broker link by the publisher
+publish_rate = make_rate_control(RATE_CONTROL, PUBLISH_INTERVAL, MAX_PUBLISH_RATE, MIN_PUBLISH_RATE, RATE_INCREASE)
+
+# Records every published frame for the summaries of the telemetry thread (None = off), set up in main
+telemetry = None
 
 # Function to read values from the joystick
 def read_wheel_values():
     pygame.event.pump()  # Update joystick state
     
-    # Read axis values for controls
-    steering_value = joystick.get_axis(controls['steering_wheel'])
-    clutch_value = joystick.get_axis(controls['clutch'])
-    throttle_value = joystick.get_axis(controls['throttle'])
-    brake_value = joystick.get_axis(controls['brake'])
-
-    # Update global variables with raw values (no normalization)
-    global digitalAuto_Steering, digitalAuto_Clutch, digitalAuto_Throttle, digitalAuto_Brake
-    digitalAuto_Steering = steering_value * 5  # Raw value
-    digitalAuto_Clutch = abs(clutch_value - 0.999969482421875) # Raw value
-    digitalAuto_Throttle = abs((throttle_value - 0.999969482421875)*0.2) # Raw value
-    digitalAuto_Brake = abs(brake_value - 0.999969482421875) # Raw value
-
-    # Read button states
-    global digitalAuto_Handbrake, digitalAuto_Reverse, digitalAuto_Enter, digitalAuto_Exit
-    digitalAuto_Handbrake = 1 if joystick.get_button(controls['handbrake']) else 0
-    digitalAuto_Reverse = 1 if joystick.get_button(controls['reverse']) else 0
-    digitalAuto_Enter = 1 if joystick.get_button(controls['enter']) else 0
-    digitalAuto_Exit = 1 if joystick.get_button(controls['exit']) else 0
-
-def thread_ConnectToKuksa():
-    global digitalAuto_Throttle, digitalAuto_Clutch, digitalAuto_Brake, digitalAuto_Steering
-    global digitalAuto_Handbrake, digitalAuto_Reverse, digitalAuto_Enter, digitalAuto_Exit
-
-    kuksaDataBroker_IP = '20.79.188.178'
-    kuksaDataBroker_Port = 55555
-
-    with VSSClient(kuksaDataBroker_IP, kuksaDataBroker_Port) as client:
+    # Axis and button values in slot order, normalized as set in the device profile
+    values = wheel_profile.read()
+    control_buffer.write(values, time.time())
+    if session_recorder is not None:
+        session_recorder.write(values)
+
+def init_wheel():
+    """Open the first joystick (assumed to be the G29) and bind the device profile to it; exits if none is connected."""
+    joystick = open_joystick(0)
+    if joystick is None:
+        print("No joystick connected!")
+        pygame.quit()
+        sys.exit(1)
+    print(f"Joystick initialized: {joystick.get_name()}")
+    wheel_profile.bind(joystick)
+    startup_profile.mark('joystick')
+    return joystick
+
+def frame_to_signals(frame):
+    """Map a ControlFrame to the VSS signals sent to KUKSA."""
+    return schema.to_signals(frame.values)
+
+session_recorder = SessionRecorder(RECORD_SESSION, frame_to_signals(ControlFrame())) if RECORD_SESSION else None
+
+def thread_ConnectToKuksa(connection=None):
+    """Publish the newest frame at the rate set by publish_rate; `connection` is a Future of a client from transport.connect()."""
+    frame = ControlFrame()
+
+    # Estimate the broker clock offset so the car can split latency into per-hop times
+    clock_sync = None
+    if LATENCY_TRACE:
+        clock_sync = ClockSync(kuksaDataBroker_IP, kuksaDataBroker_Port)
+        clock_sync.start()
+
+    if PUBLISHER == 'async':
+        asyncio.run(publish_to_kuksa(kuksaDataBroker_IP, kuksaDataBroker_Port, control_buffer, schema,
+                                     PUBLISH_INTERVAL,
+                                     SlotChangeFilter(schema.deadbands(deadbands), HEARTBEAT_INTERVAL)
+                                     if PUBLISH_MODE == 'change' else None,
+                                     MAX_IN_FLIGHT, clock_sync, publish_rate, telemetry=telemetry))
+        return
+
+    # Requests are built from the frame's slot values into reused Datapoints
+    change_filter = SlotChangeFilter(schema.deadbands(deadbands), HEARTBEAT_INTERVAL)
+    publish_buffer = PublishBuffer(schema)
+
+    if connection is None:
+        connection = start_in_background(connect, kuksaDataBroker_IP, kuksaDataBroker_Port, schema.paths,
+                                         milestone='connected')
+    is_failing = False
+    client = connection.result()
+    try:
         while True:
-            # Send values to KUKSA without normalization
-            client.set_current_values({
-                'Vehicle.OBD.RelativeThrottlePosition': Datapoint(float(digitalAuto_Throttle)),
-                'Vehicle.Powertrain.Transmission.ClutchEngagement': Datapoint(float(digitalAuto_Clutch)),
-                'Vehicle.Chassis.Brake.PedalPosition': Datapoint(float(digitalAuto_Brake)),
-                'Vehicle.Speed': Datapoint(float(digitalAuto_Steering)),
-                'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': Datapoint(bool(digitalAuto_Handbrake)),
-                'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': Datapoint(bool(digitalAuto_Reverse)),
-                'Vehicle.ADAS.CruiseControl.IsActive': Datapoint(bool(digitalAuto_Enter)),
-                'Vehicle.ADAS.CruiseControl.IsEnabled': Datapoint(bool(digitalAuto_Exit)),
-            })
-
-            # Print the values being sent to KUKSA
-            print(f"KUKSA Signal - Throttle: {digitalAuto_Throttle}, Clutch: {digitalAuto_Clutch}, "
-                  f"Brake: {digitalAuto_Brake}, Steering: {digitalAuto_Steering}, "
-                  f"Handbrake: {digitalAuto_Handbrake}, Reverse: {digitalAuto_Reverse}, "
-                  f"Enter: {digitalAuto_Enter}, Exit: {digitalAuto_Exit}")
-            print("\n")  # Adding space for clarity
-
-            time.sleep(0.5)  # Adjust as needed
+            is_new_frame = control_buffer.read(frame)
+            if PUBLISH_MODE == 'change':
+                # A repeated frame produces nothing here except the heartbeat
+                slots = change_filter.changes(frame.values)
+            elif is_new_frame:
+                slots = schema.allSlots
+            else:
+                slots = 0  # Same frame as last tick, nothing new to send
+
+            rtt = 0.0
+            if slots:
+                # Send values to KUKSA without normalization
+                datapoints = publish_buffer.request(frame.values, slots)
+                if clock_sync is not None:
+                    datapoints = {**datapoints, TRACE_SIGNAL: Datapoint(
+                        encode_trace(frame.seq, frame.timestamp, time.time(), clock_sync.offset))}
+                start = time.monotonic()
+                try:
+                    client.set_current_values(datapoints)
+                    ok = True
+                except Exception as e:
+                    ok = False
+                    # Only the first failure is logged; the rate control counts them for the telemetry summaries
+                    if not is_failing:
+                        logging.warning("Publishing to KUKSA failed: %s", e)
+                rtt = time.monotonic() - start
+                publish_rate.record(rtt, ok)
+                if ok and is_failing:
+                    logging.info("Publishing to KUKSA resumed")
+                is_failing = not ok
+                if ok:
+                    startup_profile.complete('first_frame')
+                    # The telemetry thread prints the values being sent to KUKSA
+                    if telemetry is not None:
+                        telemetry.record(frame.values, frame.timestamp)
+
+            # The round trip is part of the interval, so the rate is the one publish_rate asks for
+            time.sleep(max(0.0, publish_rate.interval - rtt))
+    finally:
+        client.__exit__(None, None, None)
 
 if __name__ == '__main__':
+    print("\r++++++++++++++++++++++++++++++++++++\r")
+    print("Welcome to the G29 Controller\r")
+    print("+++++++++++++++++++++++++++++++++++++\r")
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Connect to KUKSA while the wheel starts up (the async publisher connects on its own)
+    connection = None
+    if PUBLISHER != 'async':
+        connection = start_in_background(connect, kuksaDataBroker_IP, kuksaDataBroker_Port, schema.paths,
+                                         milestone='connected')
+    car_status = None
+    if CAR_STATUS:
+        car_status = StatusMonitor(start_in_background(connect_status, kuksaDataBroker_IP, kuksaDataBroker_Port,
+                                                       status_schema.paths), status_schema, STATUS_TIMEOUT).start()
+    joystick = init_wheel()
+
     try:
         # Start reading joystick values
-        reading_thread = threading.Thread(target=lambda: [read_wheel_values() for _ in iter(int, 1)])
+        sampler = InputSampler(read_wheel_values, SAMPLER_MODE, SAMPLE_RATE)
+
+        # Summaries of the published frames, the sampler and the publish rate, written by a background thread
+        telemetry = make_telemetry('KUKSA Signal', SLOT_NAMES)
+        if telemetry is not None:
+            telemetry.add_source('Sampler', sampler.stats)
+            telemetry.add_source('Publish rate', publish_rate.stats)
+
+        if car_status is not None:
+            # Applied against commanded values, and the wheel's rumble motors driven by the difference
+            commanded = ControlFrame()
+
+            def car_stats():
+                control_buffer.read(commanded)
+                return car_status.stats(commanded.values[THROTTLE], commanded.values[STEERING])
+            if telemetry is not None:
+                telemetry.add_source('Car', car_stats)
+            if FEEDBACK == 'rumble':
+                RumbleFeedback(joystick, car_status, control_buffer, FEEDBACK_ERROR).start()
+
+        reading_thread = threading.Thread(target=sampler.run)
         reading_thread.start()
 
         # Start KUKSA client thread
-        kuksa_thread = threading.Thread(target=thread_ConnectToKuksa)
+        kuksa_thread = threading.Thread(target=thread_ConnectToKuksa, args=(connection,))
         kuksa_thread.start()
 
         # Wait threads to finish
-        while True:
-            time.sleep(0.5)  # Add a delay to prevent CPU overload in the main thread
-            print(f"Current Values - Throttle: {digitalAuto_Throttle}, Clutch: {digitalAuto_Clutch}, "
-                  f"Brake: {digitalAuto_Brake}, Steering: {digitalAuto_Steering}, "
-                  f"Handbrake: {digitalAuto_Handbrake}, Reverse: {digitalAuto_Reverse}, "
-                  f"Enter: {digitalAuto_Enter}, Exit: {digitalAuto_Exit}")
-            print("\n")  # Adding space for clarity
+        kuksa_thread.join()
 
     except Exception as e:
         print("Something went wrong, cannot start the process:", e)
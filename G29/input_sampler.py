@@ -0,0 +1,152 @@
+import logging
+import os
+import time
+import pygame
+
+# Events that mean the joystick state changed
+JOYSTICK_EVENTS = (pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP, pygame.JOYHATMOTION)
+
+def init_joystick_input():
+    """Start only the pygame subsystems joystick input needs and return the number of joysticks connected.
+
+    pygame.init() also starts audio, fonts and a real video driver. The event queue
+    needs the video subsystem, which runs on SDL's dummy driver here (no window,
+    no display server) unless SDL_VIDEODRIVER says otherwise.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.joystick.init()
+    return pygame.joystick.get_count()
+
+def open_joystick(index=0):
+    """Return joystick `index`, initialized, or None if it is not connected."""
+    if init_joystick_input() <= index:
+        return None
+    joystick = pygame.joystick.Joystick(index)
+    joystick.init()
+    return joystick
+
+def prioritize(cpu=None, nice=0):
+    """Pin this process to `cpu` and lower its nice value to `nice`, as far as the system permits.
+
+    A negative nice value needs CAP_SYS_NICE (root, or `docker run --cap-add=SYS_NICE`);
+    without it the process keeps running at normal priority after a warning.
+    """
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            logging.warning("Cannot pin the sampler to CPU %s: %s", cpu, e)
+    if nice:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+        except (AttributeError, OSError) as e:
+            logging.warning("Cannot change the sampler's nice value to %s: %s", nice, e)
+
+def sampler_stats(last, now, cpu, samples, overruns):
+    """Return (stats, new last) from the sampler counters now and at `last` (None before the first call)."""
+    if last is None:
+        return {'rate': 0.0, 'cpu': 0.0, 'samples': samples, 'overruns': overruns}, (now, cpu, samples)
+    last_now, last_cpu, last_samples = last
+    elapsed = max(now - last_now, 1e-9)
+    return {
+        'rate': (samples - last_samples) / elapsed,
+        'cpu': 100.0 * (cpu - last_cpu) / elapsed,
+        'samples': samples,
+        'overruns': overruns,
+    }, (now, cpu, samples)
+
+class InputSampler:
+    """Calls `read` to sample the joystick, either at a fixed rate or whenever pygame reports input.
+
+    'fixed' mode schedules every sample against absolute deadlines so the rate does
+    not drift with the cost of `read`. 'event' mode sleeps in pygame.event.wait()
+    and samples once per burst of joystick events. Only counters are kept, so
+    memory stays constant however long the session runs.
+    """
+
+    def __init__(self, read, mode='fixed', rate=100.0):
+        if mode not in ('fixed', 'event'):
+            raise ValueError(f"Unknown sampler mode: {mode}")
+        self.read = read
+        self.mode = mode
+        self.rate = rate
+        self.isRunning = False
+        self.samples = 0
+        self.overruns = 0  # Fixed mode: deadlines missed by more than a whole period
+        self.cpuTime = 0.0  # CPU seconds used by the sampling thread, updated by that thread
+        self._lastStats = None
+
+    def run(self):
+        """Sample until stop() is called or pygame reports QUIT. Call this from the sampling thread."""
+        self.isRunning = True
+        self.cpuTime = time.thread_time()
+        self._lastStats = (time.monotonic(), self.cpuTime, self.samples)
+        if self.mode == 'fixed':
+            self._run_fixed()
+        else:
+            self._run_event()
+        self.isRunning = False
+
+    def stop(self):
+        self.isRunning = False
+
+    def _run_fixed(self):
+        period = 1.0 / self.rate
+        deadline = time.monotonic()
+        while self.isRunning:
+            self.read()
+            self.samples += 1
+            self.cpuTime = time.thread_time()
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                # Too far behind to catch up: skip the missed samples instead of bursting
+                self.overruns += 1
+                deadline = time.monotonic()
+
+    def _run_event(self):
+        while self.isRunning:
+            # The timeout only bounds how long stop() takes to be noticed
+            event = pygame.event.wait(100)
+            events = [event] + pygame.event.get()
+            if any(e.type == pygame.QUIT for e in events):
+                self.isRunning = False
+                break
+            # A burst of events is coalesced into a single sample
+            if any(e.type in JOYSTICK_EVENTS for e in events):
+                self.read()
+                self.samples += 1
+            self.cpuTime = time.thread_time()
+
+    def stats(self):
+        """Return achieved sample rate (Hz) and CPU usage (% of one core) since the previous call."""
+        if self._lastStats is None:
+            # Not running yet
+            return {'rate': 0.0, 'cpu': 0.0, 'samples': self.samples, 'overruns': self.overruns}
+        stats, self._lastStats = sampler_stats(self._lastStats, time.monotonic(), self.cpuTime, self.samples,
+                                               self.overruns)
+        return stats
+
+class RemoteSampler:
+    """The stats() of an InputSampler in another process, from the counters it shares.
+
+    `counters` returns the sampler's (samples, overruns, CPU seconds), such as
+    SharedFrameRing.counters.
+    """
+
+    def __init__(self, counters):
+        self.counters = counters
+        self._lastStats = None
+
+    @property
+    def samples(self):
+        return self.counters()[0]
+
+    def stats(self):
+        samples, overruns, cpu = self.counters()
+        stats, self._lastStats = sampler_stats(self._lastStats, time.monotonic(), cpu, samples, overruns)
+        return stats
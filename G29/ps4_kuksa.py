@@ -1,108 +1,349 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
 import time
 import threading
 import pygame
-from kuksa_client.grpc import VSSClient
 from kuksa_client.grpc import Datapoint
+from publish_filter import SlotChangeFilter
+from input_sampler import InputSampler, RemoteSampler, open_joystick, prioritize
+from control_frame import ControlFrame, FrameBuffer, SharedFrameRing, SLOT_NAMES, THROTTLE, STEERING
+from session_log import SessionRecorder
+from device_profile import DeviceProfile, load_calibration, load_profile
+from rate_control import make_rate_control
+
+# Shared modules live in ../Common in the repository and next to this script in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from async_publisher import publish_to_kuksa
+from tracing import LATENCY_TRACE, TRACE_SIGNAL, ClockSync, encode_trace
+from transport import connect
+from signal_schema import PublishBuffer, SignalSchema
+from startup import start_in_background, startup_profile
+from fleet import STATUS_SIGNALS
+from telemetry import make_telemetry
+from vehicle_status import StatusMonitor, connect_status
+
+kuksaDataBroker_IP = '20.79.188.178'
+kuksaDataBroker_Port = 55555
+
+# 'change' sends only signals that moved beyond their deadband (plus a periodic full heartbeat), 'all' sends every tick
+PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'change')
+HEARTBEAT_INTERVAL = float(os.environ.get('HEARTBEAT_INTERVAL', 1.0))
+PUBLISH_INTERVAL = float(os.environ.get('PUBLISH_INTERVAL', 0.1))
+
+# 'thread' publishes with the blocking client, 'async' with the asyncio pipeline in async_publisher.py
+PUBLISHER = os.environ.get('PUBLISHER', 'thread')
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 1))
+
+# Axis mapping and normalization: a profile name from device_profile.py or a JSON profile file
+DEVICE_PROFILE = os.environ.get('DEVICE_PROFILE', 'ps4')
+
+# Calibration file written by Test_File_PS4/ps4_test.py: rest offsets and deadzones of the axes and the sample rate
+DEVICE_CALIBRATION = os.environ.get('DEVICE_CALIBRATION', '')
+calibration = load_calibration(DEVICE_CALIBRATION)
+
+# 'fixed' samples the controller at SAMPLE_RATE Hz, 'event' samples whenever pygame reports controller input;
+# SAMPLE_RATE defaults to the rate in the calibration, else 100
+SAMPLER_MODE = os.environ.get('SAMPLER_MODE', 'fixed')
+SAMPLE_RATE = float(os.environ.get('SAMPLE_RATE', calibration.get('sample_rate') or 100.0))
+
+# 'thread' samples the controller in a thread next to the publisher, 'process' in a process of its own that hands
+# frames over shared memory (a ring of RING_SIZE frames), so publishing and printing never hold up a sample.
+# The sampler process is pinned to SAMPLER_CPU (empty = any CPU) and asks for the nice value SAMPLER_NICE.
+READER = os.environ.get('READER', 'thread')
+RING_SIZE = int(os.environ.get('RING_SIZE', 64))
+SAMPLER_CPU = os.environ.get('SAMPLER_CPU', '')
+SAMPLER_NICE = int(os.environ.get('SAMPLER_NICE', -10))
+
+# 'adaptive' starts publishing every PUBLISH_INTERVAL and moves the rate between MIN_PUBLISH_RATE (default: the
+# same rate) and MAX_PUBLISH_RATE (default: SAMPLE_RATE) with the measured broker RTT and errors; 'fixed' keeps it
+RATE_CONTROL = os.environ.get('RATE_CONTROL', 'adaptive')
+MIN_PUBLISH_RATE = float(os.environ.get('MIN_PUBLISH_RATE', 1.0 / PUBLISH_INTERVAL))
+MAX_PUBLISH_RATE = float(os.environ.get('MAX_PUBLISH_RATE', SAMPLE_RATE))
+RATE_INCREASE = float(os.environ.get('RATE_INCREASE', 10.0))
+
+# The car's status (applied throttle and steering, loop timing, watchdog) is followed on a connection of its own and
+# shown next to the commanded values; it counts as lost after STATUS_TIMEOUT seconds without an update
+CAR_STATUS = os.environ.get('CAR_STATUS', '1') == '1'
+STATUS_TIMEOUT = float(os.environ.get('STATUS_TIMEOUT', 1.0))
+
+# Path of a session log that records every controller sample for replay_session.py (empty = off)
+RECORD_SESSION = os.environ.get('RECORD_SESSION', '')
+
+# Smallest change worth publishing per signal; buttons are sent on every flip
+deadbands = {
+    'Vehicle.OBD.RelativeThrottlePosition': 0.005,
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 0.005,
+    'Vehicle.ADAS.CruiseControl.SpeedSet': 0.005,
+    'Vehicle.Speed': 0.5,
+}
+
+# Slot layout of the published signals, in ControlFrame slot order (the brake is sent as SpeedSet)
+schema = SignalSchema({
+    'Vehicle.OBD.RelativeThrottlePosition': 'float',
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 'float',
+    'Vehicle.ADAS.CruiseControl.SpeedSet': 'float',
+    'Vehicle.Speed': 'float',
+    'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': 'boolean',
+    'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': 'boolean',
+    'Vehicle.ADAS.CruiseControl.IsActive': 'boolean',
+    'Vehicle.ADAS.CruiseControl.IsEnabled': 'boolean',
+})
+
+# Slot layout of the status the car sends back
+status_schema = SignalSchema(STATUS_SIGNALS)
 
 # Joystick Reader Thread Class
 class JoystickReader(threading.Thread):
-    def __init__(self):
+    def __init__(self, buffer=None):
         super().__init__()
-        self.steering = 0
-        self.gas = 0
-        self.brake = 0
-        self.clutch = 0
-        self.handbrake = 0
-        self.reverse = 0
-        self.enter = 0
-        self.exit = 0
-        self.currentTimestamp = 0
+        # Latest joystick sample, handed to the publisher as one consistent frame
+        self.buffer = buffer if buffer is not None else FrameBuffer()
         self.isRunning = True
-        self.precisionDecimals = 3
-        self.sleepTime = 0
-
-    def pedalValuesNormalize(self, val):
-        return round((val + 1) / 2, self.precisionDecimals)
+        self.joystick = None
+        # Axis mapping and normalization, compiled once and bound to the joystick in run()
+        self.profile = DeviceProfile(load_profile(DEVICE_PROFILE, calibration))
+        self.sampler = InputSampler(self.read_values, SAMPLER_MODE, SAMPLE_RATE)
+        self.recorder = None
+        if RECORD_SESSION:
+            self.recorder = SessionRecorder(RECORD_SESSION, ConnectToKuksa.frame_to_signals(ControlFrame()))
 
-    def steeringValuesNormalize(self, val):
-        return round(val * 420, self.precisionDecimals)
-        
     def run(self):
-        pygame.init()
-        pygame.joystick.init()
-
-        # Initialize joystick (assuming G29 is the first joystick connected)
-        joystick = pygame.joystick.Joystick(0)
-        joystick.init()
-
-        while self.isRunning:
-            self.currentTimestamp = time.time()
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.isRunning = False
-
-            _steering = joystick.get_axis(1)  # Axis 0 for steering wheel
-            _brake = joystick.get_axis(4)     # Axis 1 for brake
-            _clutch = joystick.get_axis(2)    # Axis 2 for clutch
-            _gas = joystick.get_axis(5)       # Axis 5 for throttle/gas
-
-            # Update joystick values
-            self.steering = _steering * -1  # Normalized steering
-            self.steering = self.steeringValuesNormalize(_steering * -1)
-            self.brake = self.pedalValuesNormalize(_brake)
-            self.clutch = self.pedalValuesNormalize(_clutch)
-            self.gas = self.pedalValuesNormalize(_gas)
-
-            # Button values (adjust indices based on button configuration)
-            self.handbrake = 1 if joystick.get_button(3) else 0
-            self.reverse = 1 if joystick.get_button(2) else 0
-            self.enter = 1 if joystick.get_button(1) else 0
-            self.exit = 1 if joystick.get_button(0) else 0
-
-            time.sleep(self.sleepTime)
+        # Initialize joystick (assuming the PS4 controller is the first joystick connected)
+        self.joystick = open_joystick(0)
+        if self.joystick is None:
+            print("No joystick connected!")
+            self.isRunning = False
+            return
+        self.profile.bind(self.joystick)
+        startup_profile.mark('joystick')
+
+        if self.isRunning:
+            self.sampler.run()
+        self.isRunning = False
+
+    def read_values(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.stop()
+
+        # Joystick values in slot order, buttons last (adjust indices in the device profile)
+        values = self.profile.read()
+        self.buffer.write(values, time.time())
+        if self.recorder is not None:
+            self.recorder.write(values)
 
     def stop(self):
         self.isRunning = False
+        self.sampler.stop()
+
+    def close(self):
+        """Nothing to release: the FrameBuffer lives in this process (see JoystickProcess.close())."""
+
+def run_reader_process(ring_name, setup=None):
+    """Sample the controller into the SharedFrameRing `ring_name` until the ring is stopped or the parent exits.
+
+    This is the sampler process of READER=process. `setup`, if given, is called first
+    (the benchmarks install a scripted joystick with it).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent stops us through the ring
+    prioritize(int(SAMPLER_CPU) if SAMPLER_CPU else None, SAMPLER_NICE)
+    if setup is not None:
+        setup()
+    ring = SharedFrameRing(ring_name)
+    reader = JoystickReader(ring)
+    parent = os.getppid()
+    done = threading.Event()
+
+    def watch():
+        while not (done.is_set() or ring.stopped or os.getppid() != parent):
+            sampler = reader.sampler
+            ring.publish_counters(sampler.samples, sampler.overruns, sampler.cpuTime)
+            done.wait(0.1)
+        reader.stop()
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    reader.run()
+    # The watcher uses the ring until it stops, so it is stopped before the ring is closed (pygame QUIT)
+    done.set()
+    watcher.join()
+    ring.close()
+
+class JoystickProcess:
+    """Runs a JoystickReader in a process of its own (READER=process), with the interface of JoystickReader.
+
+    Frames arrive through `buffer`, a SharedFrameRing, and `sampler.stats()` reports
+    the counters the sampler process shares through it.
+    """
+
+    def __init__(self, setup=None):
+        self.buffer = SharedFrameRing(size=RING_SIZE)
+        self.sampler = RemoteSampler(self.buffer.counters)
+        # Spawned, not forked: the parent already runs gRPC threads, which do not survive a fork
+        self.process = multiprocessing.get_context('spawn').Process(
+            target=run_reader_process, args=(self.buffer.name, setup), daemon=True)
+
+    @property
+    def isRunning(self):
+        return self.process.is_alive()
+
+    def start(self):
+        self.process.start()
+
+    def stop(self):
+        self.buffer.stop()
+
+    def join(self):
+        self.process.join()
+
+    def close(self):
+        """Close and unlink the ring; the publisher and the telemetry sources must have stopped reading it."""
+        self.buffer.close(unlink=True)
 
 # KUKSA Client Thread to send data
 class ConnectToKuksa(threading.Thread):
-    def __init__(self, joystick_reader):
+    def __init__(self, joystick_reader, connection=None, telemetry=None):
         super().__init__()
         self.joystick_reader = joystick_reader
+        # Records every published frame for the summaries of the telemetry thread (None = off)
+        self.telemetry = telemetry
+        # Future of a client from transport.connect(), started early so it connects while the joystick starts up
+        self.connection = connection
+        # Publish rate, adapted to the broker link
+        self.rate_control = make_rate_control(RATE_CONTROL, PUBLISH_INTERVAL, MAX_PUBLISH_RATE, MIN_PUBLISH_RATE,
+                                              RATE_INCREASE)
         self.isRunning = True
+        # AsyncPublisher and its event loop with PUBLISHER=async, set once connected
+        self.publisher = None
+        self.loop = None
 
     def run(self):
-        kuksaDataBroker_IP = '20.79.188.178'
-        kuksaDataBroker_Port = 55555
-
-        with VSSClient(kuksaDataBroker_IP, kuksaDataBroker_Port) as client:
-            while self.isRunning and self.joystick_reader.isRunning:
-                # Send joystick values to KUKSA Data Broker
-                client.set_current_values({
-                    'Vehicle.OBD.RelativeThrottlePosition': Datapoint(float(self.joystick_reader.gas)),
-                    'Vehicle.Powertrain.Transmission.ClutchEngagement': Datapoint(float(self.joystick_reader.clutch)),
-                    'Vehicle.ADAS.CruiseControl.SpeedSet': Datapoint(float(self.joystick_reader.brake)),
-                    'Vehicle.Speed': Datapoint(float(self.joystick_reader.steering)),
-                    'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': Datapoint(bool(self.joystick_reader.handbrake)),
-                    'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': Datapoint(bool(self.joystick_reader.reverse)),
-                    'Vehicle.ADAS.CruiseControl.IsActive': Datapoint(bool(self.joystick_reader.enter)),
-                    'Vehicle.ADAS.CruiseControl.IsEnabled': Datapoint(bool(self.joystick_reader.exit)),
-                })
-
-                # Print sent values for debugging
-                print(f"KUKSA Signal - Throttle: {self.joystick_reader.gas}, Clutch: {self.joystick_reader.clutch}, "
-                      f"Brake: {self.joystick_reader.brake}, Steering: {self.joystick_reader.steering}, "
-                      f"Handbrake: {self.joystick_reader.handbrake}, Reverse: {self.joystick_reader.reverse}, "
-                      f"Enter: {self.joystick_reader.enter}, Exit: {self.joystick_reader.exit}")
-                time.sleep(0.1)
+        frame = ControlFrame()
+
+        # Estimate the broker clock offset so the car can split latency into per-hop times
+        clock_sync = None
+        if LATENCY_TRACE:
+            clock_sync = ClockSync(kuksaDataBroker_IP, kuksaDataBroker_Port)
+            clock_sync.start()
+
+        if PUBLISHER == 'async':
+            asyncio.run(publish_to_kuksa(kuksaDataBroker_IP, kuksaDataBroker_Port, self.joystick_reader.buffer,
+                                         schema, PUBLISH_INTERVAL,
+                                         SlotChangeFilter(schema.deadbands(deadbands), HEARTBEAT_INTERVAL)
+                                         if PUBLISH_MODE == 'change' else None,
+                                         MAX_IN_FLIGHT,
+                                         clock_sync,
+                                         self.rate_control,
+                                         self.is_publishing,
+                                         self.publisher_started,
+                                         self.telemetry))
+            return
+
+        # Requests are built from the frame's slot values into reused Datapoints
+        change_filter = SlotChangeFilter(schema.deadbands(deadbands), HEARTBEAT_INTERVAL)
+        publish_buffer = PublishBuffer(schema)
+
+        connection = self.connection
+        if connection is None:
+            connection = start_in_background(connect, kuksaDataBroker_IP, kuksaDataBroker_Port, schema.paths,
+                                             milestone='connected')
+        is_failing = False
+        client = connection.result()
+        try:
+            while self.is_publishing():
+                is_new_frame = self.joystick_reader.buffer.read(frame)
+                if PUBLISH_MODE == 'change':
+                    # A repeated frame produces nothing here except the heartbeat
+                    slots = change_filter.changes(frame.values)
+                elif is_new_frame:
+                    slots = schema.allSlots
+                else:
+                    slots = 0  # Same frame as last tick, nothing new to send
+
+                rtt = 0.0
+                if slots:
+                    # Send joystick values to KUKSA Data Broker
+                    datapoints = publish_buffer.request(frame.values, slots)
+                    if clock_sync is not None:
+                        datapoints = {**datapoints, TRACE_SIGNAL: Datapoint(
+                            encode_trace(frame.seq, frame.timestamp, time.time(), clock_sync.offset))}
+                    start = time.monotonic()
+                    try:
+                        client.set_current_values(datapoints)
+                        ok = True
+                    except Exception as e:
+                        ok = False
+                        # Only the first failure is logged; the rate control counts them for the telemetry summaries
+                        if not is_failing:
+                            logging.warning("Publishing to KUKSA failed: %s", e)
+                    rtt = time.monotonic() - start
+                    self.rate_control.record(rtt, ok)
+                    if ok and is_failing:
+                        logging.info("Publishing to KUKSA resumed")
+                    is_failing = not ok
+                    if ok:
+                        startup_profile.complete('first_frame')
+                        # The telemetry thread prints the sent values
+                        if self.telemetry is not None:
+                            self.telemetry.record(frame.values, frame.timestamp)
+                # The round trip is part of the interval, so the rate is the one rate_control asks for
+                time.sleep(max(0.0, self.rate_control.interval - rtt))
+        finally:
+            client.__exit__(None, None, None)
+
+    @staticmethod
+    def frame_to_signals(frame):
+        return schema.to_signals(frame.values)
+
+    def is_publishing(self):
+        """Publishing goes on until stop() is called or the joystick reader stops."""
+        return self.isRunning and self.joystick_reader.isRunning
+
+    def publisher_started(self, publisher):
+        # Called on the publisher's event loop, which stop() reaches it through
+        self.loop = asyncio.get_running_loop()
+        self.publisher = publisher
 
     def stop(self):
         self.isRunning = False
+        if self.publisher is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.publisher.stop)
+            except RuntimeError:
+                pass  # The event loop already finished
 
 # Main logic to run the threads
 if __name__ == '__main__':
-    joystick_reader = JoystickReader()
-    kuksa_client = ConnectToKuksa(joystick_reader)
+    logging.basicConfig(level=logging.INFO)
+
+    # Connect to KUKSA while the joystick starts up (the async publisher connects on its own)
+    connection = None
+    if PUBLISHER != 'async':
+        connection = start_in_background(connect, kuksaDataBroker_IP, kuksaDataBroker_Port, schema.paths,
+                                         milestone='connected')
+    joystick_reader = JoystickProcess() if READER == 'process' else JoystickReader()
+
+    # Summaries of the published frames, the sampler and the publish rate, written by a background thread
+    telemetry = make_telemetry('KUKSA Signal', SLOT_NAMES)
+    kuksa_client = ConnectToKuksa(joystick_reader, connection, telemetry)
+    if telemetry is not None:
+        telemetry.add_source('Sampler', joystick_reader.sampler.stats)
+        telemetry.add_source('Publish rate', kuksa_client.rate_control.stats)
+
+    if CAR_STATUS:
+        car_status = StatusMonitor(start_in_background(connect_status, kuksaDataBroker_IP, kuksaDataBroker_Port,
+                                                       status_schema.paths), status_schema, STATUS_TIMEOUT).start()
+        if telemetry is not None:
+            # Applied against commanded values
+            commanded = ControlFrame()
+
+            def car_stats():
+                joystick_reader.buffer.read(commanded)
+                return car_status.stats(commanded.values[THROTTLE], commanded.values[STEERING])
+            telemetry.add_source('Car', car_stats)
 
     joystick_reader.start()
     kuksa_client.start()
@@ -113,7 +354,16 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         print("\nKeyboardInterrupt caught. Stopping threads...")
         joystick_reader.stop()
-        joystick_reader.join()
         kuksa_client.stop()
+        # The publisher reads the reader's buffer until it stops, so it is joined first
         kuksa_client.join()
+        joystick_reader.join()
         print("Threads have been stopped.")
+    else:
+        # The reader stopped on its own (no joystick, or pygame quit)
+        kuksa_client.join()
+        joystick_reader.join()
+    if telemetry is not None:
+        # The Sampler and Car sources read the reader's buffer up to the last summary, so the writer is waited for
+        telemetry.stop(timeout=None)
+    joystick_reader.close()
@@ -0,0 +1,82 @@
+import time
+from array import array
+
+class ChangeFilter:
+    """Selects which signals need to be sent to the KUKSA Data Broker.
+
+    A signal is sent when it moved further than its deadband from the last value
+    that was sent (buttons use a deadband of 0, so every flip is sent). Every
+    `heartbeat` seconds the full state is sent so the car can detect liveness.
+    """
+
+    def __init__(self, deadbands, heartbeat=1.0):
+        self.deadbands = deadbands
+        self.heartbeat = heartbeat
+        self._lastSent = {}
+        self._lastHeartbeat = None
+        self.ticks = 0
+        self.published = 0   # Datapoints sent
+        self.suppressed = 0  # Datapoints skipped because they had not changed
+
+    def changes(self, values, now=None):
+        """Return the subset of `values` ({path: value}) that must be published now."""
+        now = time.monotonic() if now is None else now
+        self.ticks += 1
+
+        if self._lastHeartbeat is None or now - self._lastHeartbeat >= self.heartbeat:
+            self._lastHeartbeat = now
+            changed = dict(values)
+        else:
+            changed = {}
+            for path, value in values.items():
+                last = self._lastSent.get(path)
+                if last is None or abs(value - last) > self.deadbands.get(path, 0.0):
+                    changed[path] = value
+
+        self._lastSent.update(changed)
+        self.published += len(changed)
+        self.suppressed += len(values) - len(changed)
+        return changed
+
+class SlotChangeFilter:
+    """ChangeFilter for the slot values of a SignalSchema, such as ControlFrame.values.
+
+    `deadbands` holds one deadband per slot (see SignalSchema.deadbands). changes()
+    returns the slots to publish as a bit mask (bit i for slot i) instead of a dict,
+    so a tick allocates nothing.
+    """
+
+    def __init__(self, deadbands, heartbeat=1.0):
+        self.deadbands = deadbands
+        self.heartbeat = heartbeat
+        self.allSlots = (1 << len(deadbands)) - 1
+        self._lastSent = array('d', bytes(8 * len(deadbands)))
+        self._lastHeartbeat = None
+        self._slots = tuple(enumerate(deadbands))
+        self._counts = [bin(mask).count('1') for mask in range(self.allSlots + 1)]
+        self.ticks = 0
+        self.published = 0
+        self.suppressed = 0
+
+    def changes(self, values, now=None):
+        """Return the bit mask of the slots of `values` that must be published now."""
+        now = time.monotonic() if now is None else now
+        self.ticks += 1
+        last = self._lastSent
+
+        if self._lastHeartbeat is None or now - self._lastHeartbeat >= self.heartbeat:
+            self._lastHeartbeat = now
+            last[:] = values
+            mask = self.allSlots
+        else:
+            mask = 0
+            for slot, deadband in self._slots:
+                value = values[slot]
+                if abs(value - last[slot]) > deadband:
+                    last[slot] = value
+                    mask |= 1 << slot
+
+        count = self._counts[mask]
+        self.published += count
+        self.suppressed += len(self._slots) - count
+        return mask
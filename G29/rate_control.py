@@ -0,0 +1,102 @@
+import time
+
+class RateController:
+    """Adapts the publish rate to the broker link with additive increase, multiplicative decrease (AIMD).
+
+    Every publish reports its round-trip time (RTT) and whether it failed. While the link
+    is healthy the rate grows by `increase` Hz per second up to `max_rate`. Congestion
+    multiplies the rate by `decrease`, down to `min_rate`. It is a failed publish, or
+    both the last and the smoothed RTT well above the lowest RTT seen (requests queueing
+    somewhere on the way); requiring both ignores single spikes but notices a cleared
+    link at once. The rate drops at most once per round trip: publishes that were
+    already on their way when it dropped do not count again. The rate does not grow
+    while a publish takes longer than the interval, since a blocking publisher cannot
+    go faster anyway.
+    """
+
+    # Weight of a new sample in the smoothed RTT and the error rate
+    RTT_GAIN = 0.25
+    ERROR_GAIN = 0.1
+    # The lowest RTT is taken over the last one to two windows, so it follows a changed route
+    BASELINE_WINDOW = 10.0
+
+    def __init__(self, rate, min_rate, max_rate, increase=10.0, decrease=0.5, tolerance=1.0, margin=0.005):
+        self.minRate = min_rate
+        self.maxRate = max(max_rate, min_rate)
+        self.rate = min(max(rate, min_rate), self.maxRate)
+        self.increase = increase
+        self.decrease = decrease
+        # Congestion: RTT above the lowest RTT by more than tolerance * lowest RTT and margin seconds
+        self.tolerance = tolerance
+        self.margin = margin
+        self.rtt = None  # Smoothed RTT in seconds
+        self.minRtt = None
+        self.errorRate = 0.0  # Smoothed share of failed publishes
+        self.sent = 0
+        self.failed = 0
+        self.backoffs = 0
+        self._lastUpdate = None
+        self._backoffAt = -float('inf')
+        self._baseline = None  # (window start, lowest RTT of this window, of the previous window)
+
+    @property
+    def interval(self):
+        """Seconds between publishes at the current rate."""
+        return 1.0 / self.rate
+
+    def record(self, rtt, ok=True, now=None):
+        """Account for a publish that returned `rtt` seconds after it started (at `now` - `rtt`)."""
+        now = time.monotonic() if now is None else now
+        # The rate only grows while publishes actually go out, not over idle time in 'change' mode
+        elapsed = min(now - self._lastUpdate, self.interval) if self._lastUpdate is not None else 0.0
+        self._lastUpdate = now
+        self.sent += 1
+        self.errorRate += self.ERROR_GAIN * ((0.0 if ok else 1.0) - self.errorRate)
+
+        if ok:
+            self.rtt = rtt if self.rtt is None else self.rtt + self.RTT_GAIN * (rtt - self.rtt)
+            self._track_baseline(rtt, now)
+            congested = min(rtt, self.rtt) - self.minRtt > max(self.tolerance * self.minRtt, self.margin)
+        else:
+            self.failed += 1
+            congested = True
+
+        if congested:
+            # Only publishes started after the last backoff tell something about the reduced rate
+            if now - rtt >= self._backoffAt:
+                self.rate = max(self.minRate, self.rate * self.decrease)
+                self._backoffAt = now
+                self.backoffs += 1
+        elif rtt < self.interval:
+            self.rate = min(self.maxRate, self.rate + self.increase * elapsed)
+
+    def _track_baseline(self, rtt, now):
+        if self._baseline is None or now - self._baseline[0] >= self.BASELINE_WINDOW:
+            previous = self._baseline[1] if self._baseline is not None else rtt
+            self._baseline = (now, rtt, previous)
+        elif rtt < self._baseline[1]:
+            self._baseline = (self._baseline[0], rtt, self._baseline[2])
+        self.minRtt = min(self._baseline[1], self._baseline[2])
+
+    def stats(self):
+        """Return the current rate (Hz), smoothed and lowest RTT (ms), error rate (%) and counters."""
+        return {
+            'rate': self.rate,
+            'rtt': (self.rtt or 0.0) * 1000,
+            'minRtt': (self.minRtt or 0.0) * 1000,
+            'errors': self.errorRate * 100,
+            'sent': self.sent,
+            'failed': self.failed,
+            'backoffs': self.backoffs,
+        }
+
+def make_rate_control(mode, interval, max_rate, min_rate, increase=10.0):
+    """Return the RateController for RATE_CONTROL `mode`: 'adaptive' starts at 1 / `interval`, 'fixed' keeps it.
+
+    A fixed rate still measures the RTT and errors, it only never changes the rate.
+    """
+    if mode == 'fixed':
+        return RateController(1.0 / interval, 1.0 / interval, 1.0 / interval)
+    if mode == 'adaptive':
+        return RateController(1.0 / interval, min_rate, max_rate, increase)
+    raise ValueError(f"Unknown rate control: {mode}")
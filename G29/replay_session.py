@@ -0,0 +1,91 @@
+"""Replay a recorded session log into the KUKSA Data Broker.
+
+    python replay_session.py session.jrsl              # real time
+    python replay_session.py session.jrsl --speed 10   # 10x faster
+    python replay_session.py session.jrsl --speed 0    # as fast as possible
+"""
+import argparse
+import os
+import sys
+import time
+from kuksa_client.grpc import Datapoint
+from publish_filter import ChangeFilter
+from session_log import SessionLog
+
+# Shared modules live in ../Common in the repository and next to this script in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from transport import TRANSPORT, open_transport
+
+def replay(log, client, speed=1.0, change_filter=None):
+    """Publish every frame of `log` through `client`, paced by the recorded timestamps divided by `speed`.
+
+    A speed of 0 publishes as fast as possible. Returns replay statistics.
+    """
+    rpcs = datapoints = 0
+    lateness = []
+    first = None
+    started = time.monotonic()
+    for timestamp, frame, values in log:
+        if first is None:
+            first = timestamp
+        if speed:
+            due = started + (timestamp - first) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lateness.append(-delay)
+
+        signals = log.to_signals(values)
+        if change_filter is not None:
+            # Filter on the recorded clock so heartbeats keep their spacing at any speed
+            signals = change_filter.changes(signals, timestamp)
+        if signals:
+            client.set_current_values({path: Datapoint(value) for path, value in signals.items()})
+            rpcs += 1
+            datapoints += len(signals)
+
+    elapsed = time.monotonic() - started
+    lateness.sort()
+    return {
+        'frames': len(log),
+        'recorded_s': log.duration(),
+        'elapsed_s': elapsed,
+        'frame_rate': len(log) / elapsed if elapsed else 0.0,
+        'rpcs': rpcs,
+        'datapoints': datapoints,
+        'late_frames': len(lateness),
+        'late_p99_ms': lateness[int(0.99 * (len(lateness) - 1))] * 1000 if lateness else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log', help='session log written with RECORD_SESSION')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed factor, 0 for as fast as possible')
+    parser.add_argument('--mode', choices=('change', 'all'), default='all',
+                        help="'change' applies the change-based publish filter, 'all' sends every frame")
+    parser.add_argument('--deadband', type=float, default=0.005, help='deadband of every analog signal in change mode')
+    parser.add_argument('--heartbeat', type=float, default=1.0, help='full-state heartbeat in change mode (seconds)')
+    parser.add_argument('--repeat', type=int, default=1, help='number of times to replay the log')
+    parser.add_argument('--ip', default='20.79.188.178', help='KUKSA Data Broker address')
+    parser.add_argument('--port', type=int, default=55555, help='KUKSA Data Broker port')
+    args = parser.parse_args()
+
+    log = SessionLog(args.log)
+    print(f"Replaying {len(log)} frames ({log.duration():.1f} s) of {args.log} at "
+          f"{'maximum speed' if args.speed == 0 else f'{args.speed:g}x'}, {args.mode} mode, {TRANSPORT} transport")
+
+    with open_transport(args.ip, args.port) as client:
+        for _ in range(args.repeat):
+            change_filter = None
+            if args.mode == 'change':
+                deadbands = {name: args.deadband for name, kind in log.signals if kind == 'f'}
+                change_filter = ChangeFilter(deadbands, args.heartbeat)
+            stats = replay(log, client, args.speed, change_filter)
+            print(f"{stats['frames']} frames in {stats['elapsed_s']:.2f} s ({stats['frame_rate']:.0f} frames/s), "
+                  f"{stats['rpcs']} RPCs, {stats['datapoints']} Datapoints, "
+                  f"{stats['late_frames']} frames late (p99 {stats['late_p99_ms']:.1f} ms)")
+    log.close()
+
+if __name__ == '__main__':
+    main()
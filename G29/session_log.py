@@ -0,0 +1,85 @@
+import atexit
+import mmap
+import struct
+import time
+
+MAGIC = b'JRSL'
+VERSION = 1
+# magic, version, header size, record size, slot count, wall-clock start time
+HEADER = struct.Struct('<4sHHHHd')
+
+def record_struct(slot_count):
+    """Fixed-width record: monotonic timestamp, frame number, one double per slot."""
+    return struct.Struct(f'<dI4x{slot_count}d')
+
+class SessionRecorder:
+    """Appends control frames to a compact binary session log.
+
+    The header names the VSS signal and type ('f' float, 'b' bool) of every slot,
+    so a log can be replayed without knowing which controller recorded it.
+    `signals` is a {path: value} dict in slot order, such as frame_to_signals() of
+    an empty frame; bool values mark button slots.
+    """
+
+    def __init__(self, path, signals):
+        self.signals = [(name, 'b' if isinstance(value, bool) else 'f') for name, value in signals.items()]
+        self.record = record_struct(len(self.signals))
+        self.frames = 0
+        description = '\n'.join(f"{kind} {name}" for name, kind in self.signals).encode()
+        header_size = HEADER.size + len(description)
+        header_size += -header_size % 8  # Keep records 8-byte aligned
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, header_size, self.record.size, len(self.signals), time.time()))
+        self._file.write(description.ljust(header_size - HEADER.size, b'\0'))
+        atexit.register(self.close)
+
+    def write(self, values):
+        """Record one frame of slot values, stamped with the monotonic clock."""
+        self.frames += 1
+        self._file.write(self.record.pack(time.monotonic(), self.frames, *values))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+class SessionLog:
+    """Read-only, memory-mapped view of a session log."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size, record_size, slot_count, self.startedAt = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} session log")
+        description = bytes(self._map[HEADER.size:header_size]).rstrip(b'\0').decode()
+        self.signals = [(line[2:], line[0]) for line in description.split('\n')]
+        self.record = record_struct(slot_count)
+        self._offset = header_size
+        # A trailing partial record (recording was killed mid-write) is ignored
+        self._count = (len(self._map) - header_size) // record_size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """Return (monotonic timestamp, frame number, slot values) of record `index`."""
+        if not -self._count <= index < self._count:
+            raise IndexError(index)
+        timestamp, frame, *values = self.record.unpack_from(self._map, self._offset + (index % self._count) * self.record.size)
+        return timestamp, frame, values
+
+    def __iter__(self):
+        end = self._offset + self._count * self.record.size
+        for timestamp, frame, *values in self.record.iter_unpack(memoryview(self._map)[self._offset:end]):
+            yield timestamp, frame, values
+
+    def duration(self):
+        return self[-1][0] - self[0][0] if self._count else 0.0
+
+    def to_signals(self, values):
+        """Map slot values to {VSS path: value} as they were published."""
+        return {name: bool(value) if kind == 'b' else value for (name, kind), value in zip(self.signals, values)}
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,136 @@
+import logging
+import time
+from histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+def slew(current, target, max_step):
+    """Move `current` toward `target` by at most `max_step` (no limit if `max_step` is None)."""
+    if max_step is None:
+        return target
+    return min(max(target, current - max_step), current + max_step)
+
+def slew_up(current, target, max_step):
+    """Like slew(), but only limits moves away from zero: releasing, braking and stopping happen at once.
+
+    A target on the other side of zero goes through zero at once and then away from it.
+    """
+    if max_step is None:
+        return target
+    if current * target < 0:
+        current = 0.0
+    if abs(target) <= abs(current):
+        return target
+    return slew(current, target, max_step)
+
+class ActuatorLoop:
+    """Drives the car at a fixed rate from the newest command, with slew limits and a stale-command watchdog.
+
+    Every period `command()` returns (updates, received_at) of the newest command,
+    `to_command(updates)` turns it into a (throttle, steering) target, and the
+    output moves toward the target by at most `throttle_slew` / `steering_slew`
+    units per second (0 = unlimited). The throttle limit only applies while the
+    throttle grows, so releasing the pedal, braking and the handbrake take effect
+    in the same period. When the newest command is older than
+    `watchdog_timeout` seconds the throttle ramps to zero at `watchdog_ramp` units
+    per second until commands arrive again. Ticks are scheduled against absolute
+    deadlines; the wake-up lateness of each tick and the time spent applying it
+    are kept in histograms, and ticks that started more than a period late are
+    counted as deadline misses.
+    """
+
+    def __init__(self, car, command, to_command, rate=100.0, throttle_slew=0.0, steering_slew=0.0,
+                 watchdog_timeout=1.5, watchdog_ramp=2.0):
+        self.car = car
+        self.command = command
+        self.to_command = to_command
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.throttleStep = throttle_slew / rate if throttle_slew else None
+        self.steeringStep = steering_slew / rate if steering_slew else None
+        self.watchdogTimeout = watchdog_timeout
+        self.watchdogStep = watchdog_ramp / rate if watchdog_ramp else None
+        self.throttle = 0.0
+        self.steering = 0.0
+        self.isStale = False
+        self.ticks = 0
+        self.misses = 0          # Ticks that started more than a whole period late
+        self.watchdogTrips = 0
+        self.jitter = LatencyHistogram(max_seconds=10.0)
+        self.busy = LatencyHistogram(max_seconds=10.0)
+        self._lastReport = None
+
+    def run(self, stop_event, on_tick=None):
+        """Run until `stop_event` is set. `on_tick(updates, is_new)` is called after each tick that had a command."""
+        period = self.period
+        deadline = time.monotonic()
+        last_updates = None
+        self._lastReport = (deadline, self.ticks)
+        while not stop_event.is_set():
+            woke = time.monotonic()
+            lateness = woke - deadline
+            self.jitter.record(lateness)
+            if lateness > period:
+                # Too far behind to catch up: skip the missed ticks instead of bursting. Only counted, as
+                # logging each miss on a slow terminal would delay the next tick and cause more of them
+                self.misses += 1
+                deadline = woke
+
+            updates, received_at = self.command()
+            if updates is not None:
+                self.tick(updates, woke - received_at)
+                if on_tick:
+                    on_tick(updates, updates is not last_updates)
+                last_updates = updates
+            self.ticks += 1
+            self.busy.record(time.monotonic() - woke)
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def tick(self, updates, age):
+        """Apply one control period for a command that was received `age` seconds ago."""
+        throttle, steering = self.to_command(updates)
+        if age > self.watchdogTimeout:
+            if not self.isStale:
+                self.isStale = True
+                self.watchdogTrips += 1
+                logger.warning("No command for %.2f s, ramping throttle to zero", age)
+            self.throttle = slew(self.throttle, 0.0, self.watchdogStep)
+        else:
+            if self.isStale:
+                self.isStale = False
+                logger.info("Commands resumed")
+            self.throttle = slew_up(self.throttle, throttle, self.throttleStep)
+
+        self.steering = slew(self.steering, steering, self.steeringStep)
+        self.car.steering = self.steering
+        self.car.throttle = self.throttle
+
+    def counters(self):
+        """Return the deadline misses, watchdog trips and watchdog state, without resetting anything."""
+        return {'misses': self.misses, 'watchdog_trips': self.watchdogTrips, 'stale': self.isStale}
+
+    def stats(self, reset=True):
+        """Return the achieved rate, jitter and busy-time percentiles since the previous call."""
+        now = time.monotonic()
+        last_now, last_ticks = self._lastReport or (now, self.ticks)
+        self._lastReport = (now, self.ticks)
+        jitter, busy = self.jitter, self.busy
+        if reset:
+            # Swap in empty histograms rather than clearing the ones the loop thread is recording into
+            self.jitter = LatencyHistogram(max_seconds=10.0)
+            self.busy = LatencyHistogram(max_seconds=10.0)
+        jitter, busy = jitter.summary(), busy.summary()
+        return {
+            'rate': (self.ticks - last_ticks) / max(now - last_now, 1e-9),
+            'jitter_p50_ms': jitter['p50_ms'],
+            'jitter_p99_ms': jitter['p99_ms'],
+            'jitter_max_ms': jitter['max_ms'],
+            'busy_p99_ms': busy['p99_ms'],
+            'misses': self.misses,
+            'watchdog_trips': self.watchdogTrips,
+            'stale': self.isStale,
+        }
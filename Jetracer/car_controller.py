@@ -1,112 +1,403 @@
 import os
+import sys
 import time
 import logging
-from jetracer.nvidia_racecar import NvidiaRacecar
-from kuksa_client.grpc import VSSClient
+import threading
+
+# Shared modules live in ../Common in the repository and next to this script in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from tracing import LATENCY_TRACE, TRACE_SIGNAL, ClockSync
+from latency_monitor import LatencyExporter, LatencyMonitor
+from fleet import CONTROL_SIGNALS, STATUS_SIGNALS, VEHICLE_ID, Namespace
+from transport import TRANSPORT, connect
+from actuator_loop import ActuatorLoop
+from jitter_buffer import JitterBuffer
+from signal_schema import SignalSchema
+from startup import start_in_background, startup_profile
+from telemetry import make_telemetry
+from vehicle_status import StatusPublisher, connect_status
+from vehicle_status import APPLIED_THROTTLE, APPLIED_STEERING, LOOP_RATE, LOOP_JITTER, LOOP_BUSY, COMMAND_AGE, WATCHDOG
 
 # Get the KUKSA data broker IP and port from environment variables
 KUKSA_DATA_BROKER_IP = '20.79.188.178'  # Replace with your KUKSA server IP
 KUKSA_DATA_BROKER_PORT = 55555  # Default port for KUKSA
 
+# 'fixed' drives the car every 1 / ACTUATOR_RATE seconds from the newest streamed command,
+# 'subscribe' applies updates as soon as the broker streams them, 'poll' queries every POLL_INTERVAL
+CONTROL_MODE = os.environ.get('CONTROL_MODE', 'fixed')
+POLL_INTERVAL = 0.1
+
+# Fixed-rate actuator loop: slew limits in units per second (0 = off), and the age after which a
+# command counts as stale and the throttle ramps to zero (keep it above the controller's HEARTBEAT_INTERVAL)
+ACTUATOR_RATE = float(os.environ.get('ACTUATOR_RATE', 100.0))
+THROTTLE_SLEW = float(os.environ.get('THROTTLE_SLEW', 2.0))
+STEERING_SLEW = float(os.environ.get('STEERING_SLEW', 10.0))
+WATCHDOG_TIMEOUT = float(os.environ.get('WATCHDOG_TIMEOUT', 1.5))
+WATCHDOG_RAMP = float(os.environ.get('WATCHDOG_RAMP', 2.0))
+ACTUATOR_REPORT_INTERVAL = float(os.environ.get('ACTUATOR_REPORT_INTERVAL', 10.0))
+
+# Jitter buffer of the fixed-rate loop: 'off' applies the newest command, 'buffer' plays commands out
+# behind an adaptive delay, 'predict' also extrapolates late commands up to PREDICT_HORIZON seconds
+JITTER_BUFFER = os.environ.get('JITTER_BUFFER', 'off')
+JITTER_MAX_DEPTH = float(os.environ.get('JITTER_MAX_DEPTH', 0.2))
+JITTER_MARGIN = float(os.environ.get('JITTER_MARGIN', 4.0))
+PREDICT_HORIZON = float(os.environ.get('PREDICT_HORIZON', 0.05))
+
+# With LATENCY_TRACE=1, per-hop latency percentiles are appended to LATENCY_LOG and served on METRICS_PORT (0 = off)
+LATENCY_LOG = os.environ.get('LATENCY_LOG', 'latency.jsonl')
+LATENCY_EXPORT_INTERVAL = float(os.environ.get('LATENCY_EXPORT_INTERVAL', 10.0))
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+
+# The applied throttle and steering, loop timing and watchdog state are sent back to the controller STATUS_RATE
+# times per second, in one request on a connection of their own (0 = off)
+STATUS_RATE = float(os.environ.get('STATUS_RATE', 10.0))
+
+# With VEHICLE_ID set, this car only reads the signals under Fleet.<VEHICLE_ID> on the broker
+namespace = Namespace(VEHICLE_ID)
+
+# Slot layout of the signals published by the controller scripts, decoded straight into slot arrays
+schema = SignalSchema(CONTROL_SIGNALS, namespace)
+SIGNALS = list(schema.paths)
+TRACE_PATH = namespace.path(TRACE_SIGNAL)
+THROTTLE, CLUTCH, BRAKE, STEERING, HANDBRAKE, REVERSE, ENTER, EXIT = range(schema.size)
+
+# Slot layout of the status sent back to the controller
+status_schema = SignalSchema(STATUS_SIGNALS, namespace)
+
+# Fields of a telemetry frame: the signal values in slot order, then what was applied to the car
+TELEMETRY_FIELDS = ('Throttle', 'Clutch', 'Brake', 'Steering', 'Handbrake', 'Reverse', 'Enter', 'Exit',
+                    'Car throttle', 'Car steering')
+
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# NvidiaRacecar, opened by main() while the broker connection is set up
+car = None
+
+def open_racecar():
+    """Import and initialize the NvidiaRacecar.
 
-# Initialize NvidiaRacecar
-car = NvidiaRacecar()
+    Both are slow on the Jetson (servo driver and I2C setup), so main() runs this in the background.
+    """
+    from jetracer.nvidia_racecar import NvidiaRacecar
+    return NvidiaRacecar()
 
 def clamp(value, min_value, max_value):
     return max(min(value, max_value), min_value)
 
-def map_kuksa_to_racecar(updates):
-    """Map the KUKSA signal values to the NvidiaRacecar control."""
-    # Extract the KUKSA signal values
-    throttle = updates['Vehicle.OBD.RelativeThrottlePosition'].value
-    clutch = updates['Vehicle.Powertrain.Transmission.ClutchEngagement'].value
-    brake = updates['Vehicle.Chassis.Brake.PedalPosition'].value
-    steering = updates['Vehicle.Speed'].value
-    handbrake = updates['Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear'].value
-    reverse = updates['Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear'].value
-    enter = updates['Vehicle.ADAS.CruiseControl.IsActive'].value
-    exit = updates['Vehicle.ADAS.CruiseControl.IsEnabled'].value
-    throttle = clamp(throttle, -1.0, 1.0)
+def command_from_values(values):
+    """Return the (throttle, steering) that the signal values, in schema slot order, ask for."""
+    throttle = clamp(values[THROTTLE], -1.0, 1.0)
+    brake = values[BRAKE]
+    steering = values[STEERING]
+    handbrake = values[HANDBRAKE]
+    reverse = values[REVERSE]
 
     # Ensure vehicle doesn't move at startup (initialize to safe values)
     if throttle == -1.0 and steering == 0.0 and reverse == 0:
-        logger.info("Vehicle initialized with safe values.")
-        car.throttle = 0.0  # Neutral throttle to prevent movement
-        car.steering = 0.0  # Neutral steering
-        car.reverse = 0      # Ensure reverse is not active
-        return
-    # Map steering
-    car.steering = steering   # Adjust gain if necessary
-    car.throttle = throttle
+        return 0.0, 0.0
+
     # Map throttle (forward/reverse)
     if reverse == 1:
-        car.throttle = -throttle  # Negative throttle for reverse
-    else:
-        car.throttle = throttle   # Positive throttle for normal
+        throttle = -throttle  # Negative throttle for reverse
 
     # Apply brake logic: simulate braking by reducing throttle
     if brake > 0:
-        car.throttle = max(0, car.throttle - brake)  # Reduce throttle as brake is applied
+        throttle = max(0, throttle - brake)  # Reduce throttle as brake is applied
 
     # Handbrake: Set throttle to 0 if handbrake is active
     if handbrake == 1:
-        car.throttle = 0
+        throttle = 0
+    return throttle, steering
+
+def map_kuksa_to_racecar(values):
+    """Map the KUKSA signal values to the NvidiaRacecar control."""
+    throttle, steering = command_from_values(values)
+    car.steering = steering
+    car.throttle = throttle
+    startup_profile.complete('first_command')
+
+def record_frame(telemetry, values):
+    """Record the signal values and the car's throttle and steering for the telemetry thread to print."""
+    telemetry.record((*values, car.throttle, car.steering))
+
+class StatusSampler:
+    """Fills the status slot array for a StatusPublisher from what the control loop leaves behind.
+
+    It only reads attributes the loop writes (and the histograms of an ActuatorLoop),
+    so the loop never waits for it. `latest` (a LatestValues) gives the command age,
+    `loop` the rate, timing and watchdog state of the fixed-rate loop.
+    """
+
+    def __init__(self, latest=None, loop=None):
+        self.latest = latest
+        self.loop = loop
+        self._last = None  # (time, loop ticks) of the previous sample
+
+    def __call__(self, values):
+        now = time.monotonic()
+        values[APPLIED_THROTTLE] = car.throttle
+        values[APPLIED_STEERING] = car.steering
+        received_at = self.latest.receivedAt if self.latest is not None else None
+        values[COMMAND_AGE] = now - received_at if received_at is not None else 0.0
+        loop = self.loop
+        if loop is None:
+            return
+        if self._last is not None and now > self._last[0]:
+            values[LOOP_RATE] = (loop.ticks - self._last[1]) / (now - self._last[0])
+        self._last = (now, loop.ticks)
+        # Over the current report window of the loop (ACTUATOR_REPORT_INTERVAL)
+        values[LOOP_JITTER] = loop.jitter.percentile(0.99) * 1000
+        values[LOOP_BUSY] = loop.busy.percentile(0.99) * 1000
+        values[WATCHDOG] = loop.isStale
+
+class LatestValues:
+    """Merges subscription updates so that only the newest value of each signal is kept.
+
+    The signals of the schema are decoded into a slot array, others (such as the
+    latency trace) are kept as their newest Datapoint in `others`.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._values = schema.values()
+        self._known = 0     # Bit mask of the slots received at least once
+        self._pending = 0   # Bit mask of the slots updated since the last snapshot
+        self._snapshot = None
+        self.others = {}
+        self.receivedAt = None  # Monotonic time of the newest update
+        self.isClosed = False
+        self.received = 0   # Datapoints received from the stream
+        self.merged = 0     # Datapoints overwritten before they were applied
+
+    def update(self, updates):
+        with self._lock:
+            mask = self.schema.decode(updates, self._values, self.others)
+            self.received += self.schema.slotCounts[mask]
+            self.merged += self.schema.slotCounts[mask & self._pending]
+            self._known |= mask
+            self._pending |= mask
+            self._snapshot = None
+            self.receivedAt = time.monotonic()
+        self._changed.set()
+
+    def close(self):
+        self.isClosed = True
+        self._changed.set()
+
+    def _take(self):
+        """Return a snapshot of the slot array, or None until every signal has been received once."""
+        self._pending = 0
+        if self._known != self.schema.allSlots:
+            return None
+        if self._snapshot is None:
+            self._snapshot = self._values[:]
+        return self._snapshot
+
+    def wait(self, timeout=None):
+        """Block until new values arrive and return a snapshot of the slot array, or None once the stream has ended.
 
-    # Log the current state for debugging
-    logging.info(f"Throttle: {car.throttle}, Steering: {car.steering}, Handbrake: {handbrake}, Rever$
+        Returns an empty tuple if nothing new arrived within `timeout`, or not every signal has been received yet.
+        """
+        self._changed.wait(timeout)
+        with self._lock:
+            self._changed.clear()
+            if not self._pending:
+                return None if self.isClosed else ()
+            return self._take() or ()
+
+    def current(self):
+        """Return (values, received_at) without waiting; the same array is returned until new updates arrive.
+
+        values is None until every signal has been received at least once.
+        """
+        with self._lock:
+            return self._take(), self.receivedAt
+
+def sent_time(updates):
+    """Return the newest transport timestamp of `updates` in seconds, or the current time if none is stamped."""
+    stamps = [datapoint.timestamp for datapoint in updates.values()
+              if datapoint is not None and datapoint.timestamp is not None]
+    return max(stamps).timestamp() if stamps else time.time()
+
+def start_subscription(client, paths, latest, stop_event, on_updates=None):
+    """Feed the broker's update stream for `paths` into `latest` from a background thread.
+
+    `on_updates(updates)` is called with every batch before `latest` sees it.
+    """
+    def consume_stream():
+        try:
+            for updates in client.subscribe_current_values(paths):
+                if on_updates:
+                    on_updates(updates)
+                latest.update(updates)
+                if stop_event.is_set():
+                    break
+        except Exception as e:
+            logger.error("Subscription stream failed: %s", e)
+        finally:
+            latest.close()
+
+    threading.Thread(target=consume_stream, daemon=True).start()
+
+def poll_loop(client, stop_event=None, telemetry=None, monitor=None, status=None):
+    """Query all signals every POLL_INTERVAL and apply them."""
+    stop_event = stop_event or threading.Event()
+    paths = SIGNALS + [TRACE_PATH] if monitor else SIGNALS
+    values = schema.values()
+    others = {}
+    if status is not None:
+        status.start(StatusSampler())
+    while not stop_event.is_set():
+        # Get the current values for the subscribed signals
+        schema.decode(client.get_current_values(paths), values, others)
+
+        # Map the KUKSA signals to the racecar control
+        map_kuksa_to_racecar(values)
+        if monitor:
+            monitor.record(others.get(TRACE_PATH), time.time())
+
+        if telemetry is not None:
+            record_frame(telemetry, values)
+
+        time.sleep(POLL_INTERVAL)  # Adjust the delay for a smooth control loop
+
+def subscription_loop(client, stop_event=None, telemetry=None, monitor=None, status=None):
+    """Apply signal updates as soon as the broker streams them, skipping values superseded in a burst."""
+    stop_event = stop_event or threading.Event()
+    latest = LatestValues(schema)
+    start_subscription(client, SIGNALS + [TRACE_PATH] if monitor else SIGNALS, latest, stop_event)
+    if status is not None:
+        status.start(StatusSampler(latest))
+
+    while not stop_event.is_set():
+        values = latest.wait(timeout=0.5)
+        if values is None:
+            break
+        # Nothing new, or not every signal has been received at least once
+        if not values:
+            continue
+
+        map_kuksa_to_racecar(values)
+        if monitor:
+            monitor.record(latest.others.get(TRACE_PATH), time.time())
+
+        if telemetry is not None:
+            record_frame(telemetry, values)
+    return latest
+
+def fixed_rate_loop(client, stop_event=None, telemetry=None, monitor=None, status=None):
+    """Drive the car at ACTUATOR_RATE from the newest streamed command, with slew limits and the watchdog.
+
+    With JITTER_BUFFER on, every command goes through a JitterBuffer and each
+    period applies its playout instead of the newest command. Returns once the
+    subscription stream ends, like subscription_loop().
+    """
+    stop_event = stop_event or threading.Event()
+    latest = LatestValues(schema)
+    to_command = command_from_values
+    on_updates = None
+    jitter_buffer = None
+    if JITTER_BUFFER != 'off':
+        jitter_buffer = JitterBuffer(JITTER_BUFFER == 'predict', PREDICT_HORIZON, JITTER_MARGIN, max_depth=JITTER_MAX_DEPTH)
+        received = schema.values()
+        known = 0
+
+        def on_updates(updates):
+            nonlocal known
+            known |= schema.decode(updates, received)
+            if known == schema.allSlots:
+                jitter_buffer.push(sent_time(updates), time.time(), command_from_values(received))
+
+        def to_command(values):
+            return jitter_buffer.playout(time.time())
+
+    start_subscription(client, SIGNALS + [TRACE_PATH] if monitor else SIGNALS, latest, stop_event, on_updates)
+
+    def on_tick(values, is_new):
+        startup_profile.complete('first_command')
+        # Every period, so the summaries show the slew limits and the watchdog at work
+        if telemetry is not None:
+            record_frame(telemetry, values)
+        if is_new and monitor:
+            monitor.record(latest.others.get(TRACE_PATH), time.time())
+
+    def command():
+        if latest.isClosed:
+            # The stream has ended: stop after this tick so main() returns and the container restarts
+            stop_event.set()
+        return latest.current()
+
+    # The loop only drives the car once every signal has been received at least once
+    loop = ActuatorLoop(car, command, to_command, ACTUATOR_RATE, THROTTLE_SLEW, STEERING_SLEW,
+                        WATCHDOG_TIMEOUT, WATCHDOG_RAMP)
+    if status is not None:
+        status.start(StatusSampler(latest, loop))
+    if telemetry is not None:
+        telemetry.add_source('Actuator', loop.counters)
+
+    def report():
+        while not stop_event.wait(ACTUATOR_REPORT_INTERVAL):
+            stats = loop.stats()
+            logger.info("Actuator loop: %.1f Hz, jitter p50 %.2f ms, p99 %.2f ms, max %.2f ms, busy p99 %.2f ms, "
+                        "%d deadline misses, %d watchdog trips%s", stats['rate'], stats['jitter_p50_ms'],
+                        stats['jitter_p99_ms'], stats['jitter_max_ms'], stats['busy_p99_ms'], stats['misses'],
+                        stats['watchdog_trips'], " (stale)" if stats['stale'] else "")
+            if jitter_buffer:
+                stats = jitter_buffer.stats()
+                logger.info("Jitter buffer: depth %.1f ms, added latency p50 %.1f ms, p99 %.1f ms, %d late, "
+                            "%d reordered, %d predicted, RMS error throttle %.3f, steering %.3f",
+                            stats['depth_ms'], stats['added_p50_ms'], stats['added_p99_ms'], stats['late'],
+                            stats['reordered'], stats['predicted'], *(stats['error_rms'] or [0.0, 0.0]))
+
+    threading.Thread(target=report, daemon=True).start()
+    loop.run(stop_event, on_tick)
+    return loop
 
 def main():
-    with VSSClient(KUKSA_DATA_BROKER_IP, KUKSA_DATA_BROKER_PORT) as client:
-        # Subscribe to the signals published by the G29 controller script
-        client.subscribe_current_values([
-            'Vehicle.OBD.RelativeThrottlePosition',
-            'Vehicle.Powertrain.Transmission.ClutchEngagement',
-            'Vehicle.Chassis.Brake.PedalPosition',
-            'Vehicle.Speed',
-            'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear',
-            'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear',
-            'Vehicle.ADAS.CruiseControl.IsActive',
-            'Vehicle.ADAS.CruiseControl.IsEnabled',
-        ])
-
-        print("Subscribed to KUKSA signals...")
-
-        while True:
-            # Get the current values for the subscribed signals
-            updates = client.get_current_values([
-                'Vehicle.OBD.RelativeThrottlePosition',
-                'Vehicle.Powertrain.Transmission.ClutchEngagement',
-                'Vehicle.Chassis.Brake.PedalPosition',
-                'Vehicle.Speed',
-                'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear',
-                'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear',
-                'Vehicle.ADAS.CruiseControl.IsActive',
-                'Vehicle.ADAS.CruiseControl.IsEnabled',
-                
-            ])
-
-            # Map the KUKSA signals to the racecar control
-            map_kuksa_to_racecar(updates)
-
-            # Print the current values
-            print("Current Values:")
-            print(f"Throttle: {updates['Vehicle.OBD.RelativeThrottlePosition'].value}")
-            print(f"Clutch: {updates['Vehicle.Powertrain.Transmission.ClutchEngagement'].value}")
-            print(f"Brake: {updates['Vehicle.Chassis.Brake.PedalPosition'].value}")
-            print(f"Steering: {updates['Vehicle.Speed'].value}")
-            print(f"Handbrake Active: {updates['Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear'$
-            print(f"Reverse Active: {updates['Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear'].v$
-            print(f"Enter Active: {updates['Vehicle.ADAS.CruiseControl.IsActive'].value}")
-            print(f"Exit Active: {updates['Vehicle.ADAS.CruiseControl.IsEnabled'].value}")
-            print("----------------------------")
-
-            time.sleep(0.1)  # Adjust the delay for a smooth control loop
+    global car
+    # The racecar starts up while the broker connection is set up
+    racecar = start_in_background(open_racecar, milestone='racecar')
 
-if __name__ == '__main__':
-    main()
+    monitor = None
+    if LATENCY_TRACE:
+        clock_sync = ClockSync(KUKSA_DATA_BROKER_IP, KUKSA_DATA_BROKER_PORT)
+        clock_sync.start()
+        monitor = LatencyMonitor(clock_sync)
+        LatencyExporter(monitor, LATENCY_EXPORT_INTERVAL, LATENCY_LOG, METRICS_PORT).start()
 
+    # Summaries of the applied frames, written by a background thread so the loops never wait on the terminal
+    telemetry = make_telemetry('Current Values', TELEMETRY_FIELDS)
 
+    # The status connection is opened in the background too, and is not needed before the loop runs
+    status = None
+    if STATUS_RATE > 0:
+        status = StatusPublisher(start_in_background(connect_status, KUKSA_DATA_BROKER_IP, KUKSA_DATA_BROKER_PORT,
+                                                     status_schema.paths), status_schema, STATUS_RATE)
+        if telemetry is not None:
+            telemetry.add_source('Status', status.stats)
 
+    client = connect(KUKSA_DATA_BROKER_IP, KUKSA_DATA_BROKER_PORT, SIGNALS, receive=True)
+    startup_profile.mark('connected')
+    try:
+        car = racecar.result()
+        print(f"Subscribed to {TRANSPORT} signals{f' of vehicle {VEHICLE_ID}' if VEHICLE_ID else ''} ({CONTROL_MODE} mode)...")
 
+        if CONTROL_MODE == 'poll':
+            poll_loop(client, telemetry=telemetry, monitor=monitor, status=status)
+        elif CONTROL_MODE == 'subscribe':
+            subscription_loop(client, telemetry=telemetry, monitor=monitor, status=status)
+        else:
+            fixed_rate_loop(client, telemetry=telemetry, monitor=monitor, status=status)
+    finally:
+        client.__exit__(None, None, None)
+        if status is not None:
+            status.stop()
+        if telemetry is not None:
+            telemetry.stop()
+
+if __name__ == '__main__':
+    main()
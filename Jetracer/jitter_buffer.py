@@ -0,0 +1,143 @@
+from collections import deque
+from histogram import LatencyHistogram
+
+def clamp(value, min_value, max_value):
+    return max(min(value, max_value), min_value)
+
+class JitterBuffer:
+    """Plays commands out at a steady delay behind the controller, so network jitter does not reach the wheels.
+
+    Every command is pushed with the time it was sent (the timestamp of the
+    transport) and the time it arrived. The fastest delay within the last `window`
+    commands is the base delay, and how much later than that a command arrives is
+    its jitter. Like adaptive audio playout, the buffer keeps moving averages of
+    the jitter and of its deviation and plays the commands out
+    depth = jitter + `margin` x deviation behind the base delay, limited to
+    [`min_depth`, `max_depth`]. Clock offsets between sender and car cancel out,
+    as only delay differences are used.
+
+    Without `predict` the output is interpolated between the two commands around
+    the playout point, so the depth also includes the interval between commands
+    (measured while they come at most `max_depth` apart): the next command has to
+    be there before the output can move toward it. With `predict` the output
+    continues the trend of the last two commands for up to `horizon` seconds past
+    the newest one instead, which saves that interval of latency, and falls back
+    to the newest command after that. A trend is only continued if those two
+    commands are at most `horizon` apart, since a controller publishing changes
+    only goes quiet while the input stands still. Extrapolated commands are not
+    limited to any range, as they keep the scale of the controller profile
+    (steering is not within +-1).
+    """
+
+    def __init__(self, predict=False, horizon=0.05, margin=4.0, min_depth=0.0, max_depth=0.2, window=200, gain=0.05):
+        self.predict = predict
+        self.horizon = horizon
+        self.margin = margin
+        self.minDepth = min_depth
+        self.maxDepth = max_depth
+        self.gain = gain
+        self.samples = deque()  # (sent, command) in the order sent
+        self.delays = deque(maxlen=window)
+        self.baseDelay = None
+        self.jitter = 0.0      # Moving average of the delay above the base delay
+        self.deviation = 0.0   # Moving average of its deviation
+        self.interval = 0.0    # Moving average of the time between commands
+        self.depth = min_depth
+        self.pushed = 0
+        self.late = 0          # Commands that arrived after their playout time
+        self.reordered = 0     # Commands not newer than one already pushed, dropped
+        self.predicted = 0     # Playouts that continued the trend past the newest command
+        self.addedLatency = LatencyHistogram(max_seconds=10.0)
+        self._resetError()
+
+    def _resetError(self):
+        self.errorCount = 0
+        self.errorSquares = None
+        self.errorMax = None
+
+    def push(self, sent, arrived, command):
+        """Add a command (a tuple of floats) sent at `sent` that arrived at `arrived`."""
+        samples = self.samples
+        if samples and sent <= samples[-1][0]:
+            self.reordered += 1
+            return
+        delay = arrived - sent
+        self.delays.append(delay)
+        self.baseDelay = base = min(self.delays)
+        excess = delay - base
+        self.jitter += self.gain * (excess - self.jitter)
+        self.deviation += self.gain * (abs(excess - self.jitter) - self.deviation)
+        depth = self.jitter + self.margin * self.deviation
+        if not self.predict:
+            if samples and sent - samples[-1][0] <= self.maxDepth:
+                self.interval += self.gain * (sent - samples[-1][0] - self.interval)
+            depth += self.interval
+        self.depth = clamp(depth, self.minDepth, self.maxDepth)
+
+        # Time this command waits in the buffer before it is played out; negative if it came too late
+        waited = sent + base + self.depth - arrived
+        if waited < 0:
+            self.late += 1
+        self.addedLatency.record(waited)
+        samples.append((sent, command))
+        self.pushed += 1
+
+    def playout(self, now):
+        """Return the command to apply at `now` (on the clock of the arrival times), or None before the first push."""
+        samples = self.samples
+        if not samples:
+            return None
+        target = now - self.baseDelay - self.depth
+        # Keep the two commands around the playout point, or the newest two once it has passed them
+        while len(samples) > 2 and samples[1][0] <= target:
+            samples.popleft()
+
+        sent0, command0 = samples[0]
+        if len(samples) == 1 or target <= sent0:
+            command = command0
+        else:
+            sent1, command1 = samples[1]
+            if target <= sent1:
+                fraction = (target - sent0) / (sent1 - sent0)
+                command = tuple(a + (b - a) * fraction for a, b in zip(command0, command1))
+            elif self.predict and target - sent1 <= self.horizon and sent1 - sent0 <= self.horizon:
+                self.predicted += 1
+                fraction = (target - sent1) / (sent1 - sent0)
+                command = tuple(b + (b - a) * fraction for a, b in zip(command0, command1))
+            else:
+                command = command1
+
+        # Smoothing error: how far the output is from the newest command received
+        newest = samples[-1][1]
+        if self.errorSquares is None:
+            self.errorSquares = [0.0] * len(newest)
+            self.errorMax = [0.0] * len(newest)
+        for i, (out, raw) in enumerate(zip(command, newest)):
+            error = abs(out - raw)
+            self.errorSquares[i] += error * error
+            if error > self.errorMax[i]:
+                self.errorMax[i] = error
+        self.errorCount += 1
+        return command
+
+    def stats(self, reset=True):
+        """Return the current depth and the added latency and smoothing error since the previous call."""
+        added = self.addedLatency
+        count, squares, maxima = self.errorCount, self.errorSquares or [], self.errorMax or []
+        if reset:
+            self.addedLatency = LatencyHistogram(max_seconds=10.0)
+            self._resetError()
+        added = added.summary()
+        return {
+            'depth_ms': self.depth * 1000,
+            'base_delay_ms': (self.baseDelay or 0.0) * 1000,
+            'jitter_ms': self.jitter * 1000,
+            'added_p50_ms': added['p50_ms'],
+            'added_p99_ms': added['p99_ms'],
+            'pushed': self.pushed,
+            'late': self.late,
+            'reordered': self.reordered,
+            'predicted': self.predicted,
+            'error_rms': [(s / count) ** 0.5 if count else 0.0 for s in squares],
+            'error_max': list(maxima),
+        }
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from histogram import LatencyHistogram
+from tracing import decode_trace
+
+# Hops of a control frame, measured on the broker clock
+HOPS = ('capture_to_publish', 'publish_to_broker', 'broker_to_apply', 'capture_to_apply')
+
+class LatencyMonitor:
+    """Splits the input-to-actuator latency of traced frames into per-hop histograms.
+
+    The controller sends capture and publish times on its own clock together with
+    its estimated offset to the broker clock, the broker stamps the trace on
+    arrival, and `clock_sync` gives the offset of this host to the broker clock.
+    """
+
+    def __init__(self, clock_sync):
+        self.clock_sync = clock_sync
+        self.histograms = {hop: LatencyHistogram() for hop in HOPS}
+        self.controllerOffset = 0.0
+        self.lastSeq = None
+        self._lock = threading.Lock()
+
+    def record(self, datapoint, applied_at):
+        """Record the TRACE_SIGNAL datapoint of a frame that was applied to the car at `applied_at`."""
+        if datapoint is None or datapoint.timestamp is None:
+            return
+        trace = decode_trace(datapoint.value)
+        # Unchanged traces belong to a frame that was already recorded
+        if trace is None or trace.seq == self.lastSeq:
+            return
+        self.lastSeq = trace.seq
+        self.controllerOffset = trace.clockOffset
+
+        captured_at = trace.capturedAt + trace.clockOffset
+        published_at = trace.publishedAt + trace.clockOffset
+        broker_at = datapoint.timestamp.timestamp()
+        applied_at += self.clock_sync.offset
+        with self._lock:
+            self.histograms['capture_to_publish'].record(published_at - captured_at)
+            self.histograms['publish_to_broker'].record(broker_at - published_at)
+            self.histograms['broker_to_apply'].record(applied_at - broker_at)
+            self.histograms['capture_to_apply'].record(applied_at - captured_at)
+
+    def snapshot(self, reset=False):
+        """Return the clock offsets and per-hop percentiles, optionally starting a new interval."""
+        rtt = self.clock_sync.rtt
+        with self._lock:
+            snapshot = {
+                'time': time.time(),
+                'car_clock_offset_ms': self.clock_sync.offset * 1000,
+                'car_probe_rtt_ms': rtt * 1000 if rtt is not None else None,
+                'controller_clock_offset_ms': self.controllerOffset * 1000,
+                'hops': {hop: histogram.summary() for hop, histogram in self.histograms.items()},
+            }
+            if reset:
+                for histogram in self.histograms.values():
+                    histogram.reset()
+        return snapshot
+
+    def prometheus(self):
+        """Render the current snapshot in the Prometheus text format."""
+        snapshot = self.snapshot()
+        lines = [
+            f"jetracer_car_clock_offset_ms {snapshot['car_clock_offset_ms']}",
+            f"jetracer_controller_clock_offset_ms {snapshot['controller_clock_offset_ms']}",
+        ]
+        for hop, summary in snapshot['hops'].items():
+            lines.append(f'jetracer_latency_count{{hop="{hop}"}} {summary["count"]}')
+            for quantile in ('p50', 'p90', 'p99', 'p999', 'max'):
+                lines.append(f'jetracer_latency_ms{{hop="{hop}",quantile="{quantile}"}} {summary[quantile + "_ms"]}')
+        return "\n".join(lines) + "\n"
+
+class LatencyExporter(threading.Thread):
+    """Appends a snapshot to a JSON-lines file every `interval` seconds and optionally serves /metrics over HTTP."""
+
+    def __init__(self, monitor, interval=10.0, path=None, port=0):
+        super().__init__(daemon=True)
+        self.monitor = monitor
+        self.interval = interval
+        self.path = path
+        self.port = port
+
+    def run(self):
+        if self.port:
+            self._serve_metrics()
+        while True:
+            time.sleep(self.interval)
+            if self.path:
+                # Each line covers one interval, so percentiles are not diluted by old samples
+                snapshot = self.monitor.snapshot(reset=True)
+                with open(self.path, 'a') as log:
+                    log.write(json.dumps(snapshot) + "\n")
+
+    def _serve_metrics(self):
+        monitor = self.monitor
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = monitor.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', self.port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
@@ -1,42 +1,46 @@
 import logging
+import os
+import sys
 import time
 import pygame
 from kuksa_client.grpc import VSSClient
 from kuksa_client.grpc import Datapoint
 
+# Reuse the publisher helpers from the G29 folder and the shared modules from Common
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', 'G29'), os.path.join(HERE, '..', 'Common')]
+from publish_filter import ChangeFilter
+from device_profile import DeviceProfile, load_profile
+from input_sampler import open_joystick
+from rate_control import make_rate_control
+from control_frame import SLOT_NAMES
+from telemetry import make_telemetry
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 
-print("\r++++++++++++++++++++++++++++++++++++\r")
-print("Welcome to the PS4 Controller Interface\r")
-print("+++++++++++++++++++++++++++++++++++++\r")
-
-# Initialize Pygame for joystick handling
-pygame.init()
-pygame.joystick.init()
-
-# Check for connected joysticks
-num_joysticks = pygame.joystick.get_count()
-if num_joysticks == 0:
-    print("No joystick connected!")
-    pygame.quit()
-    exit()
-
-# Initialize the first joystick (assumed to be the PS4 controller)
-joystick = pygame.joystick.Joystick(0)
-joystick.init()
-print(f"Joystick initialized: {joystick.get_name()}")
-
-# Control mappings for PS4 controller (adjust based on your configuration)
-controls = {
-    'steering_wheel': 1,  # Left stick X-axis
-    'clutch': 2,          # L2 (Example mapping)
-    'throttle': 5,        # R2 (Example mapping)
-    'brake': 4,           # Right stick Y-axis
-    'handbrake': 3,       # L1 Button
-    'reverse': 2,         # Circle Button
-    'enter': 1,           # Cross Button
-    'exit': 0             # Triangle Button
+# Control mappings for PS4 controller: raw axis values by default (adjust in G29/device_profile.py)
+DEVICE_PROFILE = os.environ.get('DEVICE_PROFILE', 'ps4_raw')
+ps4_profile = DeviceProfile(load_profile(DEVICE_PROFILE))
+
+# 'change' sends only signals that moved beyond their deadband (plus a periodic full heartbeat), 'all' sends every tick
+PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'change')
+HEARTBEAT_INTERVAL = float(os.environ.get('HEARTBEAT_INTERVAL', 1.0))
+PUBLISH_INTERVAL = float(os.environ.get('PUBLISH_INTERVAL', 0.1))
+
+# 'adaptive' starts publishing every PUBLISH_INTERVAL and moves the rate between MIN_PUBLISH_RATE (default: the
+# same rate) and MAX_PUBLISH_RATE with the measured broker RTT and errors; 'fixed' keeps it
+RATE_CONTROL = os.environ.get('RATE_CONTROL', 'adaptive')
+MIN_PUBLISH_RATE = float(os.environ.get('MIN_PUBLISH_RATE', 1.0 / PUBLISH_INTERVAL))
+MAX_PUBLISH_RATE = float(os.environ.get('MAX_PUBLISH_RATE', 100.0))
+RATE_INCREASE = float(os.environ.get('RATE_INCREASE', 10.0))
+
+# Smallest change worth publishing per signal (raw axis values); buttons are sent on every flip
+deadbands = {
+    'Vehicle.OBD.RelativeThrottlePosition': 0.01,
+    'Vehicle.Powertrain.Transmission.ClutchEngagement': 0.01,
+    'Vehicle.Chassis.Brake.PedalPosition': 0.01,
+    'Vehicle.Chassis.SteeringWheel.Angle': 0.01,
 }
 
 # Global variables for PS4 controller values
@@ -56,46 +60,82 @@ def read_wheel_values():
     pygame.event.pump()  # Update joystick state
     
     global digitalAuto_Steering, digitalAuto_Clutch, digitalAuto_Throttle, digitalAuto_Brake
-    digitalAuto_Steering = joystick.get_axis(controls['steering_wheel'])  # Raw value
-    digitalAuto_Clutch = joystick.get_axis(controls['clutch'])  # Raw value
-    digitalAuto_Throttle = joystick.get_axis(controls['throttle'])  # Raw value
-    digitalAuto_Brake = joystick.get_axis(controls['brake'])  # Raw value
-
     global digitalAuto_Handbrake, digitalAuto_Reverse, digitalAuto_Enter, digitalAuto_Exit
-    digitalAuto_Handbrake = 1 if joystick.get_button(controls['handbrake']) else 0
-    digitalAuto_Reverse = 1 if joystick.get_button(controls['reverse']) else 0
-    digitalAuto_Enter = 1 if joystick.get_button(controls['enter']) else 0
-    digitalAuto_Exit = 1 if joystick.get_button(controls['exit']) else 0
+    # Axes and buttons (1 if pressed, 0 if not) in slot order, read in one compiled pass
+    (digitalAuto_Throttle, digitalAuto_Clutch, digitalAuto_Brake, digitalAuto_Steering,
+     digitalAuto_Handbrake, digitalAuto_Reverse, digitalAuto_Enter, digitalAuto_Exit) = ps4_profile.read()
+
+def init_controller():
+    """Open the first joystick (assumed to be the PS4 controller) and bind the profile to it; exits if none is connected."""
+    joystick = open_joystick(0)
+    if joystick is None:
+        print("No joystick connected!")
+        pygame.quit()
+        sys.exit(1)
+    print(f"Joystick initialized: {joystick.get_name()}")
+    ps4_profile.bind(joystick)
 
 def main():
+    print("\r++++++++++++++++++++++++++++++++++++\r")
+    print("Welcome to the PS4 Controller Interface\r")
+    print("+++++++++++++++++++++++++++++++++++++\r")
+    init_controller()
+
     kuksaDataBroker_IP = '20.79.188.178'
     kuksaDataBroker_Port = 55555
 
+    change_filter = ChangeFilter(deadbands, HEARTBEAT_INTERVAL)
+    publish_rate = make_rate_control(RATE_CONTROL, PUBLISH_INTERVAL, MAX_PUBLISH_RATE, MIN_PUBLISH_RATE, RATE_INCREASE)
+
+    # Summaries of the sent values and the publish rate, written by a background thread
+    telemetry = make_telemetry('KUKSA Signal', SLOT_NAMES)
+    if telemetry is not None:
+        telemetry.add_source('Publish rate', publish_rate.stats)
+
+    is_failing = False
     with VSSClient(kuksaDataBroker_IP, kuksaDataBroker_Port) as client:
         while True:
             # Read PS4 controller values
             read_wheel_values()
 
-            # Send values to KUKSA Data Broker
-            client.set_current_values({
-                'Vehicle.OBD.RelativeThrottlePosition': Datapoint(float(digitalAuto_Throttle)),
-                'Vehicle.Powertrain.Transmission.ClutchEngagement': Datapoint(float(digitalAuto_Clutch)),
-                'Vehicle.Chassis.Brake.PedalPosition': Datapoint(float(digitalAuto_Brake)),
-                'Vehicle.Chassis.SteeringWheel.Angle': Datapoint(float(digitalAuto_Steering)),
-                'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': Datapoint(bool(digitalAuto_Handbrake)),
-                'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': Datapoint(bool(digitalAuto_Reverse)),
-                'Vehicle.ADAS.CruiseControl.IsActive': Datapoint(bool(digitalAuto_Enter)),
-                'Vehicle.ADAS.CruiseControl.IsEnabled': Datapoint(bool(digitalAuto_Exit)),
-            })
-
-            # Log the values being sent to KUKSA
-            logging.info(f"KUKSA Signal - Throttle: {digitalAuto_Throttle}, Clutch: {digitalAuto_Clutch}, "
-                         f"Brake: {digitalAuto_Brake}, Steering: {digitalAuto_Steering}, "
-                         f"Handbrake: {digitalAuto_Handbrake}, Reverse: {digitalAuto_Reverse}, "
-                         f"Enter: {digitalAuto_Enter}, Exit: {digitalAuto_Exit}")
-
-            # Sleep to control the frequency of sending data
-            time.sleep(0.1)  # Adjust this value as necessary
+            values = {
+                'Vehicle.OBD.RelativeThrottlePosition': float(digitalAuto_Throttle),
+                'Vehicle.Powertrain.Transmission.ClutchEngagement': float(digitalAuto_Clutch),
+                'Vehicle.Chassis.Brake.PedalPosition': float(digitalAuto_Brake),
+                'Vehicle.Chassis.SteeringWheel.Angle': float(digitalAuto_Steering),
+                'Vehicle.Chassis.Axle.Row1.Wheel.Right.Brake.PadWear': bool(digitalAuto_Handbrake),
+                'Vehicle.Chassis.Axle.Row2.Wheel.Left.Brake.PadWear': bool(digitalAuto_Reverse),
+                'Vehicle.ADAS.CruiseControl.IsActive': bool(digitalAuto_Enter),
+                'Vehicle.ADAS.CruiseControl.IsEnabled': bool(digitalAuto_Exit),
+            }
+            if PUBLISH_MODE == 'change':
+                values = change_filter.changes(values)
+
+            rtt = 0.0
+            if values:
+                # Send values to KUKSA Data Broker
+                start = time.monotonic()
+                try:
+                    client.set_current_values({path: Datapoint(value) for path, value in values.items()})
+                    ok = True
+                except Exception as e:
+                    ok = False
+                    # Only the first failure is logged; the rate control counts them for the telemetry summaries
+                    if not is_failing:
+                        logging.warning("Publishing to KUKSA failed: %s", e)
+                rtt = time.monotonic() - start
+                publish_rate.record(rtt, ok)
+                if ok and is_failing:
+                    logging.info("Publishing to KUKSA resumed")
+                is_failing = not ok
+
+                # The telemetry thread prints the values being sent to KUKSA
+                if ok and telemetry is not None:
+                    telemetry.record((digitalAuto_Throttle, digitalAuto_Clutch, digitalAuto_Brake, digitalAuto_Steering,
+                                      digitalAuto_Handbrake, digitalAuto_Reverse, digitalAuto_Enter, digitalAuto_Exit))
+
+            # Sleep to control the frequency of sending data; the round trip counts towards the interval
+            time.sleep(max(0.0, publish_rate.interval - rtt))
 
 if __name__ == '__main__':
     try:
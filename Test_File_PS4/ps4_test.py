@@ -1,39 +1,249 @@
+"""Profile and calibrate a joystick: update rate, read latency and noise of every control.
+
+Every axis, button and hat is read in a tight loop, first with the controls at
+rest and then while you move them. The report shows:
+
+- the loop rate reached and what one pump and read of every control costs
+- per axis, the reading at rest, its noise (standard deviation and peak
+  deviation) and the deadzone that hides it, and the range seen while moving
+- the device's update rate, from the intervals between changed readings
+- for each candidate SAMPLE_RATE, the latency from a reading changing to the
+  sampler reading it, the share of updates overwritten before they were read,
+  and the CPU the reads cost
+
+pygame does not expose when the device sent a report, so latencies count from
+the moment a change became readable, as seen by the tight loop. With --output the
+results go to a calibration file that g29_kuksa.py and ps4_kuksa.py load with
+DEVICE_CALIBRATION: rest offsets and deadzones for the device profile and the
+recommended SAMPLE_RATE, the lowest candidate at or above the update rate.
+
+    python ps4_test.py --rest 3 --move 5 --output calibration.json
+    python ps4_test.py --watch    # print every control twice a second to find axis and button numbers
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
 import pygame
 
-# Initialize Pygame for joystick handling
-pygame.init()
-pygame.joystick.init()
+# Reuse the joystick setup from the G29 folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'G29'))
+from input_sampler import open_joystick
+
+# Sample rates the report compares, in Hz
+CANDIDATE_RATES = (50, 100, 125, 200, 250, 500, 1000)
+# Reads whose cost is kept for the percentiles
+MAX_COSTS = 200000
+
+class RunningStats:
+    """Mean, standard deviation and range of a stream of readings (Welford)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._squares = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._squares += delta * (value - self.mean)
+        if value < self.low:
+            self.low = value
+        if value > self.high:
+            self.high = value
+
+    @property
+    def std(self):
+        return math.sqrt(self._squares / self.count) if self.count else 0.0
+
+    @property
+    def peak(self):
+        """Largest deviation from the mean."""
+        return max(self.high - self.mean, self.mean - self.low) if self.count else 0.0
+
+def sample_controls(joystick, duration, axis_stats):
+    """Read every control as fast as possible for `duration` seconds.
+
+    Each axis reading goes into its RunningStats in `axis_stats`. Returns the number
+    of reads, the seconds each read took and the time of every read that differed
+    from the one before.
+    """
+    get_axis, get_button, get_hat = joystick.get_axis, joystick.get_button, joystick.get_hat
+    axes, buttons, hats = range(joystick.get_numaxes()), range(joystick.get_numbuttons()), range(joystick.get_numhats())
+    reads = 0
+    costs = []
+    changes = []
+    last = None
+    end = time.perf_counter() + duration
+    while True:
+        start = time.perf_counter()
+        if start >= end:
+            break
+        pygame.event.get()  # Pumps the device state and keeps the event queue empty
+        axis_values = tuple(map(get_axis, axes))
+        state = (axis_values, tuple(map(get_button, buttons)), tuple(map(get_hat, hats)))
+        done = time.perf_counter()
+        if state != last:
+            changes.append(done)
+            last = state
+        for stats, value in zip(axis_stats, axis_values):
+            stats.add(value)
+        if reads < MAX_COSTS:
+            costs.append(done - start)
+        reads += 1
+    return reads, costs, changes
+
+def update_interval(change_times):
+    """Estimate the device's report interval from the times its readings changed, or None with too few changes.
+
+    A report only shows up as a change if some reading moved, so intervals are
+    multiples of the report interval; the typical one among the shortest is taken.
+    """
+    intervals = sorted(b - a for a, b in zip(change_times, change_times[1:]))
+    if len(intervals) < 10:
+        return None
+    floor = intervals[len(intervals) // 10]
+    shortest = [interval for interval in intervals if interval <= 1.5 * floor]
+    return shortest[len(shortest) // 2]
+
+def read_latency(change_times, rate, read_cost):
+    """Replay the changes against a sampler at `rate`; return (mean s, p99 s, share of updates overwritten).
 
-# Check for connected joysticks
-num_joysticks = pygame.joystick.get_count()
-if num_joysticks == 0:
-    print("No joystick connected!")
-    pygame.quit()
-    exit()
+    The sampler reads at every multiple of its period after the first change, so a
+    change waits for the next read, plus the cost of the read itself.
+    """
+    period = 1.0 / rate
+    start = change_times[0]
+    latencies = []
+    overwritten = 0
+    last_tick = None
+    pending = None
+    for changed_at in change_times:
+        tick = math.ceil((changed_at - start) / period)
+        if tick == last_tick:
+            overwritten += 1  # The previous change was replaced before the sampler read it
+        elif pending is not None:
+            latencies.append(pending)
+        pending = start + tick * period - changed_at + read_cost
+        last_tick = tick
+    latencies.append(pending)
+    latencies.sort()
+    return (sum(latencies) / len(latencies), latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+            overwritten / len(change_times))
 
-# Initialize the first joystick (assumed to be the PS4 controller)
-joystick = pygame.joystick.Joystick(0)
-joystick.init()
-print(f"Joystick initialized: {joystick.get_name()}")
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
 
-def print_controller_mappings():
+def profile_device(joystick, rest, move, deadzone_margin):
+    """Measure the device at rest and while moving; print the report and return the calibration."""
+    num_axes = joystick.get_numaxes()
+    print(f"Profiling {joystick.get_name()}: {num_axes} axes, {joystick.get_numbuttons()} buttons, "
+          f"{joystick.get_numhats()} hats")
+
+    print(f"Leave every control at rest for {rest:g} s...")
+    time.sleep(1.0)
+    rest_stats = [RunningStats() for _ in range(num_axes)]
+    rest_reads, rest_costs, rest_changes = sample_controls(joystick, rest, rest_stats)
+
+    print(f"Now move every axis through its full range, press buttons, for {move:g} s...")
+    move_stats = [RunningStats() for _ in range(num_axes)]
+    move_reads, move_costs, move_changes = sample_controls(joystick, move, move_stats)
+
+    costs = rest_costs + move_costs
+    read_cost = percentile(costs, 0.5)
+    print(f"\nLoop: {(rest_reads + move_reads) / (rest + move):.0f} reads/s, read cost p50 {read_cost * 1e6:.1f} µs, "
+          f"p99 {percentile(costs, 0.99) * 1e6:.1f} µs")
+
+    axes = {}
+    print(f"{'axis':>4}{'rest':>22}{'noise std':>12}{'noise peak':>12}{'deadzone':>10}{'moved min':>11}{'moved max':>11}")
+    for axis, (at_rest, moving) in enumerate(zip(rest_stats, move_stats)):
+        # Round up so the deadzone always covers the noise seen
+        deadzone = math.ceil(at_rest.peak * deadzone_margin * 10000) / 10000
+        axes[str(axis)] = {'rest': at_rest.mean, 'noise': at_rest.std, 'peak': at_rest.peak, 'deadzone': deadzone}
+        print(f"{axis:>4}{at_rest.mean:>22.15g}{at_rest.std:>12.6f}{at_rest.peak:>12.6f}{deadzone:>10.4f}"
+              f"{moving.low:>11.4f}{moving.high:>11.4f}")
+
+    # Changes at rest are noise, which also arrives with every report
+    interval = update_interval(move_changes) or update_interval(rest_changes)
+    update_rate = 1.0 / interval if interval else None
+    if update_rate is None:
+        print("\nToo few changes to measure the update rate; move the controls during the second phase")
+        sample_rate = None
+    else:
+        print(f"\nDevice updates: {len(rest_changes) + len(move_changes)} changes, "
+              f"update interval {interval * 1000:.2f} ms ({update_rate:.0f} Hz)")
+        if interval < 2 * read_cost:
+            print("The loop is not much faster than the device; the update rate may be underestimated")
+        sample_rate = next((rate for rate in CANDIDATE_RATES if rate >= update_rate * 0.95), CANDIDATE_RATES[-1])
+
+    if len(move_changes) > 1:
+        print(f"{'SAMPLE_RATE':>11}{'mean ms':>9}{'p99 ms':>9}{'overwritten':>13}{'CPU %':>7}")
+        for rate in CANDIDATE_RATES:
+            mean, p99, overwritten = read_latency(move_changes, rate, read_cost)
+            marker = "  <- recommended" if rate == sample_rate else ""
+            print(f"{rate:>11}{mean * 1000:>9.2f}{p99 * 1000:>9.2f}{overwritten * 100:>12.1f}%"
+                  f"{read_cost * rate * 100:>7.2f}{marker}")
+
+    return {
+        'device': joystick.get_name(),
+        'axes': axes,
+        'update_rate': update_rate,
+        'sample_rate': sample_rate,
+        'read_cost_ms': read_cost * 1000,
+    }
+
+def print_controller_mappings(joystick, interval):
     """Print the state of all buttons and axes for the PS4 controller."""
     while True:
         pygame.event.pump()  # Update the state of the joystick
-        
+
         # Print all axes
         for i in range(joystick.get_numaxes()):
             print(f"Axis {i}: {joystick.get_axis(i)}")
-        
+
         # Print all buttons
         for i in range(joystick.get_numbuttons()):
             print(f"Button {i}: {joystick.get_button(i)}")
-        
+
         # Print all hats (D-pad)
         for i in range(joystick.get_numhats()):
             print(f"Hat {i}: {joystick.get_hat(i)}")
-        
-        pygame.time.wait(500)  # Wait 500ms before the next reading
+
+        pygame.time.wait(int(interval * 1000))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--joystick', type=int, default=0, help='index of the joystick to profile')
+    parser.add_argument('--rest', type=float, default=3.0, help='seconds with every control at rest')
+    parser.add_argument('--move', type=float, default=5.0, help='seconds of moving the controls')
+    parser.add_argument('--deadzone-margin', type=float, default=1.5, help='deadzone as a multiple of the noise peak')
+    parser.add_argument('--output', help='calibration file to write, loaded with DEVICE_CALIBRATION')
+    parser.add_argument('--watch', action='store_true', help='only print every control every --interval seconds')
+    parser.add_argument('--interval', type=float, default=0.5)
+    args = parser.parse_args()
+
+    joystick = open_joystick(args.joystick)
+    if joystick is None:
+        print("No joystick connected!")
+        pygame.quit()
+        sys.exit(1)
+    print(f"Joystick initialized: {joystick.get_name()}")
+
+    if args.watch:
+        print_controller_mappings(joystick, args.interval)
+        return
+
+    calibration = profile_device(joystick, args.rest, args.move, args.deadzone_margin)
+    if args.output:
+        with open(args.output, 'w') as calibration_file:
+            json.dump(calibration, calibration_file, indent=2)
+        print(f"\nCalibration written to {args.output}; start the publisher with DEVICE_CALIBRATION={args.output}")
 
 if __name__ == '__main__':
-    print_controller_mappings()
+    main()